@@ -0,0 +1,393 @@
+"""
+Fast Path Router - Answers simple, unambiguous queries without an LLM round trip
+
+Handles three intents:
+- list_brands: "list brands", "which brands do you have?"
+- search: "Samsung phones under 20k", "Android phones around 15k"
+- details: "details of iPhone 15", "Pixel 8a specs"
+
+Queries are parsed with the same conventions the system prompt gives the
+agent ("30k" -> 30000, "around 15k" -> 14000-16000, "Android" -> exclude_apple).
+Anything the parser does not fully understand falls through to the agent.
+
+The same parser, in a lenient mode, builds the degraded answer served when
+the LLM is unavailable (see fallback()).
+"""
+import logging
+import re
+from typing import Dict, Any, List, Optional
+
+from llama_index.core.agent.workflow import FunctionAgent
+
+from app.services.mobile_data_service import get_mobile_data_service
+from app.utils.chat_utils import normalize_query
+from app.utils.metrics import cache_requests_total
+from app.utils.serialization import to_serializable
+
+logger = logging.getLogger(__name__)
+
+# Words that carry no filter meaning in a simple search query
+_FILLER_WORDS = {
+    "show", "me", "list", "all", "the", "find", "get", "give", "some", "any", "please",
+    "phone", "phones", "mobile", "mobiles", "smartphone", "smartphones", "handset", "handsets",
+    "device", "devices", "model", "models", "option", "options", "available",
+    "i", "want", "need", "looking", "for", "a", "an", "with", "of", "by", "from", "in",
+    "price", "priced", "range", "budget", "what", "which", "are", "is", "there", "do", "you", "have",
+}
+
+# Words that point back at earlier turns, which only the agent can resolve
+_REFERENCE_WORDS = {"it", "this", "that", "these", "those", "one", "ones", "them", "above", "previous", "same"}
+
+_AMOUNT = r"(\d+(?:\.\d+)?)\s*(k|thousand|lakhs?|l)?\b"
+_MAX_PRICE = r"(?:under|below|less than|within|up to|upto|max|maximum|not more than|cheaper than)"
+_MIN_PRICE = r"(?:above|over|more than|starting from|starting at|min|minimum|at least)"
+_AROUND_PRICE = r"(?:around|about|approx|approximately|near|roughly|close to)"
+
+_BRAND_LIST_PATTERN = re.compile(
+    r"^(?:(?:list|show|show me|give me|get|what are)(?: all)?(?: the)?(?: available)?"
+    r"(?: phone| mobile)? brands(?: available| you have| do you have)?"
+    r"|(?:which|what) brands(?: do you have| are available| are there)?"
+    r"|(?:all |available )?brands)$"
+)
+
+_DETAILS_PATTERNS = [
+    re.compile(
+        r"^(?:tell me (?:more )?about|details (?:of|for|about|on)|detail of|specs (?:of|for)"
+        r"|specifications (?:of|for)|what are the (?:specs|specifications|details) of"
+        r"|show (?:me )?(?:the )?(?:details|specs|specifications) (?:of|for))"
+        r"\s+(?:the\s+)?(?P<model>.+)$"
+    ),
+    re.compile(r"^(?P<model>.+?)\s+(?:full specs|specs|specifications|details)$"),
+]
+
+# Prefix of degraded answers, so users know the reply did not come from the assistant
+_FALLBACK_NOTICE = (
+    "_Our shopping assistant is busy right now, so here are matching phones "
+    "straight from our database._\n\n"
+)
+
+
+def _parse_amount(number: str, unit: Optional[str]) -> Optional[int]:
+    """Convert an amount like ("30", "k") to rupees. Bare small numbers are ambiguous."""
+    value = float(number)
+    if unit in ("k", "thousand"):
+        value *= 1000
+    elif unit in ("lakh", "lakhs", "l"):
+        value *= 100000
+    elif value < 1000:
+        return None
+    return int(value)
+
+
+def _tokens(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", text)
+
+
+class FastPathRouter:
+    """Deterministic pre-router that calls the shopping tools directly"""
+
+    def __init__(self):
+        self.stats = {"evaluated": 0, "hits": 0, "misses": 0, "intents": {}}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return routing counters and the fast path hit rate"""
+        evaluated = self.stats["evaluated"]
+        return {
+            **self.stats,
+            "intents": dict(self.stats["intents"]),
+            "hit_rate": round(self.stats["hits"] / evaluated, 4) if evaluated else 0.0,
+        }
+
+    def parse(self, user_message: str, has_history: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Parse a user message into a single tool call
+
+        Args:
+            user_message: User's message
+            has_history: Whether the conversation has earlier turns. Search
+                queries are only routed on the first turn, since follow-ups
+                like "ones under 20k" depend on context.
+
+        Returns:
+            Dict with intent, tool_name and tool_kwargs, or None when the
+            message should go to the agent
+        """
+        text = normalize_query(user_message)
+        if not text:
+            return None
+
+        if _BRAND_LIST_PATTERN.match(text):
+            return {"intent": "list_brands", "tool_name": "get_brand_list", "tool_kwargs": {}}
+
+        details = self._parse_details(text)
+        if details is not None:
+            return details
+
+        if has_history:
+            return None
+        return self._parse_search(text)
+
+    def _parse_details(self, text: str) -> Optional[Dict[str, Any]]:
+        for pattern in _DETAILS_PATTERNS:
+            match = pattern.match(text)
+            if not match:
+                continue
+            model = match.group("model").strip()
+            words = _tokens(model)
+            if not words or any(word in _REFERENCE_WORDS for word in words):
+                return None
+            if all(word in _FILLER_WORDS for word in words):
+                return None
+            return {"intent": "details", "tool_name": "get_mobile_details", "tool_kwargs": {"model_name": model}}
+        return None
+
+    def _parse_search(self, text: str) -> Optional[Dict[str, Any]]:
+        kwargs = self._search_filters(text, strict=True)
+        if not kwargs:
+            return None
+        return {"intent": "search", "tool_name": "search_mobile_phones", "tool_kwargs": kwargs}
+
+    def _search_filters(self, text: str, strict: bool) -> Optional[Dict[str, Any]]:
+        """
+        Brand and price filters of a search query. Strict parsing gives up
+        (None) on anything it does not understand; lenient parsing keeps the
+        filters it could read and ignores the rest.
+        """
+        kwargs: Dict[str, Any] = {}
+
+        # Price range: "between 10k and 20k", "10k to 20k", "10k-20k"
+        match = re.search(rf"\b(?:between )?{_AMOUNT}\s*(?:and|to|-)\s*{_AMOUNT}", text)
+        if match:
+            low_unit = match.group(2) or match.group(4)
+            low = _parse_amount(match.group(1), low_unit)
+            high = _parse_amount(match.group(3), match.group(4))
+            if low is None or high is None or low > high:
+                if strict:
+                    return None
+            else:
+                kwargs["min_price_inr"], kwargs["max_price_inr"] = low, high
+            text = text[:match.start()] + " " + text[match.end():]
+
+        for pattern, kind in ((_MAX_PRICE, "max"), (_MIN_PRICE, "min"), (_AROUND_PRICE, "around")):
+            match = re.search(rf"\b{pattern} {_AMOUNT}", text)
+            if not match:
+                continue
+            amount = _parse_amount(match.group(1), match.group(2))
+            if amount is None:
+                if strict:
+                    return None
+                continue
+            if kind == "max":
+                kwargs["max_price_inr"] = amount
+            elif kind == "min":
+                kwargs["min_price_inr"] = amount
+            else:
+                kwargs["min_price_inr"], kwargs["max_price_inr"] = amount - 1000, amount + 1000
+            text = text[:match.start()] + " " + text[match.end():]
+
+        # Any number left over is something we did not understand (RAM, storage, ...)
+        if strict and re.search(r"\d", text):
+            return None
+
+        if re.search(r"\bandroid\b", text):
+            kwargs["exclude_apple"] = True
+            text = re.sub(r"\bandroid\b", " ", text)
+
+        if re.search(r"\b(?:ios|iphones?)\b", text):
+            kwargs["brand"] = "Apple"
+            text = re.sub(r"\b(?:ios|iphones?)\b", " ", text)
+
+        brands = sorted(get_mobile_data_service().get_brands(), key=len, reverse=True)
+        for brand in brands:
+            pattern = rf"\b{re.escape(brand.lower())}\b"
+            if re.search(pattern, text):
+                if "brand" in kwargs and kwargs["brand"] != brand:
+                    if strict:
+                        return None  # Several brands usually means a comparison
+                    continue
+                kwargs["brand"] = brand
+                text = re.sub(pattern, " ", text)
+
+        if kwargs.get("brand") == "Apple" and kwargs.get("exclude_apple"):
+            if strict:
+                return None
+            del kwargs["exclude_apple"]
+        if strict and any(word not in _FILLER_WORDS for word in _tokens(text)):
+            return None
+
+        return kwargs
+
+    async def route(
+        self,
+        agent: FunctionAgent,
+        user_message: str,
+        conversation_history: List[Dict[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Answer the message directly when it is simple enough
+
+        Args:
+            agent: The mobile shopping FunctionAgent, used for its tools
+            user_message: User's message
+            conversation_history: Recent messages of the conversation
+
+        Returns:
+            Dict with "response" text and "tool_calls" info (same shape the
+            orchestrator records for agent runs), or None to fall through
+        """
+        self.stats["evaluated"] += 1
+        route = self.parse(user_message, has_history=bool(conversation_history))
+        result = await self._execute(agent, route) if route else None
+
+        if result is None:
+            self.stats["misses"] += 1
+            cache_requests_total.inc(cache="fast_path", result="miss")
+            return None
+
+        self.stats["hits"] += 1
+        cache_requests_total.inc(cache="fast_path", result="hit")
+        intents = self.stats["intents"]
+        intents[route["intent"]] = intents.get(route["intent"], 0) + 1
+        logger.info(f"⚡ Fast path hit: {route['intent']} | {route['tool_kwargs']} | hit rate {self.get_stats()['hit_rate']:.1%}")
+        return result
+
+    async def fallback(self, agent: FunctionAgent, user_message: str) -> Dict[str, Any]:
+        """
+        Degraded answer for when the LLM is unavailable: a plain search with
+        whatever brand and price filters can be read from the message
+
+        Args:
+            agent: The mobile shopping FunctionAgent, used for its tools
+            user_message: User's message
+
+        Returns:
+            Dict with "response" text and "tool_calls" info, like route()
+        """
+        kwargs = self._search_filters(normalize_query(user_message), strict=False) or {}
+        tools = {tool.metadata.name: tool for tool in agent.tools}
+        tool_output = await tools["search_mobile_phones"].acall(ctx=None, **kwargs)
+        raw_output = tool_output.raw_output
+        results = raw_output.get("results", []) if isinstance(raw_output, dict) else []
+
+        if results:
+            response = _FALLBACK_NOTICE + _format_search(results, kwargs)
+        else:
+            response = _FALLBACK_NOTICE + (
+                "I couldn't find phones matching those filters in our database. "
+                "Try a different brand or budget."
+            )
+        logger.warning(f"🛟 Degraded answer from search results | {kwargs} | {len(results)} results")
+        return {
+            "response": response,
+            "tool_calls": [{
+                "tool_name": "search_mobile_phones",
+                "tool_kwargs": to_serializable(kwargs),
+                "tool_output": to_serializable(tool_output),
+            }],
+        }
+
+    async def _execute(self, agent: FunctionAgent, route: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        tools = {tool.metadata.name: tool for tool in agent.tools}
+        tool = tools.get(route["tool_name"])
+        if tool is None:
+            return None
+
+        tool_output = await tool.acall(ctx=None, **route["tool_kwargs"])
+        raw_output = tool_output.raw_output
+        if not isinstance(raw_output, dict) or not raw_output.get("success"):
+            return None
+
+        if route["intent"] == "list_brands":
+            response = _format_brands(raw_output.get("brands", []))
+        elif route["intent"] == "details":
+            record = raw_output.get("result")
+            if not record or not _is_exact_model_match(route["tool_kwargs"]["model_name"], record):
+                return None
+            response = _format_details(record)
+        else:
+            results = raw_output.get("results", [])
+            if not results:
+                return None  # Let the agent suggest alternatives
+            response = _format_search(results, route["tool_kwargs"])
+
+        return {
+            "response": response,
+            "tool_calls": [{
+                "tool_name": route["tool_name"],
+                "tool_kwargs": to_serializable(route["tool_kwargs"]),
+                "tool_output": to_serializable(tool_output),
+            }],
+        }
+
+
+def _is_exact_model_match(model_query: str, record: Dict[str, Any]) -> bool:
+    """
+    Only trust the fuzzy model lookup when the matched phone has no words the
+    user did not ask for, apart from the storage variant ("iPhone 15" matches
+    "iPhone 15 128GB" but not "iPhone 15 Pro 128GB").
+    """
+    query_words = set(_tokens(normalize_query(model_query)))
+    company_words = set(_tokens(str(record.get("Company Name", "")).lower()))
+    model_words = {
+        word for word in _tokens(str(record.get("Model Name", "")).lower())
+        if not re.fullmatch(r"\d+(?:gb|tb)", word)
+    }
+    return model_words <= query_words and query_words <= (model_words | company_words)
+
+
+def _format_price(record: Dict[str, Any]) -> str:
+    price = str(record.get("Launched Price (India)", "")).replace("INR", "").strip()
+    return f"₹{price}" if price else "Price not available"
+
+
+def _format_brands(brands: List[str]) -> str:
+    return (
+        f"We have phones from **{len(brands)} brands** in our database:\n\n"
+        + ", ".join(brands)
+        + "\n\nTell me a brand and your budget and I'll show you the options."
+    )
+
+
+def _format_details(record: Dict[str, Any]) -> str:
+    return "\n".join([
+        f"### {record.get('Company Name', '')} {record.get('Model Name', '')}",
+        "",
+        f"- **Price (India):** {_format_price(record)}",
+        f"- **Processor:** {record.get('Processor', '')}",
+        f"- **RAM:** {record.get('RAM', '')}",
+        f"- **Back Camera:** {record.get('Back Camera', '')}",
+        f"- **Front Camera:** {record.get('Front Camera', '')}",
+        f"- **Battery:** {record.get('Battery Capacity', '')}",
+        f"- **Screen Size:** {record.get('Screen Size', '')}",
+        f"- **Weight:** {record.get('Mobile Weight', '')}",
+        f"- **Launched:** {record.get('Launched Year', '')}",
+        "",
+        "Prices are launch prices in India. Want me to compare it with another phone?",
+    ])
+
+
+def _format_search(results: List[Dict[str, Any]], kwargs: Dict[str, Any]) -> str:
+    description = f"{kwargs['brand']} phones" if kwargs.get("brand") else "phones"
+    if kwargs.get("exclude_apple"):
+        description = f"Android {description}"
+    min_price, max_price = kwargs.get("min_price_inr"), kwargs.get("max_price_inr")
+    if min_price and max_price:
+        description += f" between ₹{min_price:,} and ₹{max_price:,}"
+    elif max_price:
+        description += f" under ₹{max_price:,}"
+    elif min_price:
+        description += f" above ₹{min_price:,}"
+
+    lines = [f"Here are {len(results)} {description} from our database:", ""]
+    for index, record in enumerate(results, start=1):
+        lines.append(
+            f"{index}. **{record.get('Company Name', '')} {record.get('Model Name', '')}** - "
+            f"{_format_price(record)} | {record.get('RAM', '')} RAM | "
+            f"{record.get('Battery Capacity', '')} | {record.get('Screen Size', '')}"
+        )
+    lines.extend(["", "Ask me for details on any of these, or to compare up to 3 of them."])
+    return "\n".join(lines)
+
+
+# Singleton instance
+fast_path_router = FastPathRouter()
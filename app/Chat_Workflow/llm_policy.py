@@ -0,0 +1,177 @@
+"""
+LLM Policy - Latency-aware timeouts, hedging and a circuit breaker for agent runs
+
+Every agent run (one "attempt") gets a deadline derived from the latency of
+recent successful runs: the AGENT_TIMEOUT_PERCENTILE latency times
+AGENT_TIMEOUT_MULTIPLIER, clamped to [AGENT_TIMEOUT_MIN_SECONDS,
+AGENT_TIMEOUT_MAX_SECONDS]. Until enough runs have been seen the maximum is
+used. Non-streaming requests may start a hedged second attempt once the
+first one is slower than the HEDGE_PERCENTILE latency.
+
+Timeouts and errors feed a circuit breaker. While it is open, requests skip
+the LLM and get the degraded answer built from search results (see
+FastPathRouter.fallback) instead of waiting on an upstream that is down.
+"""
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict
+
+from app.core.config import settings
+from app.utils.tracing import percentile
+
+logger = logging.getLogger(__name__)
+
+# Successful runs needed before the timeout adapts to observed latency
+MIN_SAMPLES = 20
+
+# Recent successful run latencies kept for the percentiles
+LATENCY_WINDOW = 200
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. After failure_threshold consecutive failures it
+    opens and rejects calls for cooldown_seconds, then lets a single probe
+    through (half-open); the probe's outcome closes or re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, cooldown_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """Whether a call may go to the LLM now"""
+        if self.failure_threshold <= 0 or self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.cooldown_seconds:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info("🟢 LLM circuit closed")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def release(self) -> None:
+        """A call was abandoned (client gone, hedge lost) without an outcome"""
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.failure_threshold <= 0:
+            return
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                logger.warning(f"🔴 LLM circuit opened after {self.consecutive_failures} consecutive failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+        }
+
+
+class AgentRunPolicy:
+    """Deadline and hedge delay for agent runs, from recent run latencies"""
+
+    def __init__(
+        self,
+        timeout_percentile: float = 0.99,
+        timeout_multiplier: float = 2.0,
+        min_timeout_seconds: float = 10.0,
+        max_timeout_seconds: float = 60.0,
+        hedge_enabled: bool = False,
+        hedge_percentile: float = 0.95,
+        breaker: CircuitBreaker = None
+    ):
+        self.timeout_percentile = timeout_percentile
+        self.timeout_multiplier = timeout_multiplier
+        self.min_timeout_seconds = min_timeout_seconds
+        self.max_timeout_seconds = max_timeout_seconds
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.breaker = breaker or CircuitBreaker()
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.stats = {"succeeded": 0, "timed_out": 0, "failed": 0, "rejected": 0, "hedged": 0, "hedge_wins": 0}
+
+    def attempt_timeout(self) -> float:
+        """Seconds one agent run may take before it is abandoned"""
+        if len(self._latencies) < MIN_SAMPLES:
+            return self.max_timeout_seconds
+        observed = percentile(sorted(self._latencies), self.timeout_percentile) * self.timeout_multiplier
+        return min(max(observed, self.min_timeout_seconds), self.max_timeout_seconds)
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait for the first attempt before starting a hedged one"""
+        if len(self._latencies) < MIN_SAMPLES:
+            return self.attempt_timeout() / 2
+        return percentile(sorted(self._latencies), self.hedge_percentile)
+
+    def allow(self) -> bool:
+        allowed = self.breaker.allow()
+        if not allowed:
+            self.stats["rejected"] += 1
+        return allowed
+
+    def record_success(self, seconds: float) -> None:
+        self._latencies.append(seconds)
+        self.stats["succeeded"] += 1
+        self.breaker.record_success()
+
+    def record_failure(self, timed_out: bool) -> None:
+        self.stats["timed_out" if timed_out else "failed"] += 1
+        self.breaker.record_failure()
+
+    def record_abandoned(self) -> None:
+        self.breaker.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "attempt_timeout_s": round(self.attempt_timeout(), 3),
+            "hedge_delay_s": round(self.hedge_delay(), 3) if self.hedge_enabled else None,
+            "circuit": self.breaker.get_stats(),
+        }
+
+
+def create_agent_run_policy() -> AgentRunPolicy:
+    """Build the policy from settings"""
+    return AgentRunPolicy(
+        timeout_percentile=settings.AGENT_TIMEOUT_PERCENTILE,
+        timeout_multiplier=settings.AGENT_TIMEOUT_MULTIPLIER,
+        min_timeout_seconds=settings.AGENT_TIMEOUT_MIN_SECONDS,
+        max_timeout_seconds=settings.AGENT_TIMEOUT_MAX_SECONDS,
+        hedge_enabled=settings.HEDGE_ENABLED,
+        hedge_percentile=settings.HEDGE_PERCENTILE,
+        breaker=CircuitBreaker(
+            failure_threshold=settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+            cooldown_seconds=settings.CIRCUIT_BREAKER_COOLDOWN_SECONDS
+        )
+    )
+
+
+# Singleton instance
+agent_run_policy = create_agent_run_policy()
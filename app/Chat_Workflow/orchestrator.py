@@ -1,65 +1,193 @@
+import asyncio
+import copy
+import hashlib
 import json
 import logging
-from typing import Dict, Any
+import time
+from typing import Dict, Any, List, AsyncIterator, Iterator, Optional, Set
 
-from llama_index.core.agent.workflow import FunctionAgent, ToolCallResult, ToolCall
+from llama_index.core.agent.workflow import FunctionAgent, ToolCallResult, ToolCall, AgentStream
 from llama_index.core.workflow import Context
 
-from app.utils.chat_utils import format_conversation_history
+from app.core.config import settings
+from app.Chat_Workflow.fast_path import fast_path_router
+from app.Chat_Workflow.llm_policy import agent_run_policy
+from app.Chat_Workflow.tool_steps import ToolStepSequencer
+from app.services.conversation_memory import count_tokens
+from app.services.mobile_data_service import get_mobile_data_service
+from app.services.response_cache import get_response_cache
+from app.utils.chat_utils import format_conversation_history, normalize_query
+from app.utils.serialization import to_serializable, dumps
+from app.utils.single_flight import SingleFlight
+from app.utils.metrics import tool_calls_total, agent_runs_total, cancelled_work_total
+from app.utils.tracing import span, start_span, use_span
 
 logger = logging.getLogger(__name__)
 
-def _serialize_recursively(data: Any) -> Any:
+PRODUCT_TOOLS = ["search_mobile_phones", "compare_mobile_phones", "get_mobile_details"]
+
+# Identical concurrent runs share one agent execution
+workflow_flights = SingleFlight()
+
+# Cancellations of abandoned agent runs, referenced until they are done
+_run_cancellations: Set[asyncio.Task] = set()
+
+
+def _extract_products(tool_output: Any) -> List[Dict[str, Any]]:
     """
-    Recursively convert data to a BSON/JSON serializable format.
-    Handles basic types, lists, dicts, and Pydantic models.
-    Converts other types to their string representation.
+    Pull the phone records out of a serialized tool output so the frontend
+    can render product cards before the final answer is ready.
     """
-    # Handle None and primitives first
-    if data is None or isinstance(data, (str, int, float, bool)):
-        return data
-    
-    # Handle dict
-    if isinstance(data, dict):
-        return {key: _serialize_recursively(value) for key, value in data.items()}
-    
-    # Handle list/tuple
-    if isinstance(data, (list, tuple)):
-        return [_serialize_recursively(item) for item in data]
-    
-    # Try Pydantic models or objects with dict methods
-    if hasattr(data, 'dict'):
-        try:
-            return _serialize_recursively(data.dict())
-        except Exception:
-            pass
-    
-    if hasattr(data, 'to_dict'):
-        try:
-            return _serialize_recursively(data.to_dict())
-        except Exception:
-            pass
-    
-    # For any other type (like FunctionTool), convert to string
-    return str(data)
+    if not isinstance(tool_output, dict):
+        return []
+    raw_output = tool_output.get("raw_output", tool_output)
+    if not isinstance(raw_output, dict):
+        return []
+    if isinstance(raw_output.get("results"), list):
+        return raw_output["results"]
+    if isinstance(raw_output.get("result"), dict):
+        return [raw_output["result"]]
+    return []
+
+
+def _is_failed_tool_output(tool_output: Any) -> bool:
+    """Whether a serialized tool output is an error (raised, or reported with success=False)"""
+    if not isinstance(tool_output, dict):
+        return False
+    raw_output = tool_output.get("raw_output")
+    return bool(tool_output.get("is_error")) or (isinstance(raw_output, dict) and raw_output.get("success") is False)
+
+
+def _extract_response_content(result: Any) -> str:
+    """Extract the final response text from the agent result"""
+    if (hasattr(result, 'response') and 
+        hasattr(result.response, 'blocks') and 
+        result.response.blocks): 
+        return str(result.response.blocks[0].text)
+    elif hasattr(result, 'response') and hasattr(result.response, 'text'):
+        return result.response.text
+    return str(result)
+
+
+def _build_workflow_result(
+    response_content: str,
+    tool_calls_info: List[Dict[str, Any]],
+    user_message: str,
+    source: str = "agent"
+) -> Dict[str, Any]:
+    """Build the workflow result dictionary returned to the conversation service"""
+    # Extract tool outputs for mobile shopping tools
+    output = None
+    for tool_call in tool_calls_info:
+        tool_name = tool_call.get("tool_name")
+        tool_output_dict = tool_call.get("tool_output", {})
+        
+        # Extract results from mobile shopping tools
+        if tool_name in PRODUCT_TOOLS:
+            output = tool_output_dict
+            logger.info(f"Tool {tool_name} returned {len(output.get('results', [])) if isinstance(output.get('results'), list) else 'N/A'} results")
+
+    return {
+        "response": response_content,
+        "tool_calls": tool_calls_info,
+        "output": output,
+        "predicted_sql_query": None,  # Not used for mobile shopping
+        "user_query": user_message,
+        "source": source,  # "agent", "fast_path", "cache" or "fallback"
+    }
 
-async def execute_mobile_shopping_workflow(agent: FunctionAgent, payload: Dict[str, Any]):
+
+def _direct_answer_events(
+    answer: Dict[str, Any],
+    user_message: str,
+    source: str,
+    stream_text: bool = True
+) -> Iterator[Dict[str, Any]]:
     """
-    Execute the mobile shopping workflow using the FunctionAgent.
+    Emit the same events an agent run would for an answer produced without
+    the agent (tool calls already executed, full response text known).
+    Without stream_text the response text is only sent in the result.
+    """
+    for index, tool_info in enumerate(answer["tool_calls"]):
+        tool_id = f"direct-{index}"
+        tool_output = tool_info["tool_output"]
+        yield {"event": "tool_call_start", "data": {
+            "tool_name": tool_info["tool_name"],
+            "tool_id": tool_id,
+            "tool_kwargs": tool_info["tool_kwargs"],
+        }}
+        yield {"event": "tool_call_end", "data": {
+            "tool_name": tool_info["tool_name"],
+            "tool_id": tool_id,
+            "is_error": bool(isinstance(tool_output, dict) and tool_output.get("is_error")),
+        }}
+        if tool_info["tool_name"] in PRODUCT_TOOLS:
+            yield {"event": "products", "data": {
+                "tool_name": tool_info["tool_name"],
+                "results": _extract_products(tool_output),
+            }}
+    if stream_text:
+        yield {"event": "token", "data": {"delta": answer["response"]}}
+    yield {"event": "result", "data": _build_workflow_result(answer["response"], answer["tool_calls"], user_message, source)}
+
+
+class LLMUnavailableError(Exception):
+    """The agent run failed, timed out or was skipped, and degraded answers are disabled"""
+
+
+async def stream_mobile_shopping_workflow(
+    agent: FunctionAgent,
+    payload: Dict[str, Any],
+    tool_results: Optional[List[Dict[str, Any]]] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run the mobile shopping workflow and yield events as soon as the agent emits them.
     
     Args:
         agent: The mobile shopping FunctionAgent
-        payload: Dictionary containing conversation_id, user_message, and conversation_history
+        payload: Dictionary containing conversation_id, user_message, conversation_history
+            and optionally conversation_summary (summary of turns older than the history)
+        tool_results: Optional list the agent's tool calls are appended to as
+            they complete, so a caller that stops the run early (the client
+            went away) still has the results computed so far
     
-    Returns:
-        Dictionary with response, tool_calls, output, and user_query
+    Yields:
+        Dictionaries with an "event" name and "data" payload:
+        - token: incremental response text ({"delta": ...})
+        - tool_call_start / tool_call_end: tool invocation lifecycle
+        - products: phone records returned by a product tool
+        - error: the agent failed after part of its answer was streamed
+          ({"detail": ..., "interrupted": True}); the streamed text should be
+          discarded, and the degraded answer follows in the result only
+        - result: the final workflow result (same shape as execute_mobile_shopping_workflow)
     """
-    ctx = Context(agent)
-    
     conversation_history = payload.get("conversation_history", [])
+    conversation_summary = payload.get("conversation_summary", "")
     user_message = payload.get("user_message", "")
 
-    formatted_conversation_history = await format_conversation_history(conversation_history)
+    # Simple queries are answered straight from the tools, skipping the LLM
+    if settings.FAST_PATH_ENABLED:
+        answer = await fast_path_router.route(agent, user_message, conversation_history)
+        if answer is not None:
+            for event in _direct_answer_events(answer, user_message, "fast_path"):
+                yield event
+            return
+
+    # First-turn questions are answered from the response cache when possible
+    cache = get_response_cache() if not conversation_history and not conversation_summary else None
+    catalog_version = get_mobile_data_service().version if cache is not None else None
+    if cache is not None:
+        answer = await cache.get(user_message, catalog_version)
+        if answer is not None:
+            logger.info(f"💾 Response cache hit for: {user_message}")
+            for event in _direct_answer_events(answer, user_message, "cache"):
+                yield event
+            return
+
+    ctx = Context(agent)
+
+    with span("history"):
+        formatted_conversation_history = await format_conversation_history(conversation_history, conversation_summary)
     formatted_payload = payload.copy()
     formatted_payload["conversation_history"] = formatted_conversation_history
 
@@ -79,58 +207,273 @@ Please help the user find their ideal mobile phone based on their needs.
     else:
         enhanced_query = user_message
     
-    handler = agent.run(enhanced_query, ctx=ctx)
-    tool_calls_info = []
-
-    async for event in handler.stream_events():
-        if isinstance(event, ToolCall):
-            tool_name = getattr(event, 'tool_name', None)
-            tool_kwargs = getattr(event, 'tool_kwargs', None)
-            
-            logger.info(f"🔧 Tool Call: {tool_name} | Data Source: 📊 JSON Database")
-            logger.info(f"   Arguments: {tool_kwargs}")
-        if isinstance(event, ToolCallResult):
-            tool_output = getattr(event, 'tool_output', None)
-            serialized_output = _serialize_recursively(tool_output)
-
-            tool_info = {
-                'tool_name': getattr(event, 'tool_name', None),
-                'tool_kwargs': _serialize_recursively(getattr(event, "tool_kwargs", None)),
-                'tool_output': serialized_output,
-            }
-            tool_calls_info.append(tool_info)
-
-    # Get the final result
-    result = await handler
-
-    # Extract response content
-    if (hasattr(result, 'response') and 
-        hasattr(result.response, 'blocks') and 
-        result.response.blocks): 
-        response_content = str(result.response.blocks[0].text)
-    elif hasattr(result, 'response') and hasattr(result.response, 'text'):
-        response_content = result.response.text
-    else:
-        response_content = str(result)
+    # While the circuit is open the LLM is skipped instead of waited on
+    if not agent_run_policy.allow():
+        agent_runs_total.inc(outcome="rejected")
+        logger.warning("🔴 LLM circuit open, skipping the agent")
+        async for event in _fallback_events(agent, user_message, "circuit open"):
+            yield event
+        return
 
-    # Extract tool outputs for mobile shopping tools
-    output = None
-    for tool_call in tool_calls_info:
-        tool_name = tool_call.get("tool_name")
-        tool_output_dict = tool_call.get("tool_output", {})
+    # The workflow's tasks are created by run(), so LLM and tool spans
+    # recorded inside them nest under the agent span
+    timeout = agent_run_policy.attempt_timeout()
+    agent_span = start_span("agent", timeout_s=round(timeout, 1))
+    with use_span(agent_span):
+        handler = agent.run(enhanced_query, ctx=ctx)
+    tool_calls_info = tool_results if tool_results is not None else []
+    deltas = []
+
+    # Tool calls of one step run concurrently; the sequencer puts their
+    # events back into the order the LLM requested them
+    sequencer = ToolStepSequencer()
+
+    started_at = time.perf_counter()
+    deadline = started_at + timeout
+    outcome = None
+    try:
+        events = handler.stream_events().__aiter__()
+        while True:
+            try:
+                streamed_event = await asyncio.wait_for(events.__anext__(), deadline - time.perf_counter())
+            except StopAsyncIteration:
+                break
+            for event in sequencer.add(streamed_event):
+                for workflow_event in _tool_events(event, tool_calls_info, deltas):
+                    yield workflow_event
+        for event in sequencer.flush():
+            for workflow_event in _tool_events(event, tool_calls_info, deltas):
+                yield workflow_event
+
+        # Get the final result
+        result = await asyncio.wait_for(handler, max(deadline - time.perf_counter(), 0.001))
+        outcome = "ok"
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        logger.error(f"⏱️ Agent run exceeded its {timeout:.1f}s deadline")
+    except Exception as e:
+        outcome = "error"
+        logger.error(f"Agent run failed: {e}", exc_info=True)
+    finally:
+        agent_span.attrs["outcome"] = outcome or "abandoned"
+        agent_span.end()
+        if outcome is None:
+            # Client went away or a hedged attempt lost
+            agent_run_policy.record_abandoned()
+            agent_runs_total.inc(outcome="cancelled")
+            _record_cancelled_work(time.perf_counter() - started_at, tool_calls_info, "".join(deltas))
+            _cancel_run_detached(handler)
+        elif outcome != "ok":
+            await handler.cancel_run()
+
+    agent_runs_total.inc(outcome=outcome)
+    if outcome != "ok":
+        agent_run_policy.record_failure(timed_out=outcome == "timeout")
+        async for event in _fallback_events(agent, user_message, outcome, interrupted=bool(deltas)):
+            yield event
+        return
+
+    agent_run_policy.record_success(time.perf_counter() - started_at)
+    response_content = _extract_response_content(result)
+
+    if cache is not None and response_content:
+        await cache.set(user_message, catalog_version, {"response": response_content, "tool_calls": tool_calls_info})
+
+    yield {"event": "result", "data": _build_workflow_result(response_content, tool_calls_info, user_message)}
+
+
+def _cancel_run_detached(handler: Any) -> None:
+    """
+    Cancel an abandoned agent run from a task of its own
+
+    The abandoning caller is itself being cancelled, and under anyio (which
+    Starlette uses for streamed responses) each of its awaits is cancelled
+    again, so awaiting the cancellation there could leave the run going.
+    """
+    task = asyncio.get_running_loop().create_task(handler.cancel_run())
+    _run_cancellations.add(task)
+    task.add_done_callback(_run_cancellations.discard)
+
+
+def _record_cancelled_work(seconds: float, tool_calls_info: List[Dict[str, Any]], partial_response: str) -> None:
+    """Count the work an agent run did before it was cancelled"""
+    cancelled_work_total.inc(seconds, kind="agent_seconds")
+    if tool_calls_info:
+        cancelled_work_total.inc(len(tool_calls_info), kind="tool_calls")
+    if partial_response:
+        cancelled_work_total.inc(count_tokens(partial_response), kind="response_tokens")
+    logger.info(
+        f"✂️ Agent run cancelled after {seconds:.1f}s, {len(tool_calls_info)} tool calls "
+        f"and {len(partial_response)} response characters"
+    )
+
+
+async def _fallback_events(
+    agent: FunctionAgent,
+    user_message: str,
+    reason: str,
+    interrupted: bool = False
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Events of the degraded answer, or LLMUnavailableError when those are disabled
+
+    When the agent had already streamed part of its answer (interrupted),
+    the client is told to drop that text, and the degraded answer is only
+    sent in the result, so it is not appended to the partial text.
+    """
+    if not settings.DEGRADED_FALLBACK_ENABLED:
+        raise LLMUnavailableError(f"LLM unavailable ({reason})")
+    if interrupted:
+        yield {"event": "error", "data": {"detail": f"The answer was interrupted ({reason})", "interrupted": True}}
+    answer = await fast_path_router.fallback(agent, user_message)
+    for event in _direct_answer_events(answer, user_message, "fallback", stream_text=not interrupted):
+        yield event
+
+
+def _tool_events(event: Any, tool_calls_info: List[Dict[str, Any]], deltas: List[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Convert an agent stream event to workflow events, recording tool results
+    in tool_calls_info and response text in deltas
+    """
+    if isinstance(event, AgentStream):
+        if event.delta:
+            deltas.append(event.delta)
+            yield {"event": "token", "data": {"delta": event.delta}}
+    if isinstance(event, ToolCall):
+        tool_name = getattr(event, 'tool_name', None)
+        tool_kwargs = getattr(event, 'tool_kwargs', None)
         
-        # Extract results from mobile shopping tools
-        if tool_name in ["search_mobile_phones", "compare_mobile_phones", "get_mobile_details"]:
-            output = tool_output_dict
-            logger.info(f"Tool {tool_name} returned {len(output.get('results', [])) if isinstance(output.get('results'), list) else 'N/A'} results")
+        logger.info(f"🔧 Tool Call: {tool_name} | Data Source: 📊 JSON Database")
+        logger.info(f"   Arguments: {tool_kwargs}")
+        yield {"event": "tool_call_start", "data": {
+            "tool_name": tool_name,
+            "tool_id": getattr(event, 'tool_id', None),
+            "tool_kwargs": to_serializable(tool_kwargs),
+        }}
+    if isinstance(event, ToolCallResult):
+        tool_output = getattr(event, 'tool_output', None)
+        with span("serialization"):
+            serialized_output = to_serializable(tool_output)
+        tool_calls_total.inc(
+            tool=getattr(event, 'tool_name', None),
+            status="error" if _is_failed_tool_output(serialized_output) else "ok"
+        )
 
-    return {
-        "response": response_content,
-        "tool_calls": tool_calls_info,
-        "output": output,
-        "predicted_sql_query": None,  # Not used for mobile shopping
-        "user_query": user_message,
-    }
+        tool_info = {
+            'tool_name': getattr(event, 'tool_name', None),
+            'tool_kwargs': to_serializable(getattr(event, "tool_kwargs", None)),
+            'tool_output': serialized_output,
+        }
+        tool_calls_info.append(tool_info)
+        yield {"event": "tool_call_end", "data": {
+            "tool_name": tool_info['tool_name'],
+            "tool_id": getattr(event, 'tool_id', None),
+            "is_error": bool(getattr(tool_output, 'is_error', False)),
+        }}
+        if tool_info['tool_name'] in PRODUCT_TOOLS:
+            yield {"event": "products", "data": {
+                "tool_name": tool_info['tool_name'],
+                "results": _extract_products(serialized_output),
+            }}
+
+
+def _coalescing_key(payload: Dict[str, Any]) -> tuple:
+    """Key identifying runs that would produce the same answer"""
+    history = [
+        (message.get("role"), message.get("content"))
+        for message in payload.get("conversation_history", [])
+    ]
+    history_hash = hashlib.sha256(dumps([payload.get("conversation_summary", ""), history]).encode("utf-8")).hexdigest()
+    return (normalize_query(payload.get("user_message", "")), history_hash, get_mobile_data_service().version)
+
+
+async def _run_attempt(
+    agent: FunctionAgent,
+    payload: Dict[str, Any],
+    tool_results: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    result = None
+    async for event in stream_mobile_shopping_workflow(agent, payload, tool_results=tool_results):
+        if event["event"] == "result":
+            result = event["data"]
+    return result
+
+
+async def _run_workflow(
+    agent: FunctionAgent,
+    payload: Dict[str, Any],
+    tool_results: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    """
+    Run one attempt, plus a hedged second one (see HEDGE_ENABLED) when the
+    first is still running after the hedge delay. The first agent answer
+    wins; a degraded answer only wins when no agent answer can follow.
+    Only the first attempt records its tool calls in tool_results.
+    """
+    if not agent_run_policy.hedge_enabled:
+        return await _run_attempt(agent, payload, tool_results)
+
+    primary = asyncio.create_task(_run_attempt(agent, payload, tool_results))
+    done, _ = await asyncio.wait({primary}, timeout=agent_run_policy.hedge_delay())
+    if done or agent_run_policy.breaker.state != agent_run_policy.breaker.CLOSED:
+        return await primary
+
+    agent_run_policy.stats["hedged"] += 1
+    logger.info("🏁 Agent run is slow, starting a hedged attempt")
+    hedge = asyncio.create_task(_run_attempt(agent, payload))
+    pending = {primary, hedge}
+    fallback = None
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                elif task.result()["source"] == "fallback":
+                    fallback = task.result()
+                else:
+                    if task is hedge:
+                        agent_run_policy.stats["hedge_wins"] += 1
+                    return task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+    if fallback is not None:
+        return fallback
+    raise error
+
+
+async def execute_mobile_shopping_workflow(
+    agent: FunctionAgent,
+    payload: Dict[str, Any],
+    tool_results: Optional[List[Dict[str, Any]]] = None
+):
+    """
+    Execute the mobile shopping workflow using the FunctionAgent.
+    
+    Concurrent calls with the same normalized message, history and catalog
+    version share a single agent run (see SINGLE_FLIGHT_ENABLED).
+    
+    Args:
+        agent: The mobile shopping FunctionAgent
+        payload: Dictionary containing conversation_id, user_message, and conversation_history
+        tool_results: Optional list the run's tool calls are appended to as they
+            complete (see stream_mobile_shopping_workflow); a caller joining a
+            run already in flight gets none
+    
+    Returns:
+        Dictionary with response, tool_calls, output, and user_query
+    """
+    if not settings.SINGLE_FLIGHT_ENABLED:
+        return await _run_workflow(agent, payload, tool_results)
+    
+    result = await workflow_flights.do(_coalescing_key(payload), lambda: _run_workflow(agent, payload, tool_results))
+    # The result may be shared with other callers; each gets a deep copy
+    # (~0.1ms for a 10-phone search) so changes to it stay its own
+    result = copy.deepcopy(result)
+    result["user_query"] = payload.get("user_message", "")
+    return result
 
 
 # Keep old function for backwards compatibility (if needed)
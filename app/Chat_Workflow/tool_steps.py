@@ -0,0 +1,141 @@
+"""
+Tool Steps - Orders and times the tool calls of each agent step
+
+The agent workflow runs the tool calls of one LLM step concurrently, so their
+ToolCall / ToolCallResult events reach the stream in completion order. The
+sequencer buffers them and releases them in the order the LLM requested the
+calls, and records each step's wall time next to the summed time of its
+calls. The difference is how long the calls overlapped, which is only time
+saved for calls that wait on I/O; calls that hold the GIL or the event loop
+would have taken as long one after another.
+"""
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from llama_index.core.agent.workflow import AgentOutput, ToolCall, ToolCallResult
+
+logger = logging.getLogger(__name__)
+
+# Totals across all agent steps that called tools
+tool_step_stats = {
+    "steps": 0,
+    "parallel_steps": 0,
+    "tool_calls": 0,
+    "tool_time_ms": 0.0,
+    "wall_time_ms": 0.0,
+    "overlap_ms": 0.0,
+}
+
+
+class _ToolStep:
+    """Tool calls requested by one LLM response"""
+
+    def __init__(self, tool_ids: List[str]):
+        self.order = tool_ids
+        self.starts: Dict[str, ToolCall] = {}
+        self.results: Dict[str, ToolCallResult] = {}
+        self.started_at: Dict[str, float] = {}
+        self.durations: Dict[str, float] = {}
+        self.next_start = 0
+        self.next_result = 0
+
+    def done(self) -> bool:
+        return self.next_result == len(self.order)
+
+
+class ToolStepSequencer:
+    """
+    Releases tool events of an agent run in deterministic order.
+
+    Feed every streamed event to add(); it returns the ToolCall and
+    ToolCallResult events that are ready, in the LLM's tool call order.
+    Other events are returned unchanged.
+    """
+
+    def __init__(self):
+        self._step: Optional[_ToolStep] = None
+        self.steps: List[Dict[str, Any]] = []
+
+    def add(self, event: Any) -> List[Any]:
+        if isinstance(event, AgentOutput):
+            leftover = self._flush_step()
+            tool_ids = [call.tool_id for call in event.tool_calls]
+            self._step = _ToolStep(tool_ids) if tool_ids else None
+            return leftover + [event]
+
+        step = self._step
+        if isinstance(event, ToolCall):
+            if step is None or event.tool_id not in step.order:
+                return [event]
+            step.started_at[event.tool_id] = time.perf_counter()
+            step.starts[event.tool_id] = event
+            return self._release(step)
+
+        if isinstance(event, ToolCallResult):
+            if step is None or event.tool_id not in step.order:
+                return [event]
+            started_at = step.started_at.get(event.tool_id)
+            if started_at is not None:
+                step.durations[event.tool_id] = time.perf_counter() - started_at
+            step.results[event.tool_id] = event
+            ready = self._release(step)
+            if step.done():
+                self._finish_step(step)
+                self._step = None
+            return ready
+
+        return [event]
+
+    def flush(self) -> List[Any]:
+        """Release whatever is still buffered (in arrival order) at the end of a run"""
+        return self._flush_step()
+
+    def _release(self, step: _ToolStep) -> List[Any]:
+        ready = []
+        while step.next_start < len(step.order) and step.order[step.next_start] in step.starts:
+            ready.append(step.starts.pop(step.order[step.next_start]))
+            step.next_start += 1
+        # A result is released only after its own start and every earlier result
+        while step.next_result < step.next_start and step.order[step.next_result] in step.results:
+            ready.append(step.results.pop(step.order[step.next_result]))
+            step.next_result += 1
+        return ready
+
+    def _flush_step(self) -> List[Any]:
+        step = self._step
+        self._step = None
+        if step is None:
+            return []
+        return list(step.starts.values()) + list(step.results.values())
+
+    def _finish_step(self, step: _ToolStep) -> None:
+        if not step.durations:
+            return
+        first_start = min(step.started_at.values())
+        last_end = max(step.started_at[tool_id] + duration for tool_id, duration in step.durations.items())
+        wall_ms = (last_end - first_start) * 1000
+        tool_ms = sum(step.durations.values()) * 1000
+        overlap_ms = max(tool_ms - wall_ms, 0.0)
+
+        self.steps.append({
+            "tool_calls": len(step.order),
+            "wall_time_ms": round(wall_ms, 2),
+            "tool_time_ms": round(tool_ms, 2),
+            "overlap_ms": round(overlap_ms, 2),
+        })
+        tool_step_stats["steps"] += 1
+        tool_step_stats["tool_calls"] += len(step.order)
+        tool_step_stats["tool_time_ms"] += tool_ms
+        tool_step_stats["wall_time_ms"] += wall_ms
+        tool_step_stats["overlap_ms"] += overlap_ms
+        if len(step.order) > 1:
+            tool_step_stats["parallel_steps"] += 1
+            logger.info(
+                f"⚡ {len(step.order)} tool calls in {wall_ms:.1f}ms "
+                f"(tool time {tool_ms:.1f}ms, overlapping {overlap_ms:.1f}ms)"
+            )
+
+
+def get_tool_step_stats() -> Dict[str, Any]:
+    return {key: round(value, 2) if isinstance(value, float) else value for key, value in tool_step_stats.items()}
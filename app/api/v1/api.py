@@ -1,9 +1,10 @@
 from fastapi import APIRouter
-from app.api.v1.endpoints import health, conversation
+from app.api.v1.endpoints import health, conversation, catalog
 
 api_router = APIRouter()
 
 api_router.include_router(health.router, prefix="/health", tags=["health"])
 api_router.include_router(conversation.router, prefix="/conversation", tags=["conversation"])
+api_router.include_router(catalog.router, tags=["catalog"])
 
 # Evaluation and chart endpoints removed - not required for mobile shopping agent 
\ No newline at end of file
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from app.core.config import settings
+from app.core.responses import FastJSONResponse
+from app.schemas.catalog import BrandListResponse, PhoneCompareResponse, PhoneListResponse
+from app.services.mobile_data_service import get_mobile_data_service
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def _etag() -> str:
+    """
+    ETag of every catalog response: the catalog snapshot version
+
+    A URL's response only changes when the catalog (or the API) does. The
+    tag is weak because compression may change the bytes on the wire.
+    """
+    return f'W/"{get_mobile_data_service().version}-{settings.API_VERSION}"'
+
+
+def _cache_headers(etag: str) -> Dict[str, str]:
+    return {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.CATALOG_CACHE_MAX_AGE_SECONDS}"
+    }
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    """Whether the client's If-None-Match already names the current ETag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison: W/"x" and "x" name the same representation
+    current = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == current for tag in header.split(","))
+
+
+async def _conditional(request: Request, build: Callable[[], Any]) -> Response:
+    """
+    Answer a catalog request, or 304 if the client's copy is current
+
+    The catalog is only queried when the client has no current copy.
+    """
+    etag = _etag()
+    headers = _cache_headers(etag)
+    if _not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    content = await asyncio.to_thread(build)
+    if content is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Phone not found")
+    return FastJSONResponse(content=content, headers=headers)
+
+
+@router.get("/phones/search", response_model=PhoneListResponse)
+async def search_phones(
+    request: Request,
+    brand: Optional[str] = Query(None, description="Company/brand name, e.g. Samsung"),
+    max_price_inr: Optional[float] = Query(None, ge=0, description="Maximum price in INR"),
+    min_price_inr: Optional[float] = Query(None, ge=0, description="Minimum price in INR"),
+    min_ram_gb: Optional[float] = Query(None, ge=0, description="Minimum RAM in GB"),
+    min_battery_mah: Optional[float] = Query(None, ge=0, description="Minimum battery capacity in mAh"),
+    max_weight_g: Optional[float] = Query(None, ge=0, description="Maximum weight in grams"),
+    min_screen_size: Optional[float] = Query(None, ge=0, description="Minimum screen size in inches"),
+    max_screen_size: Optional[float] = Query(None, ge=0, description="Maximum screen size in inches"),
+    processor_contains: Optional[str] = Query(None, description="Processor name contains, e.g. Snapdragon"),
+    camera_contains: Optional[str] = Query(None, description="Back camera specs contain, e.g. OIS"),
+    exclude_apple: bool = Query(False, description="Only Android phones"),
+    limit: int = Query(10, ge=1, le=100, description="Maximum number of results")
+):
+    """
+    Search the phone catalog with the same filters as the chat agent's search tool
+
+    Responses carry an ETag (the catalog version) and Cache-Control, and
+    requests with a matching If-None-Match get a 304.
+    """
+    def build() -> Dict[str, Any]:
+        service = get_mobile_data_service()
+        results = service.search_mobiles(
+            brand=brand,
+            max_price_inr=max_price_inr,
+            min_price_inr=min_price_inr,
+            min_ram_gb=min_ram_gb,
+            min_battery_mah=min_battery_mah,
+            max_weight_g=max_weight_g,
+            min_screen_size=min_screen_size,
+            max_screen_size=max_screen_size,
+            processor_contains=processor_contains,
+            camera_contains=camera_contains,
+            exclude_apple=exclude_apple,
+            limit=limit
+        )
+        return {"catalog_version": service.version, "count": len(results), "results": results}
+
+    return await _conditional(request, build)
+
+
+@router.get("/phones/compare", response_model=PhoneCompareResponse)
+async def compare_phones(
+    request: Request,
+    models: List[str] = Query(..., min_length=2, max_length=3, description="2 or 3 model names (repeat the parameter)")
+):
+    """
+    Look up 2 or 3 phones side by side (model names are matched fuzzily)
+    """
+    def build() -> Dict[str, Any]:
+        service = get_mobile_data_service()
+        results, not_found = [], []
+        for model_name in models:
+            phone = service.get_mobile_by_model(model_name)
+            if phone is None:
+                not_found.append(model_name)
+            else:
+                results.append(phone)
+        return {"catalog_version": service.version, "count": len(results), "results": results, "not_found": not_found}
+
+    return await _conditional(request, build)
+
+
+@router.get("/phones/{model_name}", response_model=Dict[str, Any])
+async def get_phone(request: Request, model_name: str):
+    """
+    Get one phone by model name (matched fuzzily, e.g. "Galaxy S24")
+    """
+    return await _conditional(request, lambda: get_mobile_data_service().get_mobile_by_model(model_name))
+
+
+@router.get("/brands", response_model=BrandListResponse)
+async def list_brands(request: Request):
+    """
+    List the brands in the catalog
+    """
+    def build() -> Dict[str, Any]:
+        service = get_mobile_data_service()
+        return {"catalog_version": service.version, "brands": service.get_brands()}
+
+    return await _conditional(request, build)
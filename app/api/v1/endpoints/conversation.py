@@ -1,15 +1,23 @@
 import os
 import uuid
 import shutil
+import asyncio
 import logging
-from fastapi import APIRouter, HTTPException, status, File, UploadFile
-from fastapi.responses import JSONResponse
+from contextlib import aclosing
+from typing import Any, Awaitable, Dict, Optional, Tuple
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response, status, File, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
 # from app.utils.embeddings import load_and_upload_data
+from app.services.admission import AdmissionRejected
 from app.services.conversation_service import conversation_service
+from app.services.idempotency import IdempotencyConflict, get_idempotency_store
+from app.utils.serialization import dumps
 from app.schemas.conversation import (
     ConversationCreate, 
+    ConversationListResponse, 
     ConversationResponse, 
     MessageCreate, 
+    MessageHistoryResponse, 
     MessageResponse
 )
 
@@ -26,7 +34,7 @@ async def create_conversation(conversation_data: ConversationCreate):
     Takes a user's email and creates a new conversation with a unique ID.
     """
     try:
-        result = conversation_service.create_conversation(conversation_data.email)
+        result = await conversation_service.create_conversation(conversation_data.email)
         return result
     except Exception as e:
         logger.error(f"Failed to create conversation: {str(e)}")
@@ -36,19 +44,208 @@ async def create_conversation(conversation_data: ConversationCreate):
         )
 
 
+@router.get("/", response_model=ConversationListResponse)
+async def list_conversations(
+    email: str = Query(..., description="User's email address"),
+    limit: int = Query(20, ge=1, le=100, description="Page size"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page")
+):
+    """
+    List a user's conversations, newest first
+    
+    Pages are read from an (email, created_at) index by keyset, so a page
+    costs the same however many conversations there are. Pass next_cursor
+    back as cursor to get the next page.
+    """
+    try:
+        return await conversation_service.list_conversations(email, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"Failed to list conversations: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to list conversations: {str(e)}"
+        )
+
+
+@router.get("/{conversation_id}/messages", response_model=MessageHistoryResponse)
+async def get_conversation_messages(
+    conversation_id: str,
+    limit: int = Query(50, ge=1, le=200, description="Page size"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page")
+):
+    """
+    Page through a conversation's history, latest messages first
+    
+    Each page holds messages in conversation order; pass next_cursor back as
+    cursor to get the messages before them.
+    """
+    try:
+        result = await conversation_service.get_messages(conversation_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"Failed to load messages: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to load messages: {str(e)}"
+        )
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Conversation with ID {conversation_id} not found"
+        )
+    return result
+
+
+# Status logged for requests whose client went away (nginx's "client closed request")
+CLIENT_CLOSED_REQUEST = 499
+
+
+class ClientDisconnected(Exception):
+    """The client closed the connection before the response was ready"""
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    # The body has been read, so the next message is the disconnect
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def _cancel_on_disconnect(request: Request, call: Awaitable[Any]) -> Any:
+    """
+    Await call, cancelling it if the client disconnects first
+    
+    Raises:
+        ClientDisconnected: If the client went away and call was cancelled
+    """
+    task = asyncio.ensure_future(call)
+    disconnected = asyncio.create_task(_wait_for_disconnect(request))
+    try:
+        await asyncio.wait({task, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        disconnected.cancel()
+    if not task.done():
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        raise ClientDisconnected()
+    return task.result()
+
+
+async def _message_response(message_data: MessageCreate, idempotency_key: Optional[str]) -> Tuple[Dict[str, Any], bool]:
+    """The message's response, and whether it was replayed for a repeated Idempotency-Key"""
+    def run():
+        return conversation_service.get_message_response(message_data.conversation_id, message_data.user_message)
+    
+    store = get_idempotency_store() if idempotency_key else None
+    if store is None:
+        return await run(), False
+    return await store.run(
+        f"{message_data.conversation_id}:{idempotency_key}",
+        store.fingerprint(message_data.conversation_id, message_data.user_message),
+        run
+    )
+
+
 @router.post("/message", response_model=MessageResponse)
-async def send_message(message_data: MessageCreate):
+async def send_message(
+    request: Request,
+    response: Response,
+    message_data: MessageCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=255, description="Client-chosen key, reused when retrying the request")
+):
     """
     Send a message to an existing conversation
     
     Takes a conversation ID and user message, returns a response.
+    Returns 429 with Retry-After when the worker has no agent run slot free
+    or the user is over their message rate. If the client disconnects first
+    the agent run is cancelled, freeing its slot.
+    
+    Retries that send the same Idempotency-Key get the first request's
+    response (with Idempotent-Replayed: true) instead of running it again,
+    so a request with a key runs to the end even if its client disconnects.
+    Reusing a key for a different message returns 422, and a retry whose
+    original request is still running after IDEMPOTENCY_WAIT_SECONDS
+    returns 409.
+    """
+    try:
+        call = _message_response(message_data, idempotency_key)
+        if idempotency_key and get_idempotency_store() is not None:
+            # The client will retry after a network error; finishing the run
+            # lets the retry pick up the response instead of starting over
+            result, replayed = await call
+        else:
+            result, replayed = await _cancel_on_disconnect(request, call)
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        return result
+    except ClientDisconnected:
+        # Nobody is left to read a response
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    except IdempotencyConflict as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY if e.reason == "mismatch" else status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"Failed to process message: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to process message: {str(e)}"
+        ) 
+
+
+def _too_many_requests(error: AdmissionRejected) -> HTTPException:
+    """429 telling the client when to retry a request that was not admitted"""
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+
+def _format_sse(event: str, data) -> str:
+    """Format a single Server-Sent Events frame"""
+    return f"event: {event}\ndata: {dumps(data)}\n\n"
+
+
+@router.post("/message/stream")
+async def stream_message(message_data: MessageCreate):
+    """
+    Send a message to an existing conversation and stream the response
+    
+    Returns a text/event-stream with token, tool_call_start, tool_call_end,
+    products, done and error events. The conversation is persisted once the
+    agent has finished. If the client disconnects first, the response stops
+    and the agent run is cancelled along with it.
     """
     try:
-        result = await conversation_service.get_message_response(
+        events = await conversation_service.stream_message_response(
             message_data.conversation_id,
             message_data.user_message
         )
-        return result
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -59,4 +256,92 @@ async def send_message(message_data: MessageCreate):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to process message: {str(e)}"
-        ) 
\ No newline at end of file
+        )
+    
+    async def event_stream():
+        # Flush an initial frame right away so the client gets its first byte
+        yield _format_sse("start", {"conversation_id": message_data.conversation_id})
+        async for event in events:
+            yield _format_sse(event["event"], event["data"])
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.websocket("/ws/{conversation_id}")
+async def conversation_websocket(websocket: WebSocket, conversation_id: str):
+    """
+    Chat over a WebSocket connection
+    
+    The client sends {"user_message": "..."} frames and receives the same
+    events as the streaming endpoint as JSON frames ({"event": ..., "data": ...}).
+    Conversation state is kept in memory for the life of the connection.
+    """
+    await websocket.accept()
+    
+    try:
+        session = await conversation_service.open_session(conversation_id)
+    except ValueError as e:
+        await websocket.send_json({"event": "error", "data": {"detail": str(e)}})
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    except Exception as e:
+        logger.error(f"Failed to open conversation session: {str(e)}")
+        await websocket.send_json({"event": "error", "data": {"detail": f"Failed to open conversation: {str(e)}"}})
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+        return
+    
+    # Frames are read all along, so a disconnect is noticed while a turn runs
+    inbox: asyncio.Queue = asyncio.Queue()
+    receiver = asyncio.create_task(_receive_frames(websocket, inbox))
+    turn = None
+    try:
+        while True:
+            message = await inbox.get()
+            if message is None:
+                break
+            user_message = message.get("user_message") if isinstance(message, dict) else None
+            if not user_message:
+                await websocket.send_json({"event": "error", "data": {"detail": "user_message is required"}})
+                continue
+            
+            turn = asyncio.create_task(_send_turn(websocket, session, user_message))
+            await asyncio.wait({turn, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if not turn.done():
+                # The client went away mid-turn; stop the agent run
+                turn.cancel()
+                await asyncio.gather(turn, return_exceptions=True)
+                break
+            if turn.exception() is not None:
+                raise turn.exception()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        logger.info(f"WebSocket disconnected for conversation: {conversation_id}")
+        if turn is not None and not turn.done():
+            turn.cancel()
+        receiver.cancel()
+        await session.close()
+
+
+async def _receive_frames(websocket: WebSocket, inbox: asyncio.Queue) -> None:
+    """Put the client's JSON frames in inbox, then None once the connection is closed"""
+    try:
+        while True:
+            inbox.put_nowait(await websocket.receive_json())
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.warning(f"Closing WebSocket after an unreadable frame: {e}")
+    finally:
+        inbox.put_nowait(None)
+
+
+async def _send_turn(websocket: WebSocket, session: Any, user_message: str) -> None:
+    """Run one chat turn and send its events; cancelling this cancels the agent run"""
+    async with aclosing(session.send_message(user_message)) as events:
+        async for event in events:
+            await websocket.send_text(dumps(event))
@@ -39,12 +39,37 @@ async def health_details():
         mobile_data_status = f"error: {str(e)}"
         mobile_data_info = None
     
+    from app.Chat_Workflow.fast_path import fast_path_router
+    from app.Chat_Workflow.llm_policy import agent_run_policy
+    from app.Chat_Workflow.orchestrator import workflow_flights
+    from app.Chat_Workflow.tool_steps import get_tool_step_stats
+    from app.services.admission import admission_controller
+    from app.utils.tracing import get_stage_stats
+    from app.services.conversation_cache import conversation_cache
+    from app.services.idempotency import get_idempotency_store
+    from app.services.response_cache import get_response_cache
+    from app.services.retention import retention_job
+    from app.services.write_behind import write_behind
+    response_cache = get_response_cache()
+    idempotency_store = get_idempotency_store()
+    
     return {
         "status": "ok",
         "details": {
             "openai_api": openai_key_status,
             "mobile_data_service": mobile_data_status,
             "mobile_data": mobile_data_info,
+            "fast_path": fast_path_router.get_stats() if settings.FAST_PATH_ENABLED else "disabled",
+            "response_cache": response_cache.get_stats() if response_cache else "disabled",
+            "llm_policy": agent_run_policy.get_stats(),
+            "conversation_cache": conversation_cache.get_stats() if conversation_cache else "disabled",
+            "write_behind": write_behind.get_stats() if settings.WRITE_BEHIND_ENABLED else "disabled",
+            "retention": retention_job.get_stats() if settings.RETENTION_ENABLED else "disabled",
+            "admission": admission_controller.get_stats(),
+            "idempotency": idempotency_store.get_stats() if idempotency_store else "disabled",
+            "single_flight": {**workflow_flights.stats, "in_flight": workflow_flights.in_flight()},
+            "tool_steps": get_tool_step_stats(),
+            "stages": get_stage_stats(),
             "environment": settings.ENVIRONMENT,
             "app_name": settings.APP_NAME
         }
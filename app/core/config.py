@@ -17,13 +17,138 @@ class Settings(BaseSettings):
     # OpenAI settings
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     
+    # LLM provider: "openai", or "fake" for the scripted stand-in used in load tests
+    LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "openai")
+    FAKE_LLM_LATENCY_MS: float = float(os.getenv("FAKE_LLM_LATENCY_MS", "300"))
+    FAKE_LLM_TOKEN_DELAY_MS: float = float(os.getenv("FAKE_LLM_TOKEN_DELAY_MS", "5"))
+    FAKE_LLM_SCRIPT: str = os.getenv("FAKE_LLM_SCRIPT", "")
+    # Per-HTTP-call timeout and retries of the OpenAI client
+    LLM_REQUEST_TIMEOUT_SECONDS: float = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "60"))
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "3"))
+    
     # Mobile Data JSON path
     MOBILE_DATA_JSON_PATH: str = os.getenv("MOBILE_DATA_JSON_PATH", "mobile_phones_data.json")
+    # How long browsers and CDNs may reuse catalog API responses before
+    # revalidating them (by ETag, answered with 304 while the catalog is unchanged)
+    CATALOG_CACHE_MAX_AGE_SECONDS: int = int(os.getenv("CATALOG_CACHE_MAX_AGE_SECONDS", "300"))
+    
+    # Conversation store: "mongodb", "sqlite" (single node, no MongoDB server)
+    # or "memory" (tests and benchmarks; lost on restart)
+    CONVERSATION_STORE_BACKEND: str = os.getenv("CONVERSATION_STORE_BACKEND", "mongodb")
+    SQLITE_PATH: str = os.getenv("SQLITE_PATH", "data/conversations.db")
     
-    # MongoDB settings (required for conversation storage)
+    # MongoDB settings (required for the mongodb conversation store)
     MONGODB_URI: str = os.getenv("MONGODB_URI", "")
     MONGODB_DB_NAME: str = os.getenv("MONGODB_DB_NAME", "mobile_shopping_chatbot")
+    # Connection pool of each MongoDB client; requests wait at most
+    # MONGODB_WAIT_QUEUE_TIMEOUT_MS for a free connection
+    MONGODB_MAX_POOL_SIZE: int = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+    MONGODB_MIN_POOL_SIZE: int = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+    MONGODB_MAX_IDLE_TIME_MS: int = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000"))
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS: int = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "10000"))
+    # Messages per document in the conversation_messages collection
+    MESSAGE_BUCKET_SIZE: int = int(os.getenv("MESSAGE_BUCKET_SIZE", "50"))
+    # Write-behind: conversation messages are queued and written in batches
+    # every WRITE_BEHIND_FLUSH_INTERVAL_MS instead of on the response path;
+    # appends wait once WRITE_BEHIND_MAX_PENDING_MESSAGES are queued
+    WRITE_BEHIND_ENABLED: bool = os.getenv("WRITE_BEHIND_ENABLED", "True").lower() == "true"
+    WRITE_BEHIND_FLUSH_INTERVAL_MS: float = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL_MS", "50"))
+    WRITE_BEHIND_MAX_PENDING_MESSAGES: int = int(os.getenv("WRITE_BEHIND_MAX_PENDING_MESSAGES", "10000"))
+    WRITE_BEHIND_MAX_RETRIES: int = int(os.getenv("WRITE_BEHIND_MAX_RETRIES", "8"))
+    # Recently active conversations kept in process, so their turns skip the
+    # history read (0 = off); a version check against MongoDB keeps them current
+    CONVERSATION_CACHE_MAX_ENTRIES: int = int(os.getenv("CONVERSATION_CACHE_MAX_ENTRIES", "1000"))
+    # Retention: conversations idle for RETENTION_IDLE_DAYS are compressed
+    # into the archive, which is deleted after RETENTION_ARCHIVE_TTL_DAYS
+    # (0 = keep archives); the job runs every RETENTION_INTERVAL_MINUTES
+    RETENTION_ENABLED: bool = os.getenv("RETENTION_ENABLED", "False").lower() == "true"
+    RETENTION_IDLE_DAYS: float = float(os.getenv("RETENTION_IDLE_DAYS", "180"))
+    RETENTION_ARCHIVE_TTL_DAYS: float = float(os.getenv("RETENTION_ARCHIVE_TTL_DAYS", "730"))
+    RETENTION_INTERVAL_MINUTES: float = float(os.getenv("RETENTION_INTERVAL_MINUTES", "60"))
+    RETENTION_BATCH_SIZE: int = int(os.getenv("RETENTION_BATCH_SIZE", "100"))
+    
+    # Fast path: answer simple queries (brand lists, plain searches, exact model
+    # details) directly from the tools without an LLM round trip
+    FAST_PATH_ENABLED: bool = os.getenv("FAST_PATH_ENABLED", "True").lower() == "true"
+    
+    # Response cache for first-turn questions: "memory", "redis", "local_redis" or "none"
+    RESPONSE_CACHE_BACKEND: str = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+    RESPONSE_CACHE_TTL_SECONDS: int = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+    REDIS_URL: str = os.getenv("REDIS_URL", "")
+    
+    # Idempotency-Key support on POST /conversation/message: responses are kept
+    # for IDEMPOTENCY_TTL_SECONDS in IDEMPOTENCY_BACKEND ("memory", "redis",
+    # "local_redis" or "none"), and a retry of a request that is still running
+    # waits up to IDEMPOTENCY_WAIT_SECONDS for its response. A running request
+    # holds its key for IDEMPOTENCY_PENDING_TTL_SECONDS (0 = the longest a
+    # request can run: admission wait + agent deadline(s) + 30s)
+    IDEMPOTENCY_BACKEND: str = os.getenv("IDEMPOTENCY_BACKEND", "memory")
+    IDEMPOTENCY_TTL_SECONDS: int = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600"))
+    IDEMPOTENCY_WAIT_SECONDS: float = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "60"))
+    IDEMPOTENCY_PENDING_TTL_SECONDS: float = float(os.getenv("IDEMPOTENCY_PENDING_TTL_SECONDS", "0"))
+    IDEMPOTENCY_MAX_ENTRIES: int = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+    
+    # Admission control for chat messages: at most ADMISSION_MAX_CONCURRENT_RUNS
+    # agent runs per worker (0 = unlimited), ADMISSION_MAX_QUEUE requests waiting
+    # up to ADMISSION_QUEUE_TIMEOUT_SECONDS for a slot, and a token bucket per
+    # email of ADMISSION_RATE_PER_MINUTE messages with bursts of ADMISSION_BURST
+    # (0 = no per-user limit); everything else gets a 429 with Retry-After
+    ADMISSION_MAX_CONCURRENT_RUNS: int = int(os.getenv("ADMISSION_MAX_CONCURRENT_RUNS", "32"))
+    ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "5"))
+    ADMISSION_RATE_PER_MINUTE: float = float(os.getenv("ADMISSION_RATE_PER_MINUTE", "20"))
+    ADMISSION_BURST: int = int(os.getenv("ADMISSION_BURST", "10"))
     
+    # Coalesce identical concurrent agent runs into one
+    SINGLE_FLIGHT_ENABLED: bool = os.getenv("SINGLE_FLIGHT_ENABLED", "True").lower() == "true"
+    
+    # Conversation memory: token budgets for the recent-message tail and the
+    # rolling summary of older turns, the cap on a single message, and how many
+    # recent messages are loaded to fill the tail (the tail holds at most two
+    # fewer, so messages are summarized before they leave the loaded window)
+    MEMORY_TAIL_TOKEN_BUDGET: int = int(os.getenv("MEMORY_TAIL_TOKEN_BUDGET", "1200"))
+    MEMORY_SUMMARY_TOKEN_BUDGET: int = int(os.getenv("MEMORY_SUMMARY_TOKEN_BUDGET", "400"))
+    MEMORY_MAX_MESSAGE_TOKENS: int = int(os.getenv("MEMORY_MAX_MESSAGE_TOKENS", "400"))
+    MEMORY_WINDOW_MESSAGES: int = int(os.getenv("MEMORY_WINDOW_MESSAGES", "20"))
+    
+    # Response compression: bodies of at least COMPRESSION_MIN_SIZE_BYTES are
+    # sent brotli- or gzip-encoded, whichever the client accepts; streamed
+    # responses are never compressed. Bodies of at least
+    # COMPRESSION_THREAD_MIN_SIZE_BYTES (about 0.15ms of gzip, twice the cost
+    # of the thread handoff) are compressed off the event loop
+    COMPRESSION_ENABLED: bool = os.getenv("COMPRESSION_ENABLED", "True").lower() == "true"
+    COMPRESSION_MIN_SIZE_BYTES: int = int(os.getenv("COMPRESSION_MIN_SIZE_BYTES", "1024"))
+    COMPRESSION_GZIP_LEVEL: int = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+    COMPRESSION_BROTLI_QUALITY: int = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+    COMPRESSION_THREAD_MIN_SIZE_BYTES: int = int(os.getenv("COMPRESSION_THREAD_MIN_SIZE_BYTES", "16384"))
+    
+    # Encoder of JSON responses: "pydantic" (FastAPI's own, from 0.130), "orjson"
+    # (FastJSONResponse) or "auto" (pydantic where FastAPI supports it)
+    JSON_RESPONSE_ENCODER: str = os.getenv("JSON_RESPONSE_ENCODER", "auto")
+    
+    # Log the span tree of HTTP requests slower than this many milliseconds (0 = off)
+    SLOW_REQUEST_LOG_MS: float = float(os.getenv("SLOW_REQUEST_LOG_MS", "0"))
+    
+    # Agent run deadline: the AGENT_TIMEOUT_PERCENTILE latency of recent runs
+    # times AGENT_TIMEOUT_MULTIPLIER, clamped to the min/max (max until warmed up)
+    AGENT_TIMEOUT_PERCENTILE: float = float(os.getenv("AGENT_TIMEOUT_PERCENTILE", "0.99"))
+    AGENT_TIMEOUT_MULTIPLIER: float = float(os.getenv("AGENT_TIMEOUT_MULTIPLIER", "2.0"))
+    AGENT_TIMEOUT_MIN_SECONDS: float = float(os.getenv("AGENT_TIMEOUT_MIN_SECONDS", "10"))
+    AGENT_TIMEOUT_MAX_SECONDS: float = float(os.getenv("AGENT_TIMEOUT_MAX_SECONDS", "60"))
+    # Hedging: start a second agent run for non-streaming requests still
+    # running after the HEDGE_PERCENTILE latency; the first to finish wins
+    HEDGE_ENABLED: bool = os.getenv("HEDGE_ENABLED", "False").lower() == "true"
+    HEDGE_PERCENTILE: float = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+    # Circuit breaker: skip the LLM for the cooldown after this many
+    # consecutive failed or timed out runs (0 = never open)
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5"))
+    CIRCUIT_BREAKER_COOLDOWN_SECONDS: float = float(os.getenv("CIRCUIT_BREAKER_COOLDOWN_SECONDS", "30"))
+    # Answer from plain search results when the LLM fails, times out or the
+    # circuit is open (otherwise the error is returned)
+    DEGRADED_FALLBACK_ENABLED: bool = os.getenv("DEGRADED_FALLBACK_ENABLED", "True").lower() == "true"
+
     # API version
     API_VERSION: str = os.getenv("API_VERSION", "1.0.0")
     
@@ -0,0 +1,207 @@
+"""
+Middleware - Request tracing, HTTP metrics and response compression
+"""
+import asyncio
+import gzip
+import logging
+import time
+from typing import Any, Callable, Awaitable, Dict, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.core.config import settings
+from app.utils.metrics import http_requests_total, http_request_duration_seconds
+from app.utils.tracing import Span, use_span
+
+try:
+    import brotli
+except ImportError:  # A dependency, but responses are gzipped without it
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class TracingMiddleware:
+    """
+    Opens a root span per HTTP request, records request count and latency by
+    route, and logs the span tree of requests slower than SLOW_REQUEST_LOG_MS.
+
+    Written as plain ASGI middleware so streamed responses are timed until
+    their last byte and spans opened while streaming stay in the tree.
+    """
+
+    def __init__(self, app: Callable, slow_request_ms: float = 0):
+        self.app = app
+        self.slow_request_ms = slow_request_ms
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        root = Span("request", {"method": scope["method"], "path": scope["path"]})
+        status_code = 500
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            with use_span(root):
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = root.end()
+            route_path = _route_label(scope)
+            root.attrs["status"] = status_code
+            http_requests_total.inc(method=scope["method"], route=route_path, status=str(status_code))
+            http_request_duration_seconds.observe(duration, method=scope["method"], route=route_path)
+            if self.slow_request_ms and duration * 1000 >= self.slow_request_ms:
+                logger.warning(f"🐢 Slow request {scope['method']} {scope['path']} took {duration * 1000:.0f}ms\n{root.format_tree()}")
+
+
+def _route_label(scope: Scope) -> str:
+    """
+    Route template of the request ("/api/v1/phones/{model_name}"), so metric
+    label cardinality stays bounded; unmatched paths share one label
+    """
+    if scope.get("route") is None:
+        return "unmatched"
+    path = scope["path"]
+    for name, value in scope.get("path_params", {}).items():
+        path = path.replace(f"/{value}", "/{" + name + "}", 1)
+    return path
+
+
+def add_tracing_middleware(application: Any) -> None:
+    application.add_middleware(TracingMiddleware, slow_request_ms=settings.SLOW_REQUEST_LOG_MS)
+
+
+class CompressionMiddleware:
+    """
+    Compresses response bodies of at least minimum_size bytes with brotli
+    (when installed) or gzip, whichever the client's Accept-Encoding prefers.
+
+    Only responses sent in one piece are compressed. Streamed responses
+    (the SSE endpoint) pass through as they are produced, since buffering
+    them would hold back every event. Bodies of at least thread_min_size
+    bytes are compressed in a worker thread, so the event loop keeps
+    serving other requests meanwhile.
+    """
+
+    def __init__(
+        self,
+        app: Callable,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        thread_min_size: int = 16384
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.thread_min_size = thread_min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        # In order of preference when the client accepts both equally
+        self.encodings: Tuple[str, ...] = ("br", "gzip") if brotli is not None else ("gzip",)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        start_message = None
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Held back until the body shows whether it comes in one piece
+                start_message = message
+                return
+            if start_message is None:
+                await send(message)
+                return
+            start, start_message = start_message, None
+            if message["type"] != "http.response.body" or message.get("more_body", False):
+                await send(start)
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start["headers"])
+            if len(body) < self.minimum_size or "content-encoding" in headers or start["status"] in (204, 304):
+                await send(start)
+                await send(message)
+                return
+
+            headers.add_vary_header("Accept-Encoding")
+            if encoding is not None:
+                if len(body) >= self.thread_min_size:
+                    compressed = await asyncio.to_thread(self.compress, body, encoding)
+                else:
+                    compressed = self.compress(body, encoding)
+                if len(compressed) < len(body):
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(compressed))
+                    body = compressed
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+
+def negotiate_encoding(accept_encoding: str, available: Tuple[str, ...]) -> Optional[str]:
+    """
+    Pick the content coding to use from an Accept-Encoding header
+
+    Args:
+        accept_encoding: Accept-Encoding header value, e.g. "gzip, br;q=0.9"
+        available: Codings the server supports, most preferred first
+
+    Returns:
+        The accepted coding with the highest q-value (ties go to the
+        server's preference), or None to send the body as is
+    """
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+
+    best, best_weight = None, 0.0
+    for coding in available:
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def add_compression_middleware(application: Any) -> None:
+    if settings.COMPRESSION_ENABLED:
+        application.add_middleware(
+            CompressionMiddleware,
+            minimum_size=settings.COMPRESSION_MIN_SIZE_BYTES,
+            gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+            brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+            thread_min_size=settings.COMPRESSION_THREAD_MIN_SIZE_BYTES
+        )
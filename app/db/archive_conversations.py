@@ -0,0 +1,56 @@
+"""
+Archive idle conversations
+
+Runs the retention job (see app/services/retention.py) once against the
+configured conversation store, for deployments that schedule it with cron
+instead of RETENTION_ENABLED. It is safe to re-run and to run while the app
+is serving.
+
+Usage:
+    python -m app.db.archive_conversations
+    python -m app.db.archive_conversations --dry-run
+    python -m app.db.archive_conversations --idle-days 30
+"""
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+from app.services.conversation_store import get_conversation_store
+from app.services.retention import retention_job
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Move idle conversations into the compressed archive")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the idle conversations")
+    parser.add_argument("--idle-days", type=float, default=None, help="Override RETENTION_IDLE_DAYS")
+    parser.add_argument("--limit", type=int, default=100000, help="Count at most this many conversations (dry run)")
+    return parser.parse_args()
+
+
+async def main() -> None:
+    args = parse_args()
+    if args.idle_days is not None:
+        retention_job.idle_days = args.idle_days
+    store = get_conversation_store()
+    await store.open()
+    try:
+        if args.dry_run:
+            cutoff = datetime.now(timezone.utc) - timedelta(days=retention_job.idle_days)
+            idle = await store.find_idle(cutoff, args.limit)
+            print(f"{len(idle)} conversations idle for more than {retention_job.idle_days:g} days")
+            return
+        run = await retention_job.run_once()
+    finally:
+        await store.close()
+    print(
+        f"Archived {run['archived']} conversations ({run['bytes_reclaimed']} bytes -> "
+        f"{run['archive_bytes']} compressed), skipped {run['skipped']}, failed {run['failed']}, "
+        f"purged {run['purged']} expired archives"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
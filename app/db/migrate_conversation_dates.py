@@ -0,0 +1,86 @@
+"""
+Migrate conversation creation times to BSON dates
+
+Earlier versions stored created_at as an ISO 8601 string. Strings and dates
+do not compare with each other in MongoDB, so conversations still holding
+strings sort after every dated one and are skipped by listing cursors. This
+rewrites them as dates. It is safe to re-run and to run while the app is
+serving.
+
+Usage:
+    python -m app.db.migrate_conversation_dates
+    python -m app.db.migrate_conversation_dates --dry-run
+"""
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from app.db.mongodb import mongodb
+from app.services.message_store import message_store
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Store conversation creation times as dates")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the conversations left to migrate")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Conversations updated per bulk write")
+    return parser.parse_args()
+
+
+async def migrate(dry_run: bool = False, batch_size: int = 1000) -> int:
+    """
+    Convert every string created_at to a date
+
+    Args:
+        dry_run: Only count the conversations left to migrate
+        batch_size: Conversations updated per bulk write
+
+    Returns:
+        Number of conversations migrated (or left to migrate, for a dry run)
+    """
+    conversations = mongodb.get_async_collection(message_store.conversations_collection)
+    legacy = {"created_at": {"$type": "string"}}
+    if dry_run:
+        return await conversations.count_documents(legacy)
+
+    await message_store.ensure_indexes()
+    documents = await conversations.find(legacy, projection={"created_at": 1}).to_list(None)
+    migrated = 0
+    for start in range(0, len(documents), batch_size):
+        writes = []
+        for conversation in documents[start:start + batch_size]:
+            try:
+                created_at = datetime.fromisoformat(conversation["created_at"])
+            except ValueError:
+                logger.warning(f"⚠️ Conversation {conversation['_id']} has an unreadable created_at: {conversation['created_at']}")
+                continue
+            # Only if it still holds the string that was read
+            writes.append(UpdateOne(
+                {"_id": conversation["_id"], "created_at": conversation["created_at"]},
+                {"$set": {"created_at": created_at}}
+            ))
+        if writes:
+            result = await conversations.bulk_write(writes, ordered=False)
+            migrated += result.modified_count
+    return migrated
+
+
+async def main() -> None:
+    args = parse_args()
+    mongodb.connect_to_mongodb()
+    try:
+        count = await migrate(args.dry_run, args.batch_size)
+    finally:
+        await mongodb.close_mongodb_connection()
+    if args.dry_run:
+        print(f"{count} conversations still store created_at as a string")
+    else:
+        print(f"Migrated created_at of {count} conversations to dates")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
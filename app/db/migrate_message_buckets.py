@@ -0,0 +1,72 @@
+"""
+Migrate conversations to bucketed message storage
+
+Moves the messages embedded in conversation documents into the
+conversation_messages collection (see app/services/message_store.py).
+Conversations are also migrated lazily the first time they are read, so
+this only needs to run to finish the job in bulk. It is safe to re-run and
+to run while the app is serving.
+
+Usage:
+    python -m app.db.migrate_message_buckets
+    python -m app.db.migrate_message_buckets --dry-run
+"""
+import argparse
+import asyncio
+import logging
+
+from app.db.mongodb import mongodb
+from app.services.message_store import message_store
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Move embedded conversation messages into buckets")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the conversations left to migrate")
+    parser.add_argument("--limit", type=int, default=0, help="Migrate at most this many conversations (0 = all)")
+    return parser.parse_args()
+
+
+async def migrate(dry_run: bool = False, limit: int = 0) -> int:
+    """
+    Migrate every conversation that still embeds its messages
+
+    Args:
+        dry_run: Only count the conversations left to migrate
+        limit: Stop after this many conversations (0 = all)
+
+    Returns:
+        Number of conversations migrated (or left to migrate, for a dry run)
+    """
+    conversations = mongodb.get_async_collection(message_store.conversations_collection)
+    legacy = {"messages": {"$exists": True}}
+    if dry_run:
+        return await conversations.count_documents(legacy)
+
+    await message_store.ensure_indexes()
+    cursor = conversations.find(legacy, projection={"_id": 1})
+    if limit:
+        cursor = cursor.limit(limit)
+    migrated = 0
+    for conversation in await cursor.to_list(None):
+        if await message_store.migrate_conversation(conversation["_id"]):
+            migrated += 1
+    return migrated
+
+
+async def main() -> None:
+    args = parse_args()
+    mongodb.connect_to_mongodb()
+    try:
+        count = await migrate(args.dry_run, args.limit)
+    finally:
+        await mongodb.close_mongodb_connection()
+    if args.dry_run:
+        print(f"{count} conversations still embed their messages")
+    else:
+        print(f"Migrated {count} conversations to bucketed message storage")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
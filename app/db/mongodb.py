@@ -1,4 +1,9 @@
-from pymongo import MongoClient
+import asyncio
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo import AsyncMongoClient, MongoClient
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
 from pymongo.database import Database
 from pymongo.collection import Collection
 from app.core.config import settings
@@ -9,22 +14,42 @@ logger = logging.getLogger(__name__)
 class MongoDB:
     client: MongoClient = None
     db: Database = None
+    # Async client used on the request path, so DB round trips never block the event loop
+    async_client: AsyncMongoClient = None
+    async_db: AsyncDatabase = None
+
+    @classmethod
+    def pool_options(cls) -> Dict[str, Any]:
+        """Connection pool settings shared by the sync and async clients"""
+        return {
+            "maxPoolSize": settings.MONGODB_MAX_POOL_SIZE,
+            "minPoolSize": settings.MONGODB_MIN_POOL_SIZE,
+            "maxIdleTimeMS": settings.MONGODB_MAX_IDLE_TIME_MS,
+            "waitQueueTimeoutMS": settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+            "serverSelectionTimeoutMS": settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        }
 
     @classmethod
     def connect_to_mongodb(cls):
         """Connect to MongoDB if not already connected"""
         if cls.client is None:
             try:
-                cls.client = MongoClient(settings.MONGODB_URI, tlsAllowInvalidCertificates=True)
+                cls.client = MongoClient(settings.MONGODB_URI, tlsAllowInvalidCertificates=True, **cls.pool_options())
                 cls.db = cls.client[settings.MONGODB_DB_NAME]
-                logger.info(f"Connected to MongoDB: {settings.MONGODB_DB_NAME}")
+                cls.async_client = AsyncMongoClient(settings.MONGODB_URI, tlsAllowInvalidCertificates=True, **cls.pool_options())
+                cls.async_db = cls.async_client[settings.MONGODB_DB_NAME]
+                logger.info(f"Connected to MongoDB: {settings.MONGODB_DB_NAME} (pool {cls.pool_options()})")
             except Exception as e:
                 logger.error(f"Failed to connect to MongoDB: {e}")
                 raise e
 
     @classmethod
-    def close_mongodb_connection(cls):
+    async def close_mongodb_connection(cls):
         """Close MongoDB connection"""
+        if cls.async_client is not None:
+            await cls.async_client.close()
+            cls.async_client = None
+            cls.async_db = None
         if cls.client is not None:
             cls.client.close()
             cls.client = None
@@ -33,11 +58,98 @@ class MongoDB:
 
     @classmethod
     def get_collection(cls, collection_name: str) -> Collection:
-        """Get a collection from the database"""
+        """Get a collection from the database (synchronous client, for scripts and jobs)"""
         if cls.db is None:
             print("Connecting to MongoDB")
             cls.connect_to_mongodb()
         return cls.db[collection_name]
 
+    @classmethod
+    def get_async_collection(cls, collection_name: str) -> AsyncCollection:
+        """
+        Get a collection for use from async code
+
+        When only a synchronous database has been set up (an in-memory
+        database in benchmarks), its calls run in worker threads instead.
+        """
+        if cls.async_db is None:
+            if cls.db is not None:
+                return ThreadedCollection(cls.db[collection_name])
+            cls.connect_to_mongodb()
+        return cls.async_db[collection_name]
+
+
+class ThreadedCollection:
+    """Async facade over a synchronous Collection; every call runs in a worker thread"""
+
+    def __init__(self, collection: Collection):
+        self._collection = collection
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        method = getattr(self._collection, name)
+
+        async def call(*args: Any, **kwargs: Any) -> Any:
+            return await asyncio.to_thread(method, *args, **kwargs)
+
+        return call
+
+    async def aggregate(self, pipeline: List[Dict[str, Any]], **kwargs: Any) -> "ThreadedCursor":
+        return ThreadedCursor(lambda: self._collection.aggregate(pipeline, **kwargs))
+
+    def find(self, *args: Any, **kwargs: Any) -> "ThreadedCursor":
+        return ThreadedCursor(lambda: self._collection.find(*args, **kwargs))
+
+    async def bulk_write(self, requests: List[Any], **kwargs: Any) -> Any:
+        return await asyncio.to_thread(bulk_write_compat, self._collection, requests, **kwargs)
+
+
+def bulk_write_compat(collection: Any, requests: List[Any], **kwargs: Any) -> Any:
+    """
+    collection.bulk_write, falling back to one update at a time
+
+    mongomock's bulk builder predates the sort option of pymongo's write
+    models, so in-memory databases apply UpdateOne requests in order instead.
+    """
+    try:
+        return collection.bulk_write(requests, **kwargs)
+    except TypeError:
+        for request in requests:
+            collection.update_one(request._filter, request._doc, upsert=bool(request._upsert))
+        return None
+
+
+class ThreadedCursor:
+    """Cursor of a ThreadedCollection; sort/skip/limit are applied when it is read"""
+
+    def __init__(self, open_cursor: Callable[[], Any]):
+        self._open_cursor = open_cursor
+        self._modifiers: List[tuple] = []
+
+    def sort(self, *args: Any, **kwargs: Any) -> "ThreadedCursor":
+        self._modifiers.append(("sort", args, kwargs))
+        return self
+
+    def skip(self, *args: Any, **kwargs: Any) -> "ThreadedCursor":
+        self._modifiers.append(("skip", args, kwargs))
+        return self
+
+    def limit(self, *args: Any, **kwargs: Any) -> "ThreadedCursor":
+        self._modifiers.append(("limit", args, kwargs))
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        def read() -> List[Dict[str, Any]]:
+            cursor = self._open_cursor()
+            for name, args, kwargs in self._modifiers:
+                cursor = getattr(cursor, name)(*args, **kwargs)
+            documents = []
+            for document in cursor:
+                documents.append(document)
+                if length is not None and len(documents) >= length:
+                    break
+            return documents
+
+        return await asyncio.to_thread(read)
+
 # Singleton instance
-mongodb = MongoDB() 
\ No newline at end of file
+mongodb = MongoDB()
@@ -1,13 +1,22 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 from app.core.config import settings
+from app.core.middleware import add_compression_middleware, add_tracing_middleware
+from app.core.responses import default_response_class
 from app.api.v1.api import api_router
-from app.db.mongodb import mongodb
 from app.services import initialize_services
+from app.services.conversation_memory import load_encoding
+from app.services.conversation_store import get_conversation_store
 from app.services.mobile_data_service import initialize_mobile_data_service
+from app.services.retention import retention_job
+from app.services.write_behind import write_behind
 from app.utils import log
+from app.utils.metrics import registry
+from app.utils.startup_profile import startup_profile
 
 import logging
 
@@ -19,46 +28,73 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting Mobile Shopping Chat Agent...")
     
-    # Connect to MongoDB
-    print("Connecting to MongoDB...")
-    try:
-        mongodb.connect_to_mongodb()
-        print("Connected to MongoDB successfully")
-    except Exception as e:
-        logger.error(f"Error connecting to MongoDB: {e}", exc_info=True)
-        raise
+    # The stages are independent, so they run concurrently: the catalog load,
+    # the tokenizer load and the agent build (with its imports) run in
+    # threads while the conversation store connects
+    async def open_store():
+        # Open the conversation store (MongoDB, SQLite or in-memory)
+        print(f"Opening {settings.CONVERSATION_STORE_BACKEND} conversation store...")
+        with startup_profile.stage("conversation_store"):
+            try:
+                await get_conversation_store().open()
+            except Exception as e:
+                logger.error(f"Error opening the conversation store: {e}", exc_info=True)
+                raise
+        print("Conversation store opened successfully")
     
-    # Initialize mobile data service (loads JSON)
-    print("Loading mobile phone data from JSON...")
-    try:
-        initialize_mobile_data_service()
+    async def load_catalog():
+        # Initialize mobile data service (loads JSON)
+        print("Loading mobile phone data from JSON...")
+        with startup_profile.stage("catalog"):
+            try:
+                await asyncio.to_thread(initialize_mobile_data_service)
+            except Exception as e:
+                logger.error(f"Error loading mobile data: {e}", exc_info=True)
+                raise
         print("Mobile phone data loaded successfully")
-    except Exception as e:
-        logger.error(f"Error loading mobile data: {e}", exc_info=True)
-        raise
     
-    # Initialize conversation service (creates agent)
-    print("Initializing mobile shopping agent...")
-    await initialize_services()
-    print("Mobile shopping agent initialized successfully")
+    async def load_tokenizer():
+        # Token counting for conversation memory (may download the BPE file)
+        with startup_profile.stage("tokenizer"):
+            await asyncio.to_thread(load_encoding)
     
-    logger.info("Application startup complete")
+    async def build_agent():
+        # Initialize conversation service (creates agent)
+        print("Initializing mobile shopping agent...")
+        with startup_profile.stage("agent"):
+            await initialize_services()
+        print("Mobile shopping agent initialized successfully")
+    
+    await asyncio.gather(open_store(), load_catalog(), load_tokenizer(), build_agent())
+    
+    # Archive idle conversations in the background
+    if settings.RETENTION_ENABLED:
+        retention_job.start()
+    
+    logger.info(f"🚀 Application startup complete: {startup_profile.summary()}")
     
     yield
     
     # Shutdown
     print("Shutting down...")
-    mongodb.close_mongodb_connection()
-    print("MongoDB connection closed")
+    await retention_job.close()
+    # Write the queued conversation messages before the connection goes away
+    await write_behind.close()
+    await get_conversation_store().close()
+    print("Conversation store closed")
     logger.info("Application shutdown complete")
 
 def create_application() -> FastAPI:
     application = FastAPI(
         title=settings.APP_NAME,
         debug=settings.DEBUG,
-        lifespan=lifespan
+        lifespan=lifespan,
+        default_response_class=default_response_class()
     )
 
+    # Compress large response bodies (innermost, so tracing times it too)
+    add_compression_middleware(application)
+
     # Add CORS middleware
     application.add_middleware(
         CORSMiddleware,
@@ -68,6 +104,9 @@ def create_application() -> FastAPI:
         allow_headers=["*"],
     )
 
+    # Trace every request (outermost, so CORS handling is timed too)
+    add_tracing_middleware(application)
+
     # Include API router
     application.include_router(api_router, prefix=settings.API_PREFIX)
 
@@ -90,6 +129,11 @@ def create_application() -> FastAPI:
     async def health_check():
         return {"status": "healthy"}
 
+    @application.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        """Prometheus metrics: request, stage, tool, cache and LLM token counters"""
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
     return application
 
 app = create_application() 
\ No newline at end of file
@@ -0,0 +1,145 @@
+"""
+Fake LLM - Deterministic stand-in for OpenAI, for load tests and local runs
+
+Replays scripted tool calls and answers with configurable latency, so the
+whole request path (MongoDB, history, agent workflow, tools) can be exercised
+without calling OpenAI. Select it with LLM_PROVIDER=fake.
+
+A script is a list of rules, checked in order against the user's query:
+
+    [
+        {
+            "match": "samsung",                       # regex, case-insensitive
+            "tool_calls": [
+                {"tool_name": "search_mobile_phones", "tool_kwargs": {"brand": "Samsung"}}
+            ],
+            "response": "Here are some Samsung phones."
+        }
+    ]
+
+The first matching rule is used: its tool calls are made in one step, then
+its response is streamed once the tool results are in.
+"""
+import asyncio
+import json
+import re
+from typing import Any, AsyncGenerator, Dict, List, Optional, Sequence
+
+from pydantic import Field, PrivateAttr
+from llama_index.core.base.llms.types import ChatMessage, ChatResponse, ChatResponseAsyncGen, MessageRole, ToolCallBlock
+from llama_index.core.llms.callbacks import llm_chat_callback
+from llama_index.core.llms.mock import MockFunctionCallingLLM
+
+DEFAULT_SCRIPT: List[Dict[str, Any]] = [
+    {
+        "match": r"\bbrands?\b",
+        "tool_calls": [{"tool_name": "get_brand_list", "tool_kwargs": {}}],
+        "response": "We carry phones from all the major brands. Which one would you like to explore?"
+    },
+    {
+        "match": r"\b(?:compare|vs|versus)\b",
+        "tool_calls": [
+            {"tool_name": "get_mobile_details", "tool_kwargs": {"model_name": "Galaxy S24"}},
+            {"tool_name": "get_mobile_details", "tool_kwargs": {"model_name": "Pixel 8a"}}
+        ],
+        "response": "The **Galaxy S24** has the brighter display, while the **Pixel 8a** has the better camera for the price."
+    },
+    {
+        "match": r"\b(?:details?|about|tell me)\b",
+        "tool_calls": [{"tool_name": "get_mobile_details", "tool_kwargs": {"model_name": "Galaxy S24"}}],
+        "response": "The **Galaxy S24** is a compact flagship with a great camera and a bright display."
+    },
+    {
+        "match": r".*",
+        "tool_calls": [
+            {"tool_name": "search_mobile_phones", "tool_kwargs": {"max_price_inr": 30000, "limit": 5}}
+        ],
+        "response": "Here are some great phones under ₹30,000. The **Galaxy A55** stands out for its display and battery life."
+    },
+]
+
+_QUERY_MARKER = "Current User Query:"
+
+
+class FakeLLM(MockFunctionCallingLLM):
+    """Function-calling LLM that follows a script and simulates OpenAI latency"""
+
+    script: List[Dict[str, Any]] = Field(default_factory=lambda: list(DEFAULT_SCRIPT))
+    latency_ms: float = Field(default=300.0, description="Delay before the first chunk of every response")
+    token_delay_ms: float = Field(default=5.0, description="Delay between streamed chunks")
+
+    _compiled: List[Any] = PrivateAttr(default_factory=list)
+    _call_counter: int = PrivateAttr(default=0)
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(is_chat_model=True, **kwargs)
+        self._compiled = [(re.compile(rule.get("match", ".*"), re.IGNORECASE), rule) for rule in self.script]
+        self._call_counter = 0
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeLLM"
+
+    def _next_message(self, messages: Sequence[ChatMessage]) -> ChatMessage:
+        rule = self._match_rule(messages)
+        # Tool results after the last user message mean the tools already ran
+        last_user = max((i for i, m in enumerate(messages) if m.role == MessageRole.USER), default=-1)
+        tools_done = any(m.role == MessageRole.TOOL for m in messages[last_user + 1:])
+
+        if rule.get("tool_calls") and not tools_done:
+            blocks = []
+            for call in rule["tool_calls"]:
+                self._call_counter += 1
+                blocks.append(ToolCallBlock(
+                    tool_call_id=f"fake_call_{self._call_counter}",
+                    tool_name=call["tool_name"],
+                    tool_kwargs=dict(call.get("tool_kwargs", {}))
+                ))
+            return ChatMessage(role=MessageRole.ASSISTANT, blocks=blocks)
+        return ChatMessage(role=MessageRole.ASSISTANT, content=rule.get("response", ""))
+
+    def _match_rule(self, messages: Sequence[ChatMessage]) -> Dict[str, Any]:
+        query = ""
+        for message in reversed(messages):
+            if message.role == MessageRole.USER:
+                query = message.content or ""
+                break
+        if _QUERY_MARKER in query:
+            query = query.split(_QUERY_MARKER, 1)[1]
+        for pattern, rule in self._compiled:
+            if pattern.search(query):
+                return rule
+        return {"response": "I can help you find a phone. What is your budget?"}
+
+    @llm_chat_callback()
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseAsyncGen:
+        message = self._next_message(messages)
+
+        async def gen() -> AsyncGenerator[ChatResponse, None]:
+            await asyncio.sleep(self.latency_ms / 1000)
+            if not message.content:
+                yield ChatResponse(message=message, delta="")
+                return
+            text = ""
+            words = re.findall(r"\S+\s*", message.content)
+            for index, word in enumerate(words):
+                if index and self.token_delay_ms:
+                    await asyncio.sleep(self.token_delay_ms / 1000)
+                text += word
+                yield ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=text), delta=word)
+
+        return gen()
+
+    @llm_chat_callback()
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        message = self._next_message(messages)
+        await asyncio.sleep(self.latency_ms / 1000)
+        return ChatResponse(message=message, delta=message.content or "")
+
+
+def load_script(path: Optional[str]) -> List[Dict[str, Any]]:
+    """Load a script from a JSON file, or return the default script"""
+    if not path:
+        return list(DEFAULT_SCRIPT)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
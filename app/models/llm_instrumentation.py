@@ -0,0 +1,89 @@
+"""
+LLM Instrumentation - Latency, call counts and token usage of LLM calls
+
+Listens to llama_index's instrumentation events, so every chat call made by
+the agent is timed as an "llm" span (nested under the agent span of the
+request) and its token usage is counted. Token counts come from the
+provider when it reports them and are estimated otherwise.
+"""
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events import BaseEvent
+from llama_index.core.instrumentation.events.exception import ExceptionEvent
+from llama_index.core.instrumentation.events.llm import LLMChatEndEvent, LLMChatStartEvent
+
+from app.services.conversation_memory import count_tokens
+from app.utils.metrics import llm_calls_total, llm_tokens_total
+from app.utils.tracing import Span, current_span, record
+
+logger = logging.getLogger(__name__)
+
+# Calls that never finish (cancelled streams) are dropped past this many
+MAX_OPEN_CALLS = 1000
+
+# call key -> (start time, parent span, model)
+_open_calls: Dict[Any, Tuple[float, Optional[Span], str]] = {}
+
+
+class LLMMetricsHandler(BaseEventHandler):
+    """Times LLM chat calls and counts their tokens"""
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LLMMetricsHandler"
+
+    def handle(self, event: BaseEvent, **kwargs: Any) -> None:
+        if isinstance(event, LLMChatStartEvent):
+            model = event.model_dict.get("model") or event.model_dict.get("class_name") or "unknown"
+            if len(_open_calls) >= MAX_OPEN_CALLS:
+                _open_calls.pop(next(iter(_open_calls)))
+            _open_calls[self._call_key(event)] = (time.perf_counter(), current_span(), model)
+        elif isinstance(event, LLMChatEndEvent):
+            call = _open_calls.pop(self._call_key(event), None)
+            if call is None:
+                return
+            started_at, parent, model = call
+            duration = time.perf_counter() - started_at
+            record("llm", duration, parent=parent, model=model)
+            llm_calls_total.inc(model=model, status="ok")
+            prompt_tokens, completion_tokens = self._token_usage(event)
+            llm_tokens_total.inc(prompt_tokens, model=model, kind="prompt")
+            llm_tokens_total.inc(completion_tokens, model=model, kind="completion")
+        elif isinstance(event, ExceptionEvent) and event.span_id is not None:
+            call = _open_calls.pop(event.span_id, None)
+            if call is not None:
+                llm_calls_total.inc(model=call[2], status="error")
+
+    @staticmethod
+    def _call_key(event: Any) -> Any:
+        # Start and end events of one call share the span id (and the messages list)
+        return event.span_id if event.span_id is not None else id(event.messages)
+
+    @staticmethod
+    def _token_usage(event: LLMChatEndEvent) -> Tuple[int, int]:
+        response = event.response
+        usage = response.additional_kwargs if response is not None else {}
+        prompt_tokens = usage.get("prompt_tokens")
+        completion_tokens = usage.get("completion_tokens")
+        if prompt_tokens is None:
+            prompt_tokens = sum(count_tokens(message.content or "") for message in event.messages)
+        if completion_tokens is None:
+            completion_tokens = count_tokens(response.message.content or "") if response is not None else 0
+        return prompt_tokens, completion_tokens
+
+
+_installed = False
+
+
+def install_llm_instrumentation() -> None:
+    """Register the handler on the root llama_index dispatcher (once)"""
+    global _installed
+    if _installed:
+        return
+    get_dispatcher().add_event_handler(LLMMetricsHandler())
+    _installed = True
+    logger.info("LLM instrumentation installed")
@@ -1,4 +1,3 @@
-from llama_index.llms.openai import OpenAI
 from app.core.config import settings
 
 def openai_model(reasoning: bool = False, temperature: float = 0.7):
@@ -10,8 +9,16 @@ def openai_model(reasoning: bool = False, temperature: float = 0.7):
     temperature: Temperature for generation (default 0.7 for conversational)
   
   Returns:
-    OpenAI model instance
+    OpenAI model instance (or the scripted FakeLLM when LLM_PROVIDER=fake)
   """
+  if settings.LLM_PROVIDER.lower() == "fake":
+    from app.models.fake_llm import FakeLLM, load_script
+    return FakeLLM(
+      script=load_script(settings.FAKE_LLM_SCRIPT),
+      latency_ms=settings.FAKE_LLM_LATENCY_MS,
+      token_delay_ms=settings.FAKE_LLM_TOKEN_DELAY_MS
+    )
+  
   # Use gpt-4o for now (gpt-5 doesn't exist yet)
   model = "gpt-4o-mini" if not reasoning else "gpt-4o"
   api_key = settings.OPENAI_API_KEY
@@ -19,9 +26,15 @@ def openai_model(reasoning: bool = False, temperature: float = 0.7):
   if not api_key:
     raise ValueError("OPENAI_API_KEY not set in environment variables")
   
+  # Imported here: the OpenAI client is slow to import and unused with LLM_PROVIDER=fake
+  from llama_index.llms.openai import OpenAI
+  
   return OpenAI(
     model=model, 
     temperature=temperature, 
     openai_api_key=api_key, 
-    timeout=180
+    timeout=settings.LLM_REQUEST_TIMEOUT_SECONDS,
+    max_retries=settings.LLM_MAX_RETRIES,
+    # Streamed responses only report token usage when asked to
+    additional_kwargs={"stream_options": {"include_usage": True}}
   )
\ No newline at end of file
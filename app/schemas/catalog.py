@@ -0,0 +1,17 @@
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List
+
+
+class PhoneListResponse(BaseModel):
+    catalog_version: str = Field(..., description="Version of the catalog snapshot the results come from")
+    count: int = Field(..., description="Number of phones returned")
+    results: List[Dict[str, Any]] = Field(..., description="Phone records")
+
+
+class PhoneCompareResponse(PhoneListResponse):
+    not_found: List[str] = Field(default_factory=list, description="Requested models with no match in the catalog")
+
+
+class BrandListResponse(BaseModel):
+    catalog_version: str = Field(..., description="Version of the catalog snapshot")
+    brands: List[str] = Field(..., description="Brand names, sorted")
@@ -13,6 +13,33 @@ class ConversationResponse(BaseModel):
     created_at: datetime = Field(..., description="Conversation creation timestamp")
 
 
+class ConversationSummary(BaseModel):
+    conversation_id: str = Field(..., description="Unique conversation ID")
+    email: EmailStr = Field(..., description="User's email address")
+    created_at: datetime = Field(..., description="Conversation creation timestamp")
+    message_count: int = Field(..., description="Number of messages in the conversation")
+
+
+class ConversationListResponse(BaseModel):
+    conversations: List[ConversationSummary] = Field(..., description="Conversations, newest first")
+    next_cursor: Optional[str] = Field(None, description="Cursor of the next page, absent on the last page")
+
+
+class HistoryMessage(BaseModel):
+    position: int = Field(..., description="Position of the message in the conversation")
+    role: str = Field(..., description="Message author (user or assistant)")
+    content: str = Field(..., description="Message text")
+    timestamp: Optional[datetime] = Field(None, description="Message timestamp")
+    interrupted: bool = Field(False, description="Whether the client went away before this answer was finished")
+
+
+class MessageHistoryResponse(BaseModel):
+    conversation_id: str = Field(..., description="Conversation ID")
+    messages: List[HistoryMessage] = Field(..., description="Messages in conversation order")
+    message_count: int = Field(..., description="Number of messages in the conversation")
+    next_cursor: Optional[str] = Field(None, description="Cursor of the older messages, absent on the first page")
+
+
 class MessageCreate(BaseModel):
     conversation_id: str = Field(..., description="Conversation ID")
     user_message: str = Field(..., description="User's message")
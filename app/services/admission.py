@@ -0,0 +1,211 @@
+"""
+Admission Control - Bounds the agent runs a worker takes on
+
+Without a bound, a burst of chat messages starts as many agent runs as
+there are requests, they all slow down together and many end up timing
+out. Instead each worker runs at most ADMISSION_MAX_CONCURRENT_RUNS at
+once. Up to ADMISSION_MAX_QUEUE more requests wait in line (first come,
+first served) for at most ADMISSION_QUEUE_TIMEOUT_SECONDS, and anything
+beyond that is turned away at once with a 429 and Retry-After, while
+the client can still retry elsewhere or later.
+
+Each email also has a token bucket of ADMISSION_RATE_PER_MINUTE messages
+with bursts of ADMISSION_BURST, so a single user cannot fill the queue.
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.utils.metrics import (
+    admission_in_flight,
+    admission_queue_depth,
+    admission_requests_total,
+    admission_wait_seconds,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """The request was not admitted; the client should retry after retry_after seconds"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Too many requests ({reason}), retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """An admitted request's agent run slot; release() it when the run is over"""
+
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller._release()
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded wait queue, plus per-key rate limits"""
+
+    def __init__(
+        self,
+        max_concurrent: int = 32,
+        max_queue: int = 64,
+        queue_timeout: float = 5.0,
+        rate_per_minute: float = 20.0,
+        burst: int = 10,
+        max_tracked_keys: int = 100000
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rate_per_second = rate_per_minute / 60
+        self.burst = burst
+        self.max_tracked_keys = max_tracked_keys
+        self._in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # key -> (tokens, time of the last refill)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self.stats = {"admitted": 0, "queued": 0, "rate_limited": 0, "queue_full": 0, "queue_timeout": 0}
+
+    async def acquire(self, key: Optional[str] = None) -> Ticket:
+        """
+        Admit a request, waiting in the queue for a free slot if needed
+
+        Args:
+            key: Rate limit key (the user's email), or None to skip the rate limit
+
+        Returns:
+            Ticket holding the slot
+
+        Raises:
+            AdmissionRejected: If the key is over its rate, or no slot frees up in time
+        """
+        rate_limited = bool(key) and self.rate_per_second > 0
+        if rate_limited:
+            self._take_token(key)
+
+        if self.max_concurrent <= 0:
+            return self._admitted(0.0)
+        if self._in_flight < self.max_concurrent and not self._waiters:
+            self._in_flight += 1
+            return self._admitted(0.0)
+        if len(self._waiters) >= self.max_queue:
+            if rate_limited:
+                # A request turned away for capacity does not count against the user
+                self._refund_token(key)
+            self._reject("queue_full", self._queue_retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.stats["queued"] += 1
+        self._update_gauges()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._remove_waiter(waiter)
+            # The slot may have been handed over just as the wait timed out
+            if not (waiter.done() and not waiter.cancelled()):
+                if rate_limited:
+                    self._refund_token(key)
+                self._reject("queue_timeout", self._queue_retry_after())
+        except asyncio.CancelledError:
+            # The client went away; pass on a slot that was already handed over
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            self._remove_waiter(waiter)
+            raise
+        # The releasing request handed its slot over, so _in_flight is unchanged
+        return self._admitted(time.perf_counter() - started)
+
+    def _take_token(self, key: str) -> None:
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(key, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - last) * self.rate_per_second)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            self._reject("rate_limited", math.ceil((1 - tokens) / self.rate_per_second))
+        self._buckets[key] = (tokens - 1, now)
+        while len(self._buckets) > self.max_tracked_keys:
+            self._buckets.popitem(last=False)
+
+    def _refund_token(self, key: str) -> None:
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            self._buckets[key] = (min(float(self.burst), bucket[0] + 1), bucket[1])
+
+    def _queue_retry_after(self) -> int:
+        return max(1, math.ceil(self.queue_timeout))
+
+    def _admitted(self, waited: float) -> Ticket:
+        self.stats["admitted"] += 1
+        admission_requests_total.inc(outcome="admitted")
+        if waited:
+            admission_wait_seconds.observe(waited)
+        self._update_gauges()
+        return Ticket(self)
+
+    def _reject(self, reason: str, retry_after: int) -> None:
+        self.stats[reason] += 1
+        admission_requests_total.inc(outcome=reason)
+        self._update_gauges()
+        logger.warning(f"🚦 Request rejected ({reason}), retry after {retry_after}s")
+        raise AdmissionRejected(reason, retry_after)
+
+    def _release(self) -> None:
+        if self.max_concurrent <= 0:
+            return
+        # Hand the slot straight to the next waiter, so it cannot be overtaken
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+        self._in_flight -= 1
+        self._update_gauges()
+
+    def _remove_waiter(self, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        admission_in_flight.set(self._in_flight)
+        admission_queue_depth.set(len(self._waiters))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "in_flight": self._in_flight,
+            "queue_depth": len(self._waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "tracked_keys": len(self._buckets)
+        }
+
+
+def create_admission_controller() -> AdmissionController:
+    """Build the admission controller from settings"""
+    return AdmissionController(
+        max_concurrent=settings.ADMISSION_MAX_CONCURRENT_RUNS,
+        max_queue=settings.ADMISSION_MAX_QUEUE,
+        queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        rate_per_minute=settings.ADMISSION_RATE_PER_MINUTE,
+        burst=settings.ADMISSION_BURST
+    )
+
+
+# Singleton instance
+admission_controller = create_admission_controller()
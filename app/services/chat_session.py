@@ -0,0 +1,183 @@
+"""
+Chat Session - Per-connection conversation state for long-lived chat transports
+"""
+import asyncio
+import logging
+from collections import deque
+from contextlib import aclosing
+from typing import Dict, Any, List, AsyncIterator, Optional, TYPE_CHECKING
+
+from app.utils.chat_utils import now_pt_iso
+from app.core.config import settings
+from app.Chat_Workflow.orchestrator import stream_mobile_shopping_workflow
+from app.services.admission import AdmissionRejected, admission_controller
+from app.services.conversation_memory import conversation_memory
+from app.utils.metrics import client_disconnects_total
+
+if TYPE_CHECKING:
+    from app.services.conversation_service import ConversationService
+
+logger = logging.getLogger(__name__)
+
+
+class ChatSession:
+    """
+    Conversation state held in memory for the life of one connection.
+    
+    The conversation is loaded once when the session opens. Each turn's
+    prompt is built from the session's recent messages and rolling summary,
+    with the same token budgets as the HTTP endpoints, and runs in a fresh
+    agent Context. Messages are written to MongoDB in the background, one
+    write per turn, in turn order.
+    """
+    
+    def __init__(
+        self,
+        service: "ConversationService",
+        conversation_id: str,
+        email: Optional[str],
+        recent_messages: List[Dict[str, Any]],
+        message_count: Optional[int] = None,
+        memory_state: Optional[Dict[str, Any]] = None,
+        last_tool_results: Optional[List[Dict[str, Any]]] = None
+    ):
+        self.service = service
+        self.conversation_id = conversation_id
+        self.email = email
+        self.recent_messages = deque(recent_messages, maxlen=settings.MEMORY_WINDOW_MESSAGES)
+        self.message_count = len(recent_messages) if message_count is None else message_count
+        self.memory_state = memory_state or {}
+        self.last_tool_results: List[Dict[str, Any]] = last_tool_results or []
+        self._last_write: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+    
+    async def send_message(self, user_message: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Run one turn of the conversation and stream its events
+        
+        Each turn takes an agent run slot from the admission controller,
+        like the HTTP endpoints. Closing or cancelling the stream early (the
+        connection dropped) cancels the agent run and keeps what it had
+        computed as an interrupted assistant message.
+        
+        Args:
+            user_message: User's message
+        
+        Yields:
+            Workflow events, ending with a "done" event carrying the
+            MessageResponse payload or an "error" event (with retry_after
+            when the turn was not admitted)
+        """
+        # Turns on one connection are processed one at a time
+        async with self._lock:
+            try:
+                ticket = await admission_controller.acquire(self.email)
+            except AdmissionRejected as e:
+                yield {"event": "error", "data": {"detail": str(e), "retry_after": e.retry_after}}
+                return
+            
+            try:
+                async for event in self._run_turn(user_message):
+                    yield event
+            finally:
+                ticket.release()
+    
+    async def _run_turn(self, user_message: str) -> AsyncIterator[Dict[str, Any]]:
+        timestamp = now_pt_iso()
+        user_entry = self.service._message_entry("user", user_message, timestamp)
+        memory = conversation_memory.prepare(
+            list(self.recent_messages),
+            self.memory_state,
+            total_count=self.message_count
+        )
+        if memory["changed"]:
+            self.memory_state = memory["state"]
+        payload = {
+            "conversation_id": self.conversation_id,
+            "user_message": user_message,
+            "conversation_history": memory["recent_messages"],
+            "conversation_summary": memory["summary"]
+        }
+        memory_update = memory["state"] if memory["changed"] else None
+        
+        tool_results = []
+        deltas = []
+        finished = False
+        workflow = stream_mobile_shopping_workflow(
+            agent=self.service.mobile_agent,
+            payload=payload,
+            tool_results=tool_results
+        )
+        try:
+            # Closing this stream closes the workflow's, which cancels the run
+            async with aclosing(workflow):
+                async for event in workflow:
+                    if event["event"] != "result":
+                        if event["event"] == "token":
+                            deltas.append(event["data"]["delta"])
+                        elif event["event"] == "error" and event["data"].get("interrupted"):
+                            deltas.clear()
+                        yield event
+                        continue
+                    
+                    finished = True
+                    result = event["data"]
+                    self.last_tool_results = result.get("tool_calls", [])
+                    response = self.service._build_message_response(self.conversation_id, timestamp, result)
+                    assistant_entry = self.service._message_entry("assistant", response["response"], timestamp)
+                    self._remember([user_entry, assistant_entry])
+                    self._schedule_write([user_entry, assistant_entry], memory_update)
+                    yield {"event": "done", "data": response}
+        except (asyncio.CancelledError, GeneratorExit):
+            if not finished:
+                self._interrupt(user_entry, tool_results, "".join(deltas), memory_update)
+            raise
+        except Exception as e:
+            logger.error(f"Error handling session message: {e}", exc_info=True)
+            # Keep the user message even if the agent failed
+            self._remember([user_entry])
+            self._schedule_write([user_entry], memory_update)
+            yield {"event": "error", "data": {"detail": f"Failed to process message: {str(e)}"}}
+    
+    def _interrupt(
+        self,
+        user_entry: Dict[str, Any],
+        tool_results: List[Dict[str, Any]],
+        partial_response: str,
+        memory: Optional[Dict[str, Any]]
+    ) -> None:
+        """Keep the user message and what the cancelled run had computed (see ConversationService._interrupt_turn)"""
+        client_disconnects_total.inc(endpoint="websocket")
+        logger.info(f"🔌 WebSocket closed mid-turn for conversation {self.conversation_id}, agent run cancelled")
+        entries = [user_entry]
+        assistant_entry = self.service._interrupted_entry(user_entry["timestamp"], tool_results, partial_response)
+        if assistant_entry is not None:
+            entries.append(assistant_entry)
+            self.last_tool_results = assistant_entry["tool_calls"]
+        self._remember(entries)
+        # A task of its own, which the cancellation of this turn does not reach
+        self._schedule_write(entries, memory)
+    
+    def _remember(self, messages: List[Dict[str, Any]]) -> None:
+        self.recent_messages.extend(messages)
+        self.message_count += len(messages)
+    
+    def _schedule_write(self, messages: List[Dict[str, Any]], memory: Optional[Dict[str, Any]] = None) -> None:
+        """Persist messages (and the memory state) in the background, after any earlier pending write"""
+        previous = self._last_write
+        
+        async def write():
+            if previous is not None:
+                await asyncio.gather(previous, return_exceptions=True)
+            try:
+                await self.service._append_messages(self.conversation_id, messages, memory)
+            except Exception as e:
+                logger.error(f"Error persisting session messages for {self.conversation_id}: {e}", exc_info=True)
+        
+        self._last_write = asyncio.create_task(write())
+    
+    async def close(self) -> None:
+        """Wait for pending writes to reach MongoDB (or the write-behind queue)"""
+        if self._last_write is not None:
+            await asyncio.gather(self._last_write, return_exceptions=True)
+            self._last_write = None
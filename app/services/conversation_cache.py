@@ -0,0 +1,150 @@
+"""
+Conversation Cache - Recent conversation state kept in process
+
+Holds the state a turn needs (email, memory summary, the last
+MEMORY_WINDOW_MESSAGES messages and the last tool outputs) for recently
+active conversations, so their next turn does not read MongoDB again.
+
+The cache is write-through: every message this process appends is added
+to the cached state as it is queued for MongoDB. The conversation's
+message_count is its version. ConversationService only trusts a cached
+state after reserving the next positions on the condition that MongoDB
+still has the cached count, so when another worker has written to the
+conversation, the state is dropped and the history read from MongoDB.
+"""
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.utils.metrics import cache_requests_total
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationState:
+    """What a turn needs to know about a conversation"""
+
+    def __init__(
+        self,
+        email: Optional[str],
+        messages: List[Dict[str, Any]],
+        message_count: int,
+        memory: Optional[Dict[str, Any]],
+        window: int
+    ):
+        self.email = email
+        self.messages = deque(messages, maxlen=window)
+        # Messages in the conversation, including the ones still queued for MongoDB
+        self.message_count = message_count
+        self.memory = memory
+        self.last_tool_results: List[Dict[str, Any]] = []
+
+
+class ConversationCache:
+    """LRU cache of ConversationState by conversation ID"""
+
+    def __init__(self, max_entries: int = 1000, window: int = 20):
+        self.max_entries = max_entries
+        self.window = window
+        self._entries: "OrderedDict[str, ConversationState]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+
+    def get(self, conversation_id: str) -> Optional[ConversationState]:
+        """Cached state of a conversation, or None"""
+        state = self._entries.get(conversation_id)
+        if state is None:
+            self.stats["misses"] += 1
+            cache_requests_total.inc(cache="conversation", result="miss")
+            return None
+        self._entries.move_to_end(conversation_id)
+        self.stats["hits"] += 1
+        cache_requests_total.inc(cache="conversation", result="hit")
+        return state
+
+    def peek(self, conversation_id: str) -> Optional[ConversationState]:
+        """Cached state of a conversation, or None, without counting a lookup"""
+        return self._entries.get(conversation_id)
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return conversation_id in self._entries
+
+    def put(self, conversation_id: str, conversation: Dict[str, Any]) -> ConversationState:
+        """
+        Cache a conversation as loaded from MongoDB
+
+        Args:
+            conversation_id: Conversation ID
+            conversation: Dict with email, memory, messages and message_count
+
+        Returns:
+            The cached state
+        """
+        state = ConversationState(
+            email=conversation.get("email"),
+            messages=conversation.get("messages", []),
+            message_count=conversation.get("message_count", 0),
+            memory=conversation.get("memory"),
+            window=self.window
+        )
+        self._entries[conversation_id] = state
+        self._entries.move_to_end(conversation_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+        return state
+
+    def append(
+        self,
+        conversation_id: str,
+        messages: List[Dict[str, Any]],
+        memory: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Add messages written by this process (and the new memory state) to the cached state"""
+        state = self._entries.get(conversation_id)
+        if state is None:
+            return
+        state.messages.extend(messages)
+        state.message_count += len(messages)
+        if memory is not None:
+            state.memory = memory
+
+    def set_tool_results(self, conversation_id: str, tool_results: List[Dict[str, Any]]) -> None:
+        """Remember the tool outputs of the conversation's last turn"""
+        state = self._entries.get(conversation_id)
+        if state is not None:
+            state.last_tool_results = tool_results
+
+    def invalidate(self, conversation_id: str) -> None:
+        """Drop a state that MongoDB has moved past"""
+        if self._entries.pop(conversation_id, None) is not None:
+            self.stats["stale"] += 1
+            cache_requests_total.inc(cache="conversation", result="stale")
+            logger.info(f"♻️ Conversation {conversation_id} changed elsewhere, reloading its history")
+
+    def discard(self, conversation_id: str) -> None:
+        """Drop a conversation that no longer exists (archived or deleted)"""
+        self._entries.pop(conversation_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+def create_conversation_cache() -> Optional[ConversationCache]:
+    """Create the conversation cache configured in settings (None when disabled)"""
+    if settings.CONVERSATION_CACHE_MAX_ENTRIES <= 0:
+        return None
+    return ConversationCache(
+        max_entries=settings.CONVERSATION_CACHE_MAX_ENTRIES,
+        window=settings.MEMORY_WINDOW_MESSAGES
+    )
+
+
+# Singleton instance (None when disabled)
+conversation_cache = create_conversation_cache()
@@ -0,0 +1,234 @@
+"""
+Conversation Memory - Token-bounded conversation context for the agent prompt
+
+The prompt gets two parts:
+- a rolling summary of older turns, updated incrementally as messages fall
+  out of the recent window and persisted on the conversation document
+- the most recent messages that fit in a token budget, and leave room in
+  the loaded window so every message is folded before it drops out of it
+
+Both parts have a fixed token budget, so the prompt stays the same size no
+matter how long the conversation runs.
+"""
+import logging
+import re
+import threading
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def load_encoding():
+    """
+    Load the tiktoken encoding (None if it is unavailable)
+
+    Loading reads, and on a cold cache downloads, the BPE file, so the app
+    calls this at startup in a worker thread rather than leaving it to the
+    first chat request on the event loop.
+    """
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if not _encoding_loaded:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                logger.warning(f"tiktoken unavailable, estimating token counts: {e}")
+            _encoding_loaded = True
+    return _encoding
+
+
+def _get_encoding():
+    """The tiktoken encoding, loaded on first use if startup did not load it"""
+    if _encoding_loaded:
+        return _encoding
+    return load_encoding()
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens the way gpt-4o-mini does, or estimate ~4 characters per token"""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text down to at most max_tokens tokens"""
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[:max_tokens]).rstrip() + " …"
+    if len(text) <= max_tokens * 4:
+        return text
+    return text[:max_tokens * 4].rstrip() + " …"
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    """Token count of a stored message, using the count saved with it when present"""
+    tokens = message.get("tokens")
+    if isinstance(tokens, int):
+        return tokens
+    return count_tokens(_content_text(message))
+
+
+def _content_text(message: Dict[str, Any]) -> str:
+    content = message.get("content", "")
+    # Handle case where content might be a dict (legacy) or string (current)
+    if isinstance(content, dict):
+        content = content.get("response", str(content))
+    elif not isinstance(content, str):
+        content = str(content)
+    return content
+
+
+class ConversationMemory:
+    """Builds the bounded conversation context and keeps the rolling summary"""
+
+    def __init__(
+        self,
+        tail_token_budget: int = 1200,
+        summary_token_budget: int = 400,
+        max_message_tokens: int = 400,
+        summary_line_tokens: int = 60,
+        max_tail_messages: Optional[int] = None
+    ):
+        self.tail_token_budget = tail_token_budget
+        self.summary_token_budget = summary_token_budget
+        self.max_message_tokens = max_message_tokens
+        self.summary_line_tokens = summary_line_tokens
+        # Fewer than the messages loaded per turn, so the oldest loaded ones
+        # are folded before the next turns push them out of the window
+        self.max_tail_messages = max_tail_messages
+
+    def prepare(
+        self,
+        messages: List[Dict[str, Any]],
+        state: Optional[Dict[str, Any]] = None,
+        total_count: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Select the recent messages for the prompt and fold older ones into the summary
+
+        Args:
+            messages: The most recent stored messages, oldest first
+            state: Persisted memory state ({"summary": str, "summarized_count": int})
+            total_count: Number of messages in the whole conversation, when
+                messages is only its tail (defaults to len(messages))
+
+        Returns:
+            Dict with:
+            - summary: summary text of older turns
+            - recent_messages: messages for the prompt (long ones truncated)
+            - state: the memory state to persist
+            - changed: whether the state differs from the one passed in
+        """
+        state = state or {}
+        summary = state.get("summary", "")
+        summarized_count = state.get("summarized_count", 0)
+        total_count = len(messages) if total_count is None else total_count
+        offset = total_count - len(messages)
+
+        # Walk back from the newest message until the tail budget is spent
+        tail_start = len(messages)
+        tail_floor = 0 if self.max_tail_messages is None else max(len(messages) - self.max_tail_messages, 0)
+        used = 0
+        while tail_start > tail_floor:
+            cost = min(message_tokens(messages[tail_start - 1]), self.max_message_tokens)
+            if used + cost > self.tail_token_budget:
+                break
+            used += cost
+            tail_start -= 1
+
+        # Messages older than the tail that the summary does not cover yet
+        fold_from = max(summarized_count - offset, 0)
+        to_fold = messages[fold_from:tail_start]
+        if to_fold:
+            summary = self._fold(summary, to_fold)
+            summarized_count = offset + tail_start
+
+        recent_messages = []
+        for message in messages[max(tail_start, summarized_count - offset):]:
+            if message_tokens(message) > self.max_message_tokens:
+                message = {**message, "content": truncate_to_tokens(_content_text(message), self.max_message_tokens)}
+            recent_messages.append(message)
+
+        new_state = {"summary": summary, "summarized_count": summarized_count}
+        return {
+            "summary": summary,
+            "recent_messages": recent_messages,
+            "state": new_state,
+            "changed": new_state != {"summary": state.get("summary", ""), "summarized_count": state.get("summarized_count", 0)},
+        }
+
+    def roll_up(self, messages: List[Dict[str, Any]], state: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Fold every message the summary does not cover yet into it
+
+        Used when a conversation is archived, so the summary describes the
+        whole conversation.
+
+        Args:
+            messages: All stored messages of the conversation, oldest first
+            state: Persisted memory state ({"summary": str, "summarized_count": int})
+
+        Returns:
+            The new memory state
+        """
+        state = state or {}
+        summary = state.get("summary", "")
+        to_fold = messages[state.get("summarized_count", 0):]
+        if to_fold:
+            summary = self._fold(summary, to_fold)
+        return {"summary": summary, "summarized_count": len(messages)}
+
+    def _fold(self, summary: str, messages: List[Dict[str, Any]]) -> str:
+        """Add one short line per message to the summary, dropping the oldest lines over budget"""
+        lines = [line for line in summary.split("\n") if line]
+        for message in messages:
+            line = self._summarize_message(message)
+            if line:
+                lines.append(line)
+
+        while lines and count_tokens("\n".join(lines)) > self.summary_token_budget:
+            lines.pop(0)
+        return "\n".join(lines)
+
+    def _summarize_message(self, message: Dict[str, Any]) -> str:
+        text = _content_text(message).strip()
+        if not text:
+            return ""
+        role = message.get("role", "user")
+        if role == "assistant":
+            # Phone names are bolded in answers; they are what later turns refer back to
+            phones = list(dict.fromkeys(re.findall(r"\*\*([^*\n]{3,60})\*\*", text)))[:5]
+            first_sentence = re.split(r"(?<=[.!?])\s|\n", text, maxsplit=1)[0]
+            line = f"assistant: {first_sentence}"
+            if phones:
+                line += f" [mentioned: {', '.join(phones)}]"
+        else:
+            line = f"{role}: {' '.join(text.split())}"
+        return truncate_to_tokens(line, self.summary_line_tokens)
+
+
+def create_conversation_memory() -> ConversationMemory:
+    """Create the conversation memory with the budgets configured in settings"""
+    from app.core.config import settings
+
+    return ConversationMemory(
+        tail_token_budget=settings.MEMORY_TAIL_TOKEN_BUDGET,
+        summary_token_budget=settings.MEMORY_SUMMARY_TOKEN_BUDGET,
+        max_message_tokens=settings.MEMORY_MAX_MESSAGE_TOKENS,
+        # A turn adds two messages (user and assistant) to the window
+        max_tail_messages=max(settings.MEMORY_WINDOW_MESSAGES - 2, 1),
+    )
+
+
+# Singleton instance
+conversation_memory = create_conversation_memory()
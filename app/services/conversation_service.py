@@ -1,13 +1,25 @@
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator, List, Optional, Set, TYPE_CHECKING
+import asyncio
 import logging
+import weakref
+from contextlib import aclosing
 from datetime import datetime
-from bson.objectid import ObjectId
 
-from app.utils.chat_utils import now_pt_iso
-from app.db.mongodb import mongodb
-from app.models.openai import openai_model
-from app.agents.mobile_shopping_agent import create_mobile_shopping_agent
-from app.Chat_Workflow.orchestrator import execute_mobile_shopping_workflow
+from app.utils.chat_utils import now_pt, now_pt_iso
+from app.services.admission import admission_controller
+from app.services.conversation_cache import conversation_cache
+from app.services.conversation_memory import conversation_memory, count_tokens
+from app.services.conversation_store import get_conversation_store
+from app.services.write_behind import write_behind
+from app.core.config import settings
+from app.utils.metrics import client_disconnects_total
+from app.utils.pagination import decode_cursor, encode_cursor
+from app.utils.tracing import span
+
+# The agent stack (llama_index, the OpenAI client) takes seconds to import;
+# it is imported by initialize(), off the event loop, not with this module
+if TYPE_CHECKING:
+    from app.services.chat_session import ChatSession
 
 logger = logging.getLogger(__name__)
 
@@ -15,8 +27,9 @@ logger = logging.getLogger(__name__)
 class ConversationService:
     def __init__(self):
         self.mobile_agent = None
-        self.collection_name = "conversations"
         self._initialized = False
+        # Writes of interrupted turns, referenced until they are done
+        self._interrupted_writes: Set[asyncio.Task] = set()
     
     async def initialize(self):
         """
@@ -27,20 +40,34 @@ class ConversationService:
             return
         try:
             logger.info("Initializing mobile shopping agent...")
-            text_llm = openai_model(reasoning=False, temperature=0.7)
-            self.mobile_agent = create_mobile_shopping_agent(text_llm)
+            # In a thread, so the imports overlap the other startup stages
+            self.mobile_agent = await asyncio.to_thread(self._build_agent)
             self._initialized = True
             logger.info("Mobile shopping agent initialized successfully")
         except Exception as e:
             logger.error(f"Error initializing ConversationService: {e}", exc_info=True)
             raise
     
+    @staticmethod
+    def _build_agent():
+        """Import the agent stack and build the mobile shopping agent"""
+        from app.models.openai import openai_model
+        from app.models.llm_instrumentation import install_llm_instrumentation
+        from app.agents.mobile_shopping_agent import create_mobile_shopping_agent
+        # Loaded here so the first request does not pay for them
+        import app.Chat_Workflow.orchestrator  # noqa: F401
+        import app.services.chat_session  # noqa: F401
+
+        install_llm_instrumentation()
+        text_llm = openai_model(reasoning=False, temperature=0.7)
+        return create_mobile_shopping_agent(text_llm)
+    
     async def _ensure_initialized(self):
         """Ensure the service is initialized before use"""
         if not self._initialized:
             await self.initialize()
     
-    def create_conversation(self, email: str) -> Dict[str, Any]:
+    async def create_conversation(self, email: str) -> Dict[str, Any]:
         """
         Create a new conversation
         
@@ -51,15 +78,17 @@ class ConversationService:
             Dict containing conversation_id, email, and created_at
         """
         try:
-            collection = mongodb.get_collection(self.collection_name)
+            created_at = now_pt()
             conversation_data = {
                 "email": email,
-                "created_at": now_pt_iso(),
-                "messages": []
+                # MongoDB keeps milliseconds; truncate so every store returns the same time
+                "created_at": created_at.replace(microsecond=created_at.microsecond // 1000 * 1000),
+                "message_count": 0
             }
             
-            result = collection.insert_one(conversation_data)
-            conversation_id = str(result.inserted_id)
+            conversation_id = await get_conversation_store().create_conversation(email, conversation_data["created_at"])
+            if conversation_cache is not None:
+                conversation_cache.put(conversation_id, conversation_data)
             
             return {
                 "conversation_id": conversation_id,
@@ -70,6 +99,384 @@ class ConversationService:
             logger.error(f"Error creating conversation: {e}")
             raise
     
+    async def list_conversations(self, email: str, limit: int, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        List a user's conversations, newest first, one page at a time
+        
+        Args:
+            email: User's email address
+            limit: Page size
+            cursor: next_cursor of the previous page, or None for the first page
+            
+        Returns:
+            Dict with the page of conversations and the cursor of the next
+            page (None on the last page)
+            
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        after = None
+        if cursor:
+            key = decode_cursor(cursor)
+            try:
+                after = (datetime.fromisoformat(key["created_at"]), str(key["id"]))
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f"Invalid cursor: {cursor}") from e
+        
+        # One extra row tells whether there is a next page; message counts
+        # include the messages still in the write-behind queue, as in get_messages
+        store = write_behind if settings.WRITE_BEHIND_ENABLED else get_conversation_store()
+        with span("mongo.read"):
+            conversations = await store.list_conversations(email, limit + 1, after)
+        next_cursor = None
+        if len(conversations) > limit:
+            conversations = conversations[:limit]
+            last = conversations[-1]
+            next_cursor = encode_cursor({"created_at": last["created_at"].isoformat(), "id": last["conversation_id"]})
+        return {"conversations": conversations, "next_cursor": next_cursor}
+    
+    async def get_messages(
+        self,
+        conversation_id: str,
+        limit: int,
+        cursor: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Page through a conversation's history, newest page first
+        
+        Each page holds up to limit messages in conversation order; its
+        cursor leads to the messages before them.
+        
+        Args:
+            conversation_id: Conversation ID
+            limit: Page size
+            cursor: next_cursor of the previous page, or None for the latest messages
+            
+        Returns:
+            Dict with conversation_id, messages (carrying their positions),
+            message_count and next_cursor (None on the first page of the
+            conversation), or None if the conversation does not exist
+            
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        before = None
+        if cursor:
+            before = decode_cursor(cursor).get("before")
+            if not isinstance(before, int) or before < 0:
+                raise ValueError(f"Invalid cursor: {cursor}")
+        
+        store = write_behind if settings.WRITE_BEHIND_ENABLED else get_conversation_store()
+        with span("mongo.read"):
+            page = await store.load_messages(conversation_id, limit, before)
+        if page is None:
+            return None
+        messages = page["messages"]
+        next_cursor = None
+        if messages and messages[0]["position"] > 0:
+            next_cursor = encode_cursor({"before": messages[0]["position"]})
+        return {
+            "conversation_id": conversation_id,
+            "messages": messages,
+            "message_count": page["message_count"],
+            "next_cursor": next_cursor
+        }
+    
+    async def _start_turn(self, conversation_id: str, user_message: str, admit: bool = False) -> Dict[str, Any]:
+        """
+        Load the conversation history and store the incoming user message
+        
+        Args:
+            conversation_id: Conversation ID
+            user_message: User's message
+            admit: Take an agent run slot from the admission controller
+                (rate limited by the conversation's email) before the
+                message is stored
+            
+        Returns:
+            Dict containing the workflow payload, the turn timestamp and the
+            admission ticket (None unless admit), which the caller releases
+            once the agent run is over
+            
+        Raises:
+            ValueError: If the conversation does not exist
+            AdmissionRejected: If the request was not admitted
+        """
+        timestamp = now_pt_iso()
+        user_entry = self._message_entry("user", user_message, timestamp)
+        
+        ticket = None
+        try:
+            # The email of a cached conversation is known without a read
+            cached = conversation_cache.peek(conversation_id) if admit and conversation_cache is not None else None
+            if cached is not None:
+                ticket = await admission_controller.acquire(cached.email)
+            
+            # Active conversations skip the history read when their cached state is current
+            memory = await self._append_to_cached(conversation_id, user_entry)
+            if memory is None:
+                # Verify that the conversation exists
+                with span("mongo.read"):
+                    conversation = await self._load_recent(conversation_id)
+                
+                if not conversation:
+                    raise ValueError(f"Conversation with ID {conversation_id} not found")
+                if admit and ticket is None:
+                    ticket = await admission_controller.acquire(conversation.get("email"))
+                if conversation_cache is not None:
+                    conversation_cache.put(conversation_id, conversation)
+                
+                # Recent messages that fit the token budget, plus a summary of the older ones
+                memory = conversation_memory.prepare(
+                    conversation.get("messages", []),
+                    conversation.get("memory"),
+                    total_count=conversation.get("message_count", 0)
+                )
+                
+                # Store the user message (and the updated summary) in the conversation
+                await self._append_messages(
+                    conversation_id,
+                    [user_entry],
+                    memory=memory["state"] if memory["changed"] else None
+                )
+        except BaseException:
+            if ticket is not None:
+                ticket.release()
+            raise
+        
+        return {
+            "timestamp": timestamp,
+            "ticket": ticket,
+            "payload": {
+                "conversation_id": conversation_id,
+                "user_message": user_message,
+                "conversation_history": memory["recent_messages"],
+                "conversation_summary": memory["summary"]
+            }
+        }
+    
+    async def _append_to_cached(self, conversation_id: str, user_entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Store the user message against the cached conversation state, if it is current
+        
+        The cached message count is the conversation's version: the message's
+        position is only reserved if MongoDB still has that many messages, so
+        a turn never runs on history another worker has added to. The
+        reservation replaces the history read.
+        
+        Args:
+            conversation_id: Conversation ID
+            user_entry: Stored form of the user message
+            
+        Returns:
+            The prepared memory (as from ConversationMemory.prepare), or None
+            if the conversation is not cached or its cached state is stale
+        """
+        state = conversation_cache.get(conversation_id) if conversation_cache is not None else None
+        if state is None:
+            return None
+        if settings.WRITE_BEHIND_ENABLED:
+            # Until then MongoDB lags behind the cached count
+            await write_behind.wait_reserved(conversation_id)
+            if conversation_id not in conversation_cache:
+                return None
+        
+        memory = conversation_memory.prepare(list(state.messages), state.memory, total_count=state.message_count)
+        memory_update = memory["state"] if memory["changed"] else None
+        with span("mongo.write"):
+            store = get_conversation_store()
+            start = await store.reserve(conversation_id, 1, memory_update, expected_count=state.message_count)
+            if start is None:
+                conversation_cache.invalidate(conversation_id)
+                return None
+            if settings.WRITE_BEHIND_ENABLED:
+                await write_behind.enqueue(conversation_id, [user_entry], start=start)
+            else:
+                await store.write_messages([(conversation_id, store.positioned([user_entry], start))])
+        conversation_cache.append(conversation_id, [user_entry], memory_update)
+        return memory
+    
+    async def _finish_turn(self, conversation_id: str, timestamp: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Store the assistant response and build the message response
+        
+        Args:
+            conversation_id: Conversation ID
+            timestamp: Timestamp of the turn
+            result: Result of the mobile shopping workflow
+            
+        Returns:
+            Dict matching the MessageResponse schema
+        """
+        response = self._build_message_response(conversation_id, timestamp, result)
+        if conversation_cache is not None:
+            conversation_cache.set_tool_results(conversation_id, result.get("tool_calls", []))
+        
+        # Store the assistant response in the conversation history
+        await self._append_messages(conversation_id, [self._message_entry("assistant", response["response"], timestamp)])
+        
+        return response
+    
+    def _interrupt_turn(
+        self,
+        conversation_id: str,
+        timestamp: str,
+        tool_results: List[Dict[str, Any]],
+        partial_response: str,
+        endpoint: str
+    ) -> None:
+        """
+        Keep what a turn had computed when its client went away
+        
+        The agent run is cancelled by then and the user message is already
+        stored. The tool results (and any response text streamed so far) are
+        stored as an assistant message marked interrupted, so the next turn
+        can build on them. The caller is being cancelled, so the write runs
+        in a task of its own.
+        
+        Args:
+            conversation_id: Conversation ID
+            timestamp: Timestamp of the turn
+            tool_results: Tool calls completed before the run was cancelled
+            partial_response: Response text streamed before the run was cancelled
+            endpoint: Endpoint the client disconnected from, for metrics
+        """
+        client_disconnects_total.inc(endpoint=endpoint)
+        logger.info(f"🔌 Client disconnected from conversation {conversation_id}, agent run cancelled")
+        entry = self._interrupted_entry(timestamp, tool_results, partial_response)
+        if entry is None:
+            return
+        tool_results = entry["tool_calls"]
+        
+        async def write():
+            try:
+                if conversation_cache is not None and tool_results:
+                    conversation_cache.set_tool_results(conversation_id, tool_results)
+                await self._append_messages(conversation_id, [entry])
+            except Exception as e:
+                logger.error(f"Failed to store the interrupted turn of conversation {conversation_id}: {e}", exc_info=True)
+        
+        task = asyncio.get_running_loop().create_task(write())
+        self._interrupted_writes.add(task)
+        task.add_done_callback(self._interrupted_writes.discard)
+    
+    def _interrupted_entry(
+        self,
+        timestamp: str,
+        tool_results: List[Dict[str, Any]],
+        partial_response: str
+    ) -> Optional[Dict[str, Any]]:
+        """Assistant message of a cancelled turn, or None if it had computed nothing"""
+        if not tool_results and not partial_response:
+            return None
+        tool_results = list(tool_results)
+        tool_names = ", ".join(dict.fromkeys(str(tool_call.get("tool_name")) for tool_call in tool_results))
+        content = partial_response or f"(Interrupted before answering, after looking up: {tool_names})"
+        entry = self._message_entry("assistant", content, timestamp)
+        entry["interrupted"] = True
+        entry["tool_calls"] = tool_results
+        return entry
+    
+    def _build_message_response(self, conversation_id: str, timestamp: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Build a MessageResponse payload from a workflow result"""
+        # Extract response text
+        response_text = result.get("response", "I apologize, but I couldn't generate a response.")
+        
+        return {
+            "conversation_id": conversation_id,
+            "timestamp": timestamp,
+            "response": response_text,
+            "output": result.get("output"),
+            "predicted_sql_query": result.get("predicted_sql_query"),
+            "user_query": result.get("user_query")
+        }
+    
+    @staticmethod
+    def _message_entry(role: str, content: str, timestamp: str) -> Dict[str, Any]:
+        """Build a stored message, with its token count so it is only counted once"""
+        return {
+            "role": role,
+            "content": content,
+            "timestamp": timestamp,
+            "tokens": count_tokens(content)
+        }
+    
+    async def _append_messages(
+        self,
+        conversation_id: str,
+        messages: List[Dict[str, Any]],
+        memory: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Append messages to the conversation history (and update its memory)"""
+        with span("mongo.write"):
+            if settings.WRITE_BEHIND_ENABLED:
+                await write_behind.enqueue(conversation_id, messages, memory)
+            else:
+                await get_conversation_store().append(conversation_id, messages, memory)
+        if conversation_cache is not None:
+            conversation_cache.append(conversation_id, messages, memory)
+    
+    async def _load_recent(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Load a conversation with only its last MEMORY_WINDOW_MESSAGES messages
+        
+        Messages are stored in buckets (see MessageStore), so the read stays
+        the same size however long the conversation grows; message_count
+        places the tail in the conversation. Messages still waiting in the
+        write-behind queue are included.
+        
+        Args:
+            conversation_id: Conversation ID
+            
+        Returns:
+            Dict with email, memory, messages and message_count, or None if
+            the conversation does not exist
+        """
+        store = write_behind if settings.WRITE_BEHIND_ENABLED else get_conversation_store()
+        return await store.load_recent(conversation_id, settings.MEMORY_WINDOW_MESSAGES)
+    
+    async def open_session(self, conversation_id: str) -> "ChatSession":
+        """
+        Open an in-memory chat session for a long-lived connection
+        
+        The conversation is read from MongoDB once; later turns on the session
+        reuse its recent messages, memory summary and agent context.
+        
+        Args:
+            conversation_id: Conversation ID
+            
+        Returns:
+            ChatSession bound to the conversation
+        """
+        # Ensure the service is initialized
+        await self._ensure_initialized()
+        
+        conversation = await self._load_recent(conversation_id)
+        
+        if not conversation:
+            raise ValueError(f"Conversation with ID {conversation_id} not found")
+        
+        last_tool_results = []
+        if conversation_cache is not None:
+            cached = conversation_cache.get(conversation_id)
+            if cached is not None and cached.message_count == conversation.get("message_count", 0):
+                last_tool_results = cached.last_tool_results
+            # The session's writes go through to the refreshed state
+            state = conversation_cache.put(conversation_id, conversation)
+            state.last_tool_results = last_tool_results
+        
+        from app.services.chat_session import ChatSession
+        
+        return ChatSession(
+            service=self,
+            conversation_id=conversation_id,
+            email=conversation.get("email"),
+            recent_messages=conversation.get("messages", []),
+            message_count=conversation.get("message_count", 0),
+            memory_state=conversation.get("memory"),
+            last_tool_results=last_tool_results
+        )
+    
     async def get_message_response(self, conversation_id: str, user_message: str) -> Dict[str, Any]:
         """
         Handle user message and return a response
@@ -80,68 +487,108 @@ class ConversationService:
             
         Returns:
             Dict containing conversation_id and response
+        
+        Cancelling the call (the client went away) cancels the agent run and
+        keeps the tool results computed so far (see _interrupt_turn).
         """
         # Ensure the service is initialized
         await self._ensure_initialized()
         
+        from app.Chat_Workflow.orchestrator import execute_mobile_shopping_workflow
+        
+        # Rejected requests (429) are not errors of this service
+        turn = await self._start_turn(conversation_id, user_message, admit=True)
+        tool_results = []
+        result = None
         try:
-            # Verify that the conversation exists
-            collection = mongodb.get_collection(self.collection_name)
-            conversation = collection.find_one({"_id": ObjectId(conversation_id)})
-            
-            if not conversation:
-                raise ValueError(f"Conversation with ID {conversation_id} not found")
-            
-            # Get the last 6 messages from the conversation history
-            messages = conversation.get("messages", [])
-            last_messages = messages[-6:] if len(messages) > 0 else []
-            
-            # Store the user message in the conversation history
-            timestamp = now_pt_iso()
-            collection.update_one(
-                {"_id": ObjectId(conversation_id)},
-                {"$push": {"messages": {
-                    "role": "user",
-                    "content": user_message,
-                    "timestamp": timestamp
-                }}}
-            )
-            
             # Use the mobile shopping workflow to generate a response
             logger.info(f"Processing message for conversation: {conversation_id}")
-            payload = {
-                "conversation_id": conversation_id,
-                "user_message": user_message,
-                "conversation_history": last_messages
-            }
-            
-            result = await execute_mobile_shopping_workflow(agent=self.mobile_agent, payload=payload)
-            logger.info(f"Workflow result: {result}")
-            
-            # Extract response text
-            response_text = result.get("response", "I apologize, but I couldn't generate a response.")
-            
-            # Store the assistant response in the conversation history
-            collection.update_one(
-                {"_id": ObjectId(conversation_id)},
-                {"$push": {"messages": {
-                    "role": "assistant",
-                    "content": response_text,
-                    "timestamp": timestamp
-                }}}
+            result = await execute_mobile_shopping_workflow(
+                agent=self.mobile_agent,
+                payload=turn["payload"],
+                tool_results=tool_results
             )
+            logger.info(f"Workflow result: {result}")
             
-            return {
-                "conversation_id": conversation_id,
-                "timestamp": timestamp,
-                "response": response_text,
-                "output": result.get("output"),
-                "predicted_sql_query": result.get("predicted_sql_query"),
-                "user_query": result.get("user_query")
-            }
+            return await self._finish_turn(conversation_id, turn["timestamp"], result)
+        except asyncio.CancelledError:
+            if result is None:
+                self._interrupt_turn(conversation_id, turn["timestamp"], tool_results, "", "message")
+            raise
         except Exception as e:
             logger.error(f"Error handling message: {e}", exc_info=True)
             raise
+        finally:
+            if turn["ticket"] is not None:
+                turn["ticket"].release()
+    
+    async def stream_message_response(self, conversation_id: str, user_message: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Handle user message and stream the response events as they are produced
+        
+        The conversation is validated and the user message stored before this
+        returns, so a missing conversation raises ValueError up front. The
+        assistant message is persisted once the workflow has finished. Closing
+        or cancelling the stream early (the client went away) cancels the
+        agent run and keeps what it had computed (see _interrupt_turn).
+        
+        Args:
+            conversation_id: Conversation ID
+            user_message: User's message
+            
+        Returns:
+            Async iterator of workflow events, ending with a "done" event that
+            carries the MessageResponse payload
+        """
+        # Ensure the service is initialized
+        await self._ensure_initialized()
+        
+        turn = await self._start_turn(conversation_id, user_message, admit=True)
+        logger.info(f"Streaming message for conversation: {conversation_id}")
+        
+        from app.Chat_Workflow.orchestrator import stream_mobile_shopping_workflow
+        
+        async def events() -> AsyncIterator[Dict[str, Any]]:
+            tool_results = []
+            deltas = []
+            finished = False
+            workflow = stream_mobile_shopping_workflow(
+                agent=self.mobile_agent,
+                payload=turn["payload"],
+                tool_results=tool_results
+            )
+            try:
+                # Closing this stream closes the workflow's, which cancels the run
+                async with aclosing(workflow):
+                    async for event in workflow:
+                        if event["event"] == "result":
+                            finished = True
+                            logger.info(f"Workflow result: {event['data']}")
+                            response = await self._finish_turn(conversation_id, turn["timestamp"], event["data"])
+                            yield {"event": "done", "data": response}
+                        else:
+                            if event["event"] == "token":
+                                deltas.append(event["data"]["delta"])
+                            elif event["event"] == "error" and event["data"].get("interrupted"):
+                                # The streamed text was dropped for a degraded answer
+                                deltas.clear()
+                            yield event
+            except (asyncio.CancelledError, GeneratorExit):
+                if not finished:
+                    self._interrupt_turn(conversation_id, turn["timestamp"], tool_results, "".join(deltas), "stream")
+                raise
+            except Exception as e:
+                logger.error(f"Error streaming message: {e}", exc_info=True)
+                yield {"event": "error", "data": {"detail": f"Failed to process message: {str(e)}"}}
+            finally:
+                if turn["ticket"] is not None:
+                    turn["ticket"].release()
+        
+        stream = events()
+        if turn["ticket"] is not None:
+            # A response dropped before streaming started never runs the finally above
+            weakref.finalize(stream, turn["ticket"].release)
+        return stream
 
 # Singleton instance
 conversation_service = ConversationService()
\ No newline at end of file
@@ -0,0 +1,425 @@
+"""
+Conversation Store - Where conversations and their messages are kept
+
+ConversationService, the write-behind queue and the conversation cache only
+use the ConversationStore interface. CONVERSATION_STORE_BACKEND selects the
+implementation:
+- mongodb: MongoDB, messages in buckets (MessageStore, the default)
+- sqlite: a local SQLite database in WAL mode (SQLiteConversationStore),
+  for single-node deployments without a MongoDB server
+- memory: plain dicts in this process (InMemoryConversationStore), for
+  tests and for benchmarking the service layer; nothing survives a restart
+
+Every message has a position in its conversation, and a conversation's
+message_count (the next free position) doubles as its version.
+Conversations are listed by user, newest first, and paged by their
+(created_at, ID) key; a conversation's history is paged by message position.
+updated_at records a conversation's last append, so the retention job (see
+app/services/retention.py) can move idle conversations into the archive.
+"""
+import copy
+import logging
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson.objectid import ObjectId
+
+logger = logging.getLogger(__name__)
+
+# (conversation ID, messages carrying their positions)
+MessageBatch = List[Tuple[str, List[Dict[str, Any]]]]
+
+
+class ConversationStore(ABC):
+    """Storage interface for conversations and their messages"""
+
+    async def open(self) -> None:
+        """Connect and create the tables or indexes the store needs"""
+
+    async def close(self) -> None:
+        """Release connections"""
+
+    @abstractmethod
+    async def create_conversation(self, email: str, created_at: datetime) -> str:
+        """
+        Create an empty conversation
+
+        Args:
+            email: User's email address
+            created_at: Creation time (timezone-aware, millisecond precision)
+
+        Returns:
+            ID of the new conversation
+        """
+
+    @abstractmethod
+    async def reserve(
+        self,
+        conversation_id: str,
+        count: int,
+        memory: Optional[Dict[str, Any]] = None,
+        expected_count: Optional[int] = None
+    ) -> Optional[int]:
+        """
+        Reserve positions for count new messages (and update the memory state)
+
+        Reserving the positions first keeps concurrent appends from colliding.
+
+        Args:
+            conversation_id: Conversation ID
+            count: Number of messages to make room for
+            memory: New memory state, or None to keep the current one
+            expected_count: Only reserve if the conversation has exactly this
+                many messages (a version check against cached state)
+
+        Returns:
+            Position of the first reserved message, or None if expected_count
+            did not match
+
+        Raises:
+            ValueError: If the conversation does not exist (and no
+                expected_count was given)
+        """
+
+    @abstractmethod
+    async def write_messages(self, batch: MessageBatch) -> None:
+        """
+        Store messages whose positions were reserved, for any number of conversations
+
+        Writing the same messages again must be harmless, so a failed write
+        can be retried.
+
+        Args:
+            batch: (conversation ID, messages carrying their positions) pairs
+        """
+
+    @abstractmethod
+    async def load_recent(self, conversation_id: str, limit: int) -> Optional[Dict[str, Any]]:
+        """
+        Load a conversation with its last limit messages
+
+        Args:
+            conversation_id: Conversation ID
+            limit: Number of recent messages to return
+
+        Returns:
+            Dict with email, memory, messages and message_count, or None if
+            the conversation does not exist
+        """
+
+    @abstractmethod
+    async def list_conversations(
+        self,
+        email: str,
+        limit: int,
+        after: Optional[Tuple[datetime, str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        List a user's conversations, newest first
+
+        Args:
+            email: User's email address
+            limit: Maximum number of conversations to return
+            after: (created_at, conversation ID) of the last conversation of
+                the previous page, or None for the first page
+
+        Returns:
+            Dicts with conversation_id, email, created_at (in UTC) and message_count
+        """
+
+    @abstractmethod
+    async def load_messages(
+        self,
+        conversation_id: str,
+        limit: int,
+        before: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Load a page of a conversation's history
+
+        Args:
+            conversation_id: Conversation ID
+            limit: Maximum number of messages to return
+            before: Only return messages at positions below this one, or None
+                for the most recent messages
+
+        Returns:
+            Dict with message_count and the last limit messages before the
+            position (in conversation order, carrying their positions), or
+            None if the conversation does not exist
+        """
+
+    @abstractmethod
+    async def find_idle(self, cutoff: datetime, limit: int) -> List[str]:
+        """
+        Find conversations with no messages appended since cutoff
+
+        Args:
+            cutoff: Conversations last updated before this time are idle
+            limit: Maximum number of conversation IDs to return
+
+        Returns:
+            IDs of idle conversations, least recently updated first
+        """
+
+    @abstractmethod
+    async def export_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Load a conversation with all of its messages
+
+        Args:
+            conversation_id: Conversation ID
+
+        Returns:
+            Dict with conversation_id, email, created_at, updated_at, memory,
+            message_count and messages (carrying their positions), or None if
+            the conversation does not exist
+        """
+
+    @abstractmethod
+    async def archive_conversation(self, record: Dict[str, Any], expected_count: int) -> bool:
+        """
+        Store an archive record and delete the conversation it was made from
+
+        Nothing is deleted if messages were appended since the record was
+        made, so a conversation that comes back to life is never lost.
+
+        Args:
+            record: Archive record (see RetentionJob.archive_record), keyed by
+                its conversation_id
+            expected_count: message_count of the archived conversation
+
+        Returns:
+            True if the conversation was archived and deleted
+        """
+
+    async def purge_archive(self, now: datetime) -> int:
+        """
+        Delete archive records whose expires_at has passed
+
+        Stores with TTL indexes leave this to the database.
+
+        Args:
+            now: Current time
+
+        Returns:
+            Number of records deleted
+        """
+        return 0
+
+    async def append(
+        self,
+        conversation_id: str,
+        messages: List[Dict[str, Any]],
+        memory: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """
+        Append messages to a conversation (and update its memory state)
+
+        Args:
+            conversation_id: Conversation ID
+            messages: Messages in conversation order
+            memory: New memory state, or None to keep the current one
+        """
+        start = await self.reserve(conversation_id, len(messages), memory)
+        await self.write_messages([(conversation_id, self.positioned(messages, start))])
+
+    @staticmethod
+    def positioned(messages: List[Dict[str, Any]], start: int) -> List[Dict[str, Any]]:
+        """Copies of messages carrying their positions, the first one at start"""
+        return [{**message, "position": start + index} for index, message in enumerate(messages)]
+
+    @staticmethod
+    def new_id() -> str:
+        """A conversation ID in the same format as MongoDB's"""
+        return str(ObjectId())
+
+
+def as_utc(value: datetime) -> datetime:
+    """A datetime in UTC; naive datetimes (as MongoDB returns them) are taken to be UTC already"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+class InMemoryConversationStore(ConversationStore):
+    """Conversations kept in dicts in this process"""
+
+    def __init__(self):
+        self._conversations: Dict[str, Dict[str, Any]] = {}
+        self._messages: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        self._by_email: Dict[str, List[str]] = {}
+        self._archive: Dict[str, Dict[str, Any]] = {}
+
+    async def create_conversation(self, email: str, created_at: datetime) -> str:
+        conversation_id = self.new_id()
+        self._conversations[conversation_id] = {
+            "email": email,
+            "created_at": as_utc(created_at),
+            "updated_at": as_utc(created_at),
+            "memory": None,
+            "message_count": 0
+        }
+        self._messages[conversation_id] = {}
+        self._by_email.setdefault(email, []).append(conversation_id)
+        return conversation_id
+
+    async def reserve(
+        self,
+        conversation_id: str,
+        count: int,
+        memory: Optional[Dict[str, Any]] = None,
+        expected_count: Optional[int] = None
+    ) -> Optional[int]:
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None or (expected_count is not None and conversation["message_count"] != expected_count):
+            if expected_count is not None:
+                return None
+            raise ValueError(f"Conversation with ID {conversation_id} not found")
+        start = conversation["message_count"]
+        conversation["message_count"] += count
+        conversation["updated_at"] = datetime.now(timezone.utc)
+        if memory is not None:
+            conversation["memory"] = copy.deepcopy(memory)
+        return start
+
+    async def write_messages(self, batch: MessageBatch) -> None:
+        for conversation_id, messages in batch:
+            stored = self._messages.get(conversation_id)
+            if stored is None:
+                continue
+            for message in messages:
+                stored[message["position"]] = dict(message)
+
+    async def load_recent(self, conversation_id: str, limit: int) -> Optional[Dict[str, Any]]:
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None:
+            return None
+        stored = self._messages[conversation_id]
+        count = conversation["message_count"]
+        # Reserved positions may not be written yet, so read back from the count
+        messages = []
+        position = count - 1
+        while position >= 0 and len(messages) < limit:
+            if position in stored:
+                messages.append(dict(stored[position]))
+            position -= 1
+        return {
+            "email": conversation["email"],
+            "memory": copy.deepcopy(conversation["memory"]),
+            "message_count": count,
+            "messages": messages[::-1]
+        }
+
+    async def list_conversations(
+        self,
+        email: str,
+        limit: int,
+        after: Optional[Tuple[datetime, str]] = None
+    ) -> List[Dict[str, Any]]:
+        keys = sorted(
+            ((self._conversations[conversation_id]["created_at"], conversation_id)
+             for conversation_id in self._by_email.get(email, [])),
+            reverse=True
+        )
+        if after is not None:
+            after = (as_utc(after[0]), after[1])
+            keys = [key for key in keys if key < after]
+        return [
+            {
+                "conversation_id": conversation_id,
+                "email": email,
+                "created_at": created_at,
+                "message_count": self._conversations[conversation_id]["message_count"]
+            }
+            for created_at, conversation_id in keys[:limit]
+        ]
+
+    async def load_messages(
+        self,
+        conversation_id: str,
+        limit: int,
+        before: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None:
+            return None
+        stored = self._messages[conversation_id]
+        count = conversation["message_count"]
+        messages = []
+        position = (count if before is None else min(before, count)) - 1
+        while position >= 0 and len(messages) < limit:
+            if position in stored:
+                messages.append(dict(stored[position]))
+            position -= 1
+        return {"message_count": count, "messages": messages[::-1]}
+
+    async def find_idle(self, cutoff: datetime, limit: int) -> List[str]:
+        cutoff = as_utc(cutoff)
+        idle = sorted(
+            (conversation["updated_at"], conversation_id)
+            for conversation_id, conversation in self._conversations.items()
+            if conversation["updated_at"] < cutoff
+        )
+        return [conversation_id for _, conversation_id in idle[:limit]]
+
+    async def export_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None:
+            return None
+        stored = self._messages[conversation_id]
+        return {
+            "conversation_id": conversation_id,
+            **copy.deepcopy(conversation),
+            "messages": [dict(stored[position]) for position in sorted(stored)]
+        }
+
+    async def archive_conversation(self, record: Dict[str, Any], expected_count: int) -> bool:
+        conversation_id = record["conversation_id"]
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None or conversation["message_count"] != expected_count:
+            return False
+        self._archive[conversation_id] = dict(record)
+        del self._conversations[conversation_id]
+        del self._messages[conversation_id]
+        self._by_email[conversation["email"]].remove(conversation_id)
+        return True
+
+    async def purge_archive(self, now: datetime) -> int:
+        now = as_utc(now)
+        expired = [
+            conversation_id for conversation_id, record in self._archive.items()
+            if record.get("expires_at") is not None and as_utc(record["expires_at"]) <= now
+        ]
+        for conversation_id in expired:
+            del self._archive[conversation_id]
+        return len(expired)
+
+
+def create_conversation_store() -> ConversationStore:
+    """Create the conversation store selected by CONVERSATION_STORE_BACKEND"""
+    from app.core.config import settings
+
+    backend_name = settings.CONVERSATION_STORE_BACKEND.lower()
+    if backend_name == "mongodb":
+        from app.services.message_store import message_store
+        return message_store
+    if backend_name == "sqlite":
+        from app.services.sqlite_store import SQLiteConversationStore
+        return SQLiteConversationStore(settings.SQLITE_PATH)
+    if backend_name == "memory":
+        return InMemoryConversationStore()
+    raise ValueError(f"Unknown CONVERSATION_STORE_BACKEND: {settings.CONVERSATION_STORE_BACKEND}")
+
+
+# Singleton instance - created on first use
+conversation_store: Optional[ConversationStore] = None
+
+
+def get_conversation_store() -> ConversationStore:
+    """Get the conversation store instance"""
+    global conversation_store
+    if conversation_store is None:
+        conversation_store = create_conversation_store()
+    return conversation_store
@@ -0,0 +1,240 @@
+"""
+Idempotency - Runs a retried request once, however often it is sent
+
+Clients send an Idempotency-Key header with POST /conversation/message and
+reuse it when they retry after a network error. The first request with a
+key runs; its response is kept for IDEMPOTENCY_TTL_SECONDS and replayed to
+later requests with the key, so a retry does not run the agent again or
+store the messages twice.
+
+A retry that arrives while the first request is still running waits for
+it: in the same worker it joins the run (see SingleFlight), across workers
+it polls the shared store for up to IDEMPOTENCY_WAIT_SECONDS. The running
+request's claim on the key lasts as long as the longest possible request
+(see max_request_seconds()), so a retry can never run it a second time. A
+key reused for a different request is refused. When the request fails, its
+key is released so a retry runs it again.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.services.response_cache import InMemoryCacheBackend, LocalRedis, RedisCacheBackend, redis_asyncio
+from app.utils.metrics import idempotency_requests_total
+from app.utils.serialization import dumps, loads
+from app.utils.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyConflict(Exception):
+    """The key cannot be used for this request (reason: mismatch or in_progress)"""
+
+    def __init__(self, reason: str):
+        if reason == "mismatch":
+            message = "Idempotency-Key was already used for a different request"
+        else:
+            message = "A request with this Idempotency-Key is still being processed"
+        super().__init__(message)
+        self.reason = reason
+
+
+class IdempotencyStore:
+    """Keeps responses by idempotency key and runs each key's request once"""
+
+    def __init__(
+        self,
+        backend: Any,
+        ttl_seconds: int = 600,
+        wait_seconds: float = 60.0,
+        pending_ttl_seconds: float = 120.0,
+        poll_interval: float = 0.25
+    ):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.wait_seconds = wait_seconds
+        # How long a running request holds its key; must outlast the request
+        self.pending_ttl_seconds = pending_ttl_seconds
+        self.poll_interval = poll_interval
+        self.flights = SingleFlight()
+        self.stats = {"executed": 0, "replayed": 0, "joined": 0, "in_progress": 0, "mismatch": 0, "errors": 0}
+
+    @staticmethod
+    def fingerprint(*parts: Any) -> str:
+        """Digest of the request, to tell a retry from a different request reusing the key"""
+        return hashlib.sha256(dumps(parts).encode("utf-8")).hexdigest()
+
+    async def run(
+        self,
+        key: str,
+        fingerprint: str,
+        fn: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        Run fn() once for key, or return the response of the run that had it
+
+        Args:
+            key: Idempotency key (scoped by the caller, e.g. to the conversation)
+            fingerprint: fingerprint() of the request
+            fn: Zero-argument coroutine function producing the JSON-serializable response
+
+        Returns:
+            Tuple of the response and whether it was replayed (produced by an
+            earlier or concurrent request with the key)
+
+        Raises:
+            IdempotencyConflict: If the key belongs to a different request, or
+                its request is still running after wait_seconds
+        """
+        flight_key = (key, fingerprint)
+        if self.flights.is_in_flight(flight_key):
+            self._count("joined")
+            response, _ = await self.flights.do(flight_key, lambda: self._execute(key, fingerprint, fn))
+            return response, True
+        return await self.flights.do(flight_key, lambda: self._execute(key, fingerprint, fn))
+
+    async def _execute(
+        self,
+        key: str,
+        fingerprint: str,
+        fn: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Tuple[Dict[str, Any], bool]:
+        try:
+            record = await self._claim(key, fingerprint)
+        except IdempotencyConflict:
+            raise
+        except Exception as e:
+            # A broken store must never fail the request; run it unprotected
+            self.stats["errors"] += 1
+            logger.error(f"Idempotency store unavailable, running the request anyway: {e}")
+            return await fn(), False
+        if record is not None:
+            self._count("replayed")
+            return record["response"], True
+
+        self._count("executed")
+        try:
+            response = await fn()
+        except BaseException:
+            # Let a retry run the request again
+            await self._release(key)
+            raise
+        try:
+            await self.backend.set(
+                key,
+                dumps({"state": "done", "fingerprint": fingerprint, "response": response}),
+                self.ttl_seconds
+            )
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Failed to store the response for idempotency key {key}: {e}")
+        return response, False
+
+    async def _claim(self, key: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """
+        Mark key as running, or wait for the run that holds it
+
+        Returns:
+            None once this request holds the key, or the finished record of
+            the request that held it
+        """
+        deadline = time.monotonic() + self.wait_seconds
+        # Held until the request is done; only a crashed worker's mark expires
+        pending = dumps({"state": "pending", "fingerprint": fingerprint})
+        while True:
+            if await self.backend.add(key, pending, max(1, math.ceil(self.pending_ttl_seconds))):
+                return None
+            value = await self.backend.get(key)
+            if value is None:
+                # Released or expired in the meantime
+                continue
+            record = loads(value)
+            if record["fingerprint"] != fingerprint:
+                self._count("mismatch")
+                raise IdempotencyConflict("mismatch")
+            if record["state"] == "done":
+                return record
+            if time.monotonic() >= deadline:
+                self._count("in_progress")
+                raise IdempotencyConflict("in_progress")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _release(self, key: str) -> None:
+        try:
+            await self.backend.delete(key)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Failed to release idempotency key {key}: {e}")
+
+    def _count(self, outcome: str) -> None:
+        self.stats[outcome] += 1
+        idempotency_requests_total.inc(outcome=outcome)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "in_flight": self.flights.in_flight(),
+            "backend": type(self.backend).__name__,
+            "ttl_seconds": self.ttl_seconds,
+            "pending_ttl_seconds": self.pending_ttl_seconds
+        }
+
+
+def max_request_seconds() -> float:
+    """
+    Longest a POST /conversation/message request can run
+
+    The admission queue wait, plus the agent deadline (twice over when a
+    hedged attempt can start just before the first one's deadline), plus a
+    margin for the history read, the fallback answer and the message writes.
+    """
+    from app.core.config import settings
+
+    attempts = 2 if settings.HEDGE_ENABLED else 1
+    return settings.ADMISSION_QUEUE_TIMEOUT_SECONDS + settings.AGENT_TIMEOUT_MAX_SECONDS * attempts + 30
+
+
+def create_idempotency_store() -> Optional[IdempotencyStore]:
+    """Create the idempotency store configured in settings (None when disabled)"""
+    from app.core.config import settings
+
+    backend_name = settings.IDEMPOTENCY_BACKEND.lower()
+    if backend_name in ("", "none", "disabled"):
+        return None
+
+    if backend_name == "memory":
+        backend = InMemoryCacheBackend(max_entries=settings.IDEMPOTENCY_MAX_ENTRIES)
+    elif backend_name == "local_redis":
+        backend = RedisCacheBackend(LocalRedis(max_entries=settings.IDEMPOTENCY_MAX_ENTRIES), prefix="idempotency:")
+    elif backend_name == "redis":
+        if redis_asyncio is None:
+            raise ValueError("IDEMPOTENCY_BACKEND=redis requires the 'redis' package")
+        if not settings.REDIS_URL:
+            raise ValueError("REDIS_URL not set in environment variables")
+        backend = RedisCacheBackend(redis_asyncio.from_url(settings.REDIS_URL), prefix="idempotency:")
+    else:
+        raise ValueError(f"Unknown IDEMPOTENCY_BACKEND: {settings.IDEMPOTENCY_BACKEND}")
+
+    logger.info(f"Idempotency keys enabled ({backend_name}, ttl={settings.IDEMPOTENCY_TTL_SECONDS}s)")
+    return IdempotencyStore(
+        backend,
+        ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS,
+        wait_seconds=settings.IDEMPOTENCY_WAIT_SECONDS,
+        pending_ttl_seconds=settings.IDEMPOTENCY_PENDING_TTL_SECONDS or max_request_seconds()
+    )
+
+
+# Singleton instance - created on first use
+idempotency_store: Optional[IdempotencyStore] = None
+_idempotency_store_created = False
+
+def get_idempotency_store() -> Optional[IdempotencyStore]:
+    """Get the idempotency store instance (None when disabled)"""
+    global idempotency_store, _idempotency_store_created
+    if not _idempotency_store_created:
+        idempotency_store = create_idempotency_store()
+        _idempotency_store_created = True
+    return idempotency_store
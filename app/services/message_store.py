@@ -0,0 +1,362 @@
+"""
+Message Store - MongoDB conversation store, messages in fixed-size buckets
+
+Messages live in the conversation_messages collection, MESSAGE_BUCKET_SIZE
+messages per document keyed by (conversation_id, seq), instead of one
+ever-growing array on the conversation document. Every message carries its
+position in the conversation, and bucket seq = position // bucket size. The
+conversation document keeps message_count (the next free position) and the
+memory state.
+
+A turn costs one $inc on the conversation plus one bulk write to its
+bucket (rarely two), and reading the recent tail touches the last two buckets,
+however long the conversation is. A user's conversations are listed from the
+(email, created_at, _id) index, created_at being a BSON date.
+
+Idle conversations are moved by the retention job into the
+conversation_archive collection, one compressed document per conversation;
+a TTL index on expires_at deletes archived conversations once they expire.
+
+Conversations written before buckets (messages embedded in the conversation
+document) are moved into buckets the first time they are read, or in bulk
+with `python -m app.db.migrate_message_buckets`.
+"""
+import asyncio
+import logging
+import math
+from datetime import datetime, timezone
+from itertools import groupby
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+
+from app.core.config import settings
+from app.db.mongodb import mongodb
+from app.services.conversation_store import ConversationStore, MessageBatch, as_utc
+
+logger = logging.getLogger(__name__)
+
+
+class MessageStore(ConversationStore):
+    """MongoDB conversation store, with messages in buckets"""
+
+    def __init__(
+        self,
+        bucket_size: int = 50,
+        conversations_collection: str = "conversations",
+        buckets_collection: str = "conversation_messages",
+        archive_collection: str = "conversation_archive"
+    ):
+        self.bucket_size = bucket_size
+        self.conversations_collection = conversations_collection
+        self.buckets_collection = buckets_collection
+        self.archive_collection = archive_collection
+
+    def _conversations(self):
+        return mongodb.get_async_collection(self.conversations_collection)
+
+    def _buckets(self):
+        return mongodb.get_async_collection(self.buckets_collection)
+
+    def _archive(self):
+        return mongodb.get_async_collection(self.archive_collection)
+
+    async def open(self) -> None:
+        mongodb.connect_to_mongodb()
+        await self.ensure_indexes()
+
+    async def close(self) -> None:
+        await mongodb.close_mongodb_connection()
+
+    async def ensure_indexes(self) -> None:
+        """Create the listing, idle scan, bucket lookup and archive expiry indexes"""
+        await asyncio.gather(
+            self._conversations().create_index(
+                [("email", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                name="email_created_at"
+            ),
+            self._conversations().create_index([("updated_at", ASCENDING)], name="updated_at"),
+            self._buckets().create_index(
+                [("conversation_id", ASCENDING), ("seq", ASCENDING)],
+                unique=True,
+                name="conversation_seq"
+            ),
+            # Records without expires_at are kept
+            self._archive().create_index([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl")
+        )
+
+    async def create_conversation(self, email: str, created_at: datetime) -> str:
+        result = await self._conversations().insert_one({
+            "email": email,
+            "created_at": created_at,
+            "updated_at": created_at,
+            "message_count": 0
+        })
+        return str(result.inserted_id)
+
+    async def reserve(
+        self,
+        conversation_id: str,
+        count: int,
+        memory: Optional[Dict[str, Any]] = None,
+        expected_count: Optional[int] = None
+    ) -> Optional[int]:
+        query: Dict[str, Any] = {"_id": ObjectId(conversation_id)}
+        if expected_count is not None:
+            query["message_count"] = expected_count
+        update: Dict[str, Any] = {
+            "$inc": {"message_count": count},
+            "$set": {"updated_at": datetime.now(timezone.utc)}
+        }
+        if memory is not None:
+            update["$set"]["memory"] = memory
+        conversation = await self._conversations().find_one_and_update(
+            query,
+            update,
+            projection={"message_count": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if conversation is None:
+            if expected_count is not None:
+                return None
+            raise ValueError(f"Conversation with ID {conversation_id} not found")
+        return conversation["message_count"] - count
+
+    async def write_messages(self, batch: MessageBatch) -> None:
+        """Add the messages of any number of conversations to their buckets in one bulk write"""
+        writes = [write for conversation_id, messages in batch for write in self.bucket_writes(conversation_id, messages)]
+        if writes:
+            await self._buckets().bulk_write(writes, ordered=True)
+
+    def bucket_writes(self, conversation_id: str, messages: List[Dict[str, Any]]) -> List[UpdateOne]:
+        """
+        Write operations that add positioned messages to their buckets
+
+        Each bucket gets an upsert that creates it if needed and a $push that
+        only applies if the chunk's first position is not in the bucket yet,
+        so replaying the operations after a failed write is harmless. Two
+        upserts racing to create a bucket are retried by the server, which
+        holds for upserts on the fields of a unique index.
+
+        Args:
+            conversation_id: Conversation ID
+            messages: Messages carrying their positions (see positioned)
+
+        Returns:
+            Operations for a bulk write on the buckets collection
+        """
+        _id = ObjectId(conversation_id)
+        writes = []
+        for seq, chunk in groupby(messages, key=lambda message: message["position"] // self.bucket_size):
+            chunk = list(chunk)
+            query = {"conversation_id": _id, "seq": seq}
+            writes.append(UpdateOne(query, {"$setOnInsert": {"count": 0, "messages": []}}, upsert=True))
+            writes.append(UpdateOne(
+                {**query, "messages.position": {"$ne": chunk[0]["position"]}},
+                {"$push": {"messages": {"$each": chunk, "$sort": {"position": 1}}}, "$inc": {"count": len(chunk)}}
+            ))
+        return writes
+
+    async def load_recent(self, conversation_id: str, limit: int) -> Optional[Dict[str, Any]]:
+        _id = ObjectId(conversation_id)
+        conversation, buckets = await asyncio.gather(
+            self._load_conversation(_id),
+            self._load_last_buckets(_id, limit)
+        )
+        if conversation is None:
+            return None
+        if conversation.pop("legacy"):
+            await self.migrate_conversation(_id)
+            return await self.load_recent(conversation_id, limit)
+
+        messages = [message for bucket in reversed(buckets) for message in bucket.get("messages", [])]
+        conversation["messages"] = messages[-limit:] if limit else []
+        conversation.setdefault("message_count", 0)
+        conversation.setdefault("memory", None)
+        return conversation
+
+    async def list_conversations(
+        self,
+        email: str,
+        limit: int,
+        after: Optional[Tuple[datetime, str]] = None
+    ) -> List[Dict[str, Any]]:
+        query: Dict[str, Any] = {"email": email}
+        if after is not None:
+            created_at, conversation_id = after
+            if not ObjectId.is_valid(conversation_id):
+                raise ValueError(f"Invalid conversation ID in cursor: {conversation_id}")
+            query["$or"] = [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "_id": {"$lt": ObjectId(conversation_id)}}
+            ]
+        cursor = self._conversations().find(
+            query,
+            projection={"email": 1, "created_at": 1, "message_count": 1}
+        ).sort([("created_at", DESCENDING), ("_id", DESCENDING)]).limit(limit)
+        return [
+            {
+                "conversation_id": str(conversation["_id"]),
+                "email": conversation["email"],
+                # Conversations created before dates were stored still hold ISO strings
+                "created_at": as_utc(
+                    conversation["created_at"] if isinstance(conversation["created_at"], datetime)
+                    else datetime.fromisoformat(conversation["created_at"])
+                ),
+                "message_count": conversation.get("message_count", 0)
+            }
+            for conversation in await cursor.to_list(limit)
+        ]
+
+    async def load_messages(
+        self,
+        conversation_id: str,
+        limit: int,
+        before: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        if not ObjectId.is_valid(conversation_id):
+            return None
+        _id = ObjectId(conversation_id)
+        conversation = await self._load_conversation(_id, ("message_count",))
+        if conversation is None:
+            return None
+        if conversation.pop("legacy"):
+            await self.migrate_conversation(_id)
+            return await self.load_messages(conversation_id, limit, before)
+
+        count = conversation.get("message_count", 0)
+        end = count if before is None else min(before, count)
+        buckets = await self._load_last_buckets(_id, limit, end) if end > 0 and limit else []
+        messages = [
+            message
+            for bucket in reversed(buckets)
+            for message in bucket.get("messages", [])
+            if message["position"] < end
+        ]
+        return {"message_count": count, "messages": messages[-limit:] if limit else []}
+
+    async def find_idle(self, cutoff: datetime, limit: int) -> List[str]:
+        # Conversations from before updated_at was stored count from their creation
+        cursor = self._conversations().find(
+            {"$or": [
+                {"updated_at": {"$lt": cutoff}},
+                {"updated_at": None, "created_at": {"$lt": cutoff}}
+            ]},
+            projection={"_id": 1}
+        ).sort("updated_at", ASCENDING).limit(limit)
+        return [str(conversation["_id"]) for conversation in await cursor.to_list(limit)]
+
+    async def export_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        if not ObjectId.is_valid(conversation_id):
+            return None
+        _id = ObjectId(conversation_id)
+        await self.migrate_conversation(_id)
+        conversation, buckets = await asyncio.gather(
+            self._conversations().find_one({"_id": _id}),
+            self._buckets().find({"conversation_id": _id}).sort("seq", ASCENDING).to_list(None)
+        )
+        if conversation is None:
+            return None
+        return {
+            "conversation_id": conversation_id,
+            "email": conversation.get("email"),
+            "created_at": conversation.get("created_at"),
+            "updated_at": conversation.get("updated_at", conversation.get("created_at")),
+            "memory": conversation.get("memory"),
+            "message_count": conversation.get("message_count", 0),
+            "messages": [message for bucket in buckets for message in bucket.get("messages", [])]
+        }
+
+    async def archive_conversation(self, record: Dict[str, Any], expected_count: int) -> bool:
+        _id = ObjectId(record["conversation_id"])
+        document = {key: value for key, value in record.items() if key != "conversation_id"}
+        # Archive first: if the app stops in between, the conversation is archived twice, never lost
+        await self._archive().replace_one({"_id": _id}, document, upsert=True)
+        result = await self._conversations().delete_one({"_id": _id, "message_count": expected_count})
+        if not result.deleted_count:
+            # Messages were appended meanwhile; the conversation stays live
+            await self._archive().delete_one({"_id": _id})
+            return False
+        await self._buckets().delete_many({"conversation_id": _id})
+        return True
+
+    async def _load_conversation(
+        self,
+        _id: ObjectId,
+        fields: Tuple[str, ...] = ("email", "memory", "message_count")
+    ) -> Optional[Dict[str, Any]]:
+        # The embedded messages array of legacy documents is never loaded here
+        cursor = await self._conversations().aggregate([
+            {"$match": {"_id": _id}},
+            {"$project": {
+                **{field: 1 for field in fields},
+                "legacy": {"$isArray": "$messages"}
+            }}
+        ])
+        documents = await cursor.to_list(1)
+        return documents[0] if documents else None
+
+    async def _load_last_buckets(self, _id: ObjectId, limit: int, end: Optional[int] = None) -> List[Dict[str, Any]]:
+        # The newest bucket may be nearly empty, so read one more bucket than limit fills
+        bucket_count = math.ceil(limit / self.bucket_size) + 1
+        query: Dict[str, Any] = {"conversation_id": _id}
+        if end is not None:
+            query["seq"] = {"$lte": (end - 1) // self.bucket_size}
+        cursor = self._buckets().find(query).sort("seq", DESCENDING).limit(bucket_count)
+        return await cursor.to_list(bucket_count)
+
+    async def migrate_conversation(self, _id: ObjectId) -> bool:
+        """
+        Move the embedded messages of a legacy conversation into buckets
+
+        Idempotent, and safe while an older app version still appends to the
+        embedded array: the array is only removed if it did not change
+        while its buckets were written.
+
+        Args:
+            _id: Conversation ObjectId
+
+        Returns:
+            True if the conversation was migrated, False if it had nothing to migrate
+        """
+        while True:
+            conversation = await self._conversations().find_one(
+                {"_id": _id, "messages": {"$exists": True}},
+                projection={"messages": 1}
+            )
+            if conversation is None:
+                return False
+
+            messages = conversation.get("messages") or []
+            buckets = self._buckets()
+            writes = []
+            for seq in range(math.ceil(len(messages) / self.bucket_size)):
+                start = seq * self.bucket_size
+                chunk = [
+                    {**message, "position": start + index}
+                    for index, message in enumerate(messages[start:start + self.bucket_size])
+                ]
+                writes.append(buckets.replace_one(
+                    {"conversation_id": _id, "seq": seq},
+                    {"conversation_id": _id, "seq": seq, "count": len(chunk), "messages": chunk},
+                    upsert=True
+                ))
+            await asyncio.gather(*writes)
+
+            result = await self._conversations().update_one(
+                {"_id": _id, "messages": {"$size": len(messages)}},
+                {"$set": {"message_count": len(messages)}, "$unset": {"messages": ""}}
+            )
+            if result.modified_count:
+                logger.info(f"📦 Moved {len(messages)} messages of conversation {_id} into {len(writes)} buckets")
+                return True
+
+
+def create_message_store() -> MessageStore:
+    """Build the message store from settings"""
+    return MessageStore(bucket_size=settings.MESSAGE_BUCKET_SIZE)
+
+
+# Singleton instance
+message_store = create_message_store()
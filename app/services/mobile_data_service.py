@@ -1,6 +1,7 @@
 """
 Mobile Data Service - Loads and queries mobile phone data from JSON
 """
+import hashlib
 import json
 import os
 import re
@@ -39,13 +40,18 @@ class MobileDataService:
     def __init__(self, json_path: str):
         self.json_path = json_path
         self.data: List[Dict[str, Any]] = []
+        self.version: str = ""
         self._load_data()
     
     def _load_data(self):
         """Load JSON data and normalize fields"""
         try:
-            with open(self.json_path, 'r', encoding='utf-8') as f:
-                raw_data = json.load(f)
+            with open(self.json_path, 'rb') as f:
+                raw_bytes = f.read()
+            raw_data = json.loads(raw_bytes.decode('utf-8'))
+            
+            # Snapshot version of the catalog, changes whenever the JSON file changes
+            self.version = hashlib.sha256(raw_bytes).hexdigest()[:16]
             
             # Normalize and clean data
             self.data = []
@@ -53,7 +59,7 @@ class MobileDataService:
                 normalized_record = self._normalize_record(record)
                 self.data.append(normalized_record)
             
-            logger.info(f"Loaded {len(self.data)} mobile phone records from JSON")
+            logger.info(f"Loaded {len(self.data)} mobile phone records from JSON (version {self.version})")
             
         except FileNotFoundError:
             logger.error(f"JSON file not found: {self.json_path}")
@@ -0,0 +1,238 @@
+"""
+Response Cache - Caches agent answers to first-turn questions
+
+Only messages without conversation history are cached, so the answer
+depends on nothing but the normalized message and the catalog snapshot.
+Entries expire after a TTL and the in-process backend evicts the least
+recently used entry once it is full.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+from app.utils.chat_utils import normalize_query
+from app.utils.metrics import cache_requests_total
+from app.utils.serialization import dumps, loads
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # redis is optional, only needed for the redis backend
+    redis_asyncio = None
+
+logger = logging.getLogger(__name__)
+
+
+class InMemoryCacheBackend:
+    """Per-process LRU cache with a TTL on every entry"""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl_seconds: int) -> None:
+        self._entries[key] = (time.monotonic() + ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def add(self, key: str, value: str, ttl_seconds: int) -> bool:
+        """Set key only if it holds no live entry; returns whether it was set"""
+        if await self.get(key) is not None:
+            return False
+        await self.set(key, value, ttl_seconds)
+        return True
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+
+class RedisCacheBackend:
+    """
+    Cache backed by a Redis-compatible client (redis.asyncio or LocalRedis).
+    Redis handles expiry; eviction follows the server's maxmemory policy.
+    """
+
+    def __init__(self, client: Any, prefix: str = "response_cache:"):
+        self.client = client
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[str]:
+        value = await self.client.get(self.prefix + key)
+        if isinstance(value, bytes):
+            value = value.decode("utf-8")
+        return value
+
+    async def set(self, key: str, value: str, ttl_seconds: int) -> None:
+        await self.client.set(self.prefix + key, value, ex=ttl_seconds)
+
+    async def add(self, key: str, value: str, ttl_seconds: int) -> bool:
+        """Set key only if it does not exist (SET NX); returns whether it was set"""
+        return bool(await self.client.set(self.prefix + key, value, ex=ttl_seconds, nx=True))
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(self.prefix + key)
+
+
+class LocalRedis:
+    """
+    In-process stand-in for a Redis client, implementing the subset of the
+    redis.asyncio API the cache uses. Meant for tests and local runs.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self._store = InMemoryCacheBackend(max_entries=max_entries)
+        self._lock = asyncio.Lock()
+
+    async def get(self, name: str) -> Optional[bytes]:
+        value = await self._store.get(name)
+        return value.encode("utf-8") if value is not None else None
+
+    async def set(self, name: str, value: Any, ex: Optional[int] = None, nx: bool = False) -> Optional[bool]:
+        if isinstance(value, bytes):
+            value = value.decode("utf-8")
+        async with self._lock:
+            if nx and await self._store.get(name) is not None:
+                return None
+            await self._store.set(name, str(value), ex if ex is not None else 10 ** 9)
+        return True
+
+    async def delete(self, *names: str) -> int:
+        deleted = 0
+        for name in names:
+            if await self._store.get(name) is not None:
+                deleted += 1
+            await self._store.delete(name)
+        return deleted
+
+
+class ResponseCache:
+    """Caches workflow answers keyed by normalized message and catalog version"""
+
+    def __init__(self, backend: Any, ttl_seconds: int = 3600):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "errors": 0}
+
+    @staticmethod
+    def make_key(user_message: str, catalog_version: str) -> str:
+        digest = hashlib.sha256(normalize_query(user_message).encode("utf-8")).hexdigest()
+        return f"{catalog_version}:{digest}"
+
+    async def get(self, user_message: str, catalog_version: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached answer
+
+        Returns:
+            Dict with "response" and "tool_calls", or None on a miss
+        """
+        key = self.make_key(user_message, catalog_version)
+        try:
+            value = await self.backend.get(key)
+            answer = None if value is None else self._decode(value)
+        except ValueError as e:
+            # A corrupt or truncated entry is a miss; drop it so the answer is stored again
+            self.stats["errors"] += 1
+            logger.warning(f"Dropping unreadable response cache entry {key}: {e}")
+            await self._delete(key)
+            answer = None
+        except Exception as e:
+            # A broken cache must never fail the request
+            self.stats["errors"] += 1
+            logger.error(f"Response cache lookup failed: {e}")
+            return None
+
+        if answer is None:
+            self.stats["misses"] += 1
+            cache_requests_total.inc(cache="response", result="miss")
+            return None
+        self.stats["hits"] += 1
+        cache_requests_total.inc(cache="response", result="hit")
+        return answer
+
+    @staticmethod
+    def _decode(value: Any) -> Dict[str, Any]:
+        """A stored answer, or ValueError if the entry does not hold one"""
+        answer = loads(value)
+        valid = isinstance(answer, dict) and isinstance(answer.get("response"), str) and isinstance(answer.get("tool_calls"), list)
+        if not valid:
+            raise ValueError("not a cached answer")
+        return answer
+
+    async def _delete(self, key: str) -> None:
+        try:
+            await self.backend.delete(key)
+        except Exception as e:
+            logger.error(f"Response cache delete failed: {e}")
+
+    async def set(self, user_message: str, catalog_version: str, answer: Dict[str, Any]) -> None:
+        """Store an answer ({"response": ..., "tool_calls": [...]})"""
+        try:
+            await self.backend.set(
+                self.make_key(user_message, catalog_version),
+                dumps({"response": answer["response"], "tool_calls": answer["tool_calls"]}),
+                self.ttl_seconds
+            )
+            self.stats["stores"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Response cache store failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "backend": type(self.backend).__name__,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+def create_response_cache() -> Optional[ResponseCache]:
+    """Create the response cache configured in settings (None when disabled)"""
+    from app.core.config import settings
+
+    backend_name = settings.RESPONSE_CACHE_BACKEND.lower()
+    if backend_name in ("", "none", "disabled"):
+        return None
+
+    if backend_name == "memory":
+        backend = InMemoryCacheBackend(max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES)
+    elif backend_name == "local_redis":
+        backend = RedisCacheBackend(LocalRedis(max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES))
+    elif backend_name == "redis":
+        if redis_asyncio is None:
+            raise ValueError("RESPONSE_CACHE_BACKEND=redis requires the 'redis' package")
+        if not settings.REDIS_URL:
+            raise ValueError("REDIS_URL not set in environment variables")
+        backend = RedisCacheBackend(redis_asyncio.from_url(settings.REDIS_URL))
+    else:
+        raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: {settings.RESPONSE_CACHE_BACKEND}")
+
+    logger.info(f"Response cache enabled ({backend_name}, ttl={settings.RESPONSE_CACHE_TTL_SECONDS}s)")
+    return ResponseCache(backend, ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS)
+
+
+# Singleton instance - created on first use
+response_cache: Optional[ResponseCache] = None
+_response_cache_created = False
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Get the response cache instance (None when caching is disabled)"""
+    global response_cache, _response_cache_created
+    if not _response_cache_created:
+        response_cache = create_response_cache()
+        _response_cache_created = True
+    return response_cache
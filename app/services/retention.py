@@ -0,0 +1,242 @@
+"""
+Retention - Moves idle conversations out of live storage
+
+Conversations with no new messages for RETENTION_IDLE_DAYS are archived:
+their rolling summary is brought up to date with every message, the whole
+conversation is compressed (zlib over JSON) into one archive record, and
+the conversation and its messages are deleted from live storage. The
+summary stays readable in the record; decode_archive() restores the rest.
+
+Archive records carry expires_at (RETENTION_ARCHIVE_TTL_DAYS after
+archiving, unless the TTL is 0). MongoDB deletes expired records through a
+TTL index; other stores delete them when the job runs.
+
+Archiving is conditional on the message count being unchanged, so a
+conversation that receives a message while it is being archived stays live.
+That also makes it safe for several workers to run the job at once. A
+conversation is also skipped while this process's write-behind queue holds
+messages for it, or if a message was reserved since it was found idle (on
+any worker), as those messages would land after the conversation is gone.
+"""
+import asyncio
+import logging
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.services.conversation_cache import conversation_cache
+from app.services.conversation_memory import conversation_memory
+from app.services.conversation_store import ConversationStore, as_utc, get_conversation_store
+from app.services.write_behind import write_behind
+from app.utils.metrics import retention_bytes_total, retention_conversations_total
+from app.utils.serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_ENCODING = "zlib+json"
+
+
+def decode_archive(record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Restore the conversation stored in an archive record
+
+    Args:
+        record: Archive record, as stored by the retention job
+
+    Returns:
+        Dict with conversation_id, email, created_at, updated_at, memory,
+        message_count and messages
+    """
+    if record.get("encoding") != ARCHIVE_ENCODING:
+        raise ValueError(f"Unknown archive encoding: {record.get('encoding')}")
+    return loads(zlib.decompress(bytes(record["data"])))
+
+
+class RetentionJob:
+    """Archives idle conversations in batches, on a schedule or on demand"""
+
+    def __init__(
+        self,
+        store: ConversationStore,
+        idle_days: float = 180,
+        archive_ttl_days: float = 730,
+        batch_size: int = 100,
+        interval: float = 3600.0,
+        compression_level: int = 6
+    ):
+        self.store = store
+        self.idle_days = idle_days
+        self.archive_ttl_days = archive_ttl_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.compression_level = compression_level
+        self._worker: Optional[asyncio.Task] = None
+        self.stats = {
+            "runs": 0,
+            "archived": 0,
+            "skipped": 0,
+            "failed": 0,
+            "purged": 0,
+            "bytes_reclaimed": 0,
+            "archive_bytes": 0,
+            "last_run_at": None,
+            "last_run_seconds": None
+        }
+
+    async def run_once(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Archive every conversation idle past the cutoff and purge expired archives
+
+        Args:
+            now: Current time (defaults to the clock)
+
+        Returns:
+            Counts of this run: archived, skipped, failed, purged,
+            bytes_reclaimed and archive_bytes
+        """
+        now = now or datetime.now(timezone.utc)
+        cutoff = now - timedelta(days=self.idle_days)
+        started = asyncio.get_running_loop().time()
+        run = {"archived": 0, "skipped": 0, "failed": 0, "purged": 0, "bytes_reclaimed": 0, "archive_bytes": 0}
+
+        # Conversations that could not be archived come back in the next
+        # batch; stop once a batch has nothing new
+        seen = set()
+        while True:
+            conversation_ids = [
+                conversation_id for conversation_id in await self.store.find_idle(cutoff, self.batch_size + len(seen))
+                if conversation_id not in seen
+            ]
+            if not conversation_ids:
+                break
+            for conversation_id in conversation_ids:
+                seen.add(conversation_id)
+                outcome = await self._archive_one(conversation_id, now, cutoff, run)
+                run[outcome] += 1
+                retention_conversations_total.inc(outcome=outcome)
+
+        run["purged"] = await self.store.purge_archive(now)
+        if run["purged"]:
+            retention_conversations_total.inc(run["purged"], outcome="purged")
+
+        for key, value in run.items():
+            self.stats[key] += value
+        self.stats["runs"] += 1
+        self.stats["last_run_at"] = now.isoformat()
+        self.stats["last_run_seconds"] = round(asyncio.get_running_loop().time() - started, 3)
+        if any(run.values()):
+            logger.info(
+                f"🗃️ Retention: archived {run['archived']} conversations "
+                f"({run['bytes_reclaimed']} bytes -> {run['archive_bytes']} compressed), "
+                f"skipped {run['skipped']}, failed {run['failed']}, purged {run['purged']} expired archives"
+            )
+        return run
+
+    async def _archive_one(self, conversation_id: str, now: datetime, cutoff: datetime, run: Dict[str, int]) -> str:
+        if write_behind.has_pending(conversation_id):
+            return "skipped"
+        try:
+            conversation = await self.store.export_conversation(conversation_id)
+            if conversation is None:
+                return "skipped"
+            # Positions reserved since find_idle() may still be unwritten
+            if as_utc(conversation.get("updated_at") or conversation["created_at"]) >= cutoff:
+                return "skipped"
+            record = await asyncio.to_thread(self.archive_record, conversation, now)
+            if write_behind.has_pending(conversation_id):
+                return "skipped"
+            if not await self.store.archive_conversation(record, conversation["message_count"]):
+                return "skipped"
+        except Exception as e:
+            logger.error(f"❌ Failed to archive conversation {conversation_id}: {e}", exc_info=True)
+            return "failed"
+
+        if conversation_cache is not None:
+            conversation_cache.discard(conversation_id)
+        run["bytes_reclaimed"] += record["size"]
+        run["archive_bytes"] += record["compressed_size"]
+        retention_bytes_total.inc(record["size"], kind="reclaimed")
+        retention_bytes_total.inc(record["compressed_size"], kind="archived")
+        return "archived"
+
+    def archive_record(self, conversation: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+        """
+        Build the archive record of an exported conversation
+
+        The rolling summary is brought up to date first, so the record's
+        summary covers the whole conversation.
+
+        Args:
+            conversation: Conversation as returned by export_conversation
+            now: Archiving time
+
+        Returns:
+            Archive record for ConversationStore.archive_conversation
+        """
+        memory = conversation_memory.roll_up(conversation["messages"], conversation.get("memory"))
+        conversation = {**conversation, "memory": memory}
+        payload = dumps(conversation).encode("utf-8")
+        data = zlib.compress(payload, self.compression_level)
+        return {
+            "conversation_id": conversation["conversation_id"],
+            "email": conversation["email"],
+            "created_at": conversation["created_at"],
+            "updated_at": conversation["updated_at"],
+            "archived_at": now,
+            "expires_at": now + timedelta(days=self.archive_ttl_days) if self.archive_ttl_days > 0 else None,
+            "message_count": conversation["message_count"],
+            "summary": memory["summary"],
+            "encoding": ARCHIVE_ENCODING,
+            "data": data,
+            "size": len(payload),
+            "compressed_size": len(data)
+        }
+
+    def start(self) -> None:
+        """Run the job every interval seconds in the background"""
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+            logger.info(
+                f"🗃️ Retention job started: archiving conversations idle for {self.idle_days:g} days "
+                f"every {self.interval / 60:g} minutes"
+            )
+
+    async def close(self) -> None:
+        """Stop the background job"""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        await asyncio.gather(self._worker, return_exceptions=True)
+        self._worker = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Error running the retention job: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "idle_days": self.idle_days,
+            "archive_ttl_days": self.archive_ttl_days,
+            "interval_minutes": self.interval / 60
+        }
+
+
+def create_retention_job() -> RetentionJob:
+    """Build the retention job from settings"""
+    return RetentionJob(
+        store=get_conversation_store(),
+        idle_days=settings.RETENTION_IDLE_DAYS,
+        archive_ttl_days=settings.RETENTION_ARCHIVE_TTL_DAYS,
+        batch_size=settings.RETENTION_BATCH_SIZE,
+        interval=settings.RETENTION_INTERVAL_MINUTES * 60
+    )
+
+
+# Singleton instance
+retention_job = create_retention_job()
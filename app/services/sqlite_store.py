@@ -0,0 +1,349 @@
+"""
+SQLite Store - Conversations in a local SQLite database
+
+For single-node deployments that do not want a MongoDB server (or the
+network hop to one). The database runs in WAL mode: a commit appends to the
+write-ahead log instead of rewriting database pages, and other processes
+(a backup, the sqlite3 shell) can read while the app writes. With
+synchronous=NORMAL a commit survives the app crashing; the last commits can
+be lost if the machine loses power.
+
+Every statement runs on one connection in one worker thread, so the event
+loop never waits on the disk and the app is a single writer. Messages are
+rows keyed by (conversation_id, position), stored as JSON. created_at is
+stored as fixed-width ISO 8601 text in UTC, which sorts like the time itself,
+and conversations are listed from an (email, created_at, id) index.
+SQLite has no TTL indexes, so expired archive rows are deleted by the
+retention job (purge_archive).
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.services.conversation_store import ConversationStore, MessageBatch, as_utc
+from app.utils.serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    email TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT,
+    memory TEXT,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    PRIMARY KEY (conversation_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS conversations_email_created_at ON conversations (email, created_at DESC, id DESC);
+CREATE TABLE IF NOT EXISTS conversation_archive (
+    id TEXT PRIMARY KEY,
+    email TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    archived_at TEXT NOT NULL,
+    expires_at TEXT,
+    message_count INTEGER NOT NULL,
+    summary TEXT NOT NULL,
+    encoding TEXT NOT NULL,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    compressed_size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conversation_archive_expires_at ON conversation_archive (expires_at);
+"""
+
+# Columns missing from databases created by earlier versions: (table, column, definition)
+_ADDED_COLUMNS = [
+    ("conversations", "updated_at", "TEXT"),
+]
+
+_ARCHIVE_COLUMNS = (
+    "id", "email", "created_at", "updated_at", "archived_at", "expires_at",
+    "message_count", "summary", "encoding", "data", "size", "compressed_size"
+)
+
+
+def _timestamp(value: datetime) -> str:
+    return as_utc(value).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+
+class SQLiteConversationStore(ConversationStore):
+    """Conversation store in a SQLite database file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def open(self) -> None:
+        if self._connection is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-store")
+        self._connection = await asyncio.get_running_loop().run_in_executor(self._executor, self._connect)
+        logger.info(f"🗄️ Conversation store: SQLite at {self.path} (WAL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit mode; multi-statement work uses explicit transactions
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=5000")
+        connection.executescript(_SCHEMA)
+        for table, column, definition in _ADDED_COLUMNS:
+            columns = {row[1] for row in connection.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS conversations_updated_at ON conversations (COALESCE(updated_at, created_at))"
+        )
+        return connection
+
+    async def close(self) -> None:
+        if self._connection is None:
+            return
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._connection.close)
+        self._executor.shutdown(wait=True)
+        self._connection = None
+        self._executor = None
+
+    async def _run(self, function: Callable[..., Any], *args: Any) -> Any:
+        if self._connection is None:
+            await self.open()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    @contextmanager
+    def _transaction(self, begin: str = "BEGIN IMMEDIATE") -> Iterator[sqlite3.Connection]:
+        connection = self._connection
+        connection.execute(begin)
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    async def create_conversation(self, email: str, created_at: datetime) -> str:
+        conversation_id = self.new_id()
+
+        def insert() -> None:
+            self._connection.execute(
+                "INSERT INTO conversations (id, email, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (conversation_id, email, _timestamp(created_at), _timestamp(created_at))
+            )
+
+        await self._run(insert)
+        return conversation_id
+
+    async def reserve(
+        self,
+        conversation_id: str,
+        count: int,
+        memory: Optional[Dict[str, Any]] = None,
+        expected_count: Optional[int] = None
+    ) -> Optional[int]:
+        def update() -> Optional[int]:
+            sql = (
+                "UPDATE conversations SET message_count = message_count + ?, memory = COALESCE(?, memory), "
+                "updated_at = ? WHERE id = ?"
+            )
+            params = [
+                count,
+                dumps(memory) if memory is not None else None,
+                _timestamp(datetime.now(timezone.utc)),
+                conversation_id
+            ]
+            if expected_count is not None:
+                sql += " AND message_count = ?"
+                params.append(expected_count)
+            with self._transaction() as connection:
+                if connection.execute(sql, params).rowcount == 0:
+                    return None
+                (message_count,) = connection.execute(
+                    "SELECT message_count FROM conversations WHERE id = ?", (conversation_id,)
+                ).fetchone()
+            return message_count - count
+
+        start = await self._run(update)
+        if start is None and expected_count is None:
+            raise ValueError(f"Conversation with ID {conversation_id} not found")
+        return start
+
+    async def write_messages(self, batch: MessageBatch) -> None:
+        rows = [
+            (conversation_id, message["position"], dumps({k: v for k, v in message.items() if k != "position"}))
+            for conversation_id, messages in batch
+            for message in messages
+        ]
+        if not rows:
+            return
+
+        def insert() -> None:
+            # Rows already written by an earlier attempt are skipped
+            with self._transaction() as connection:
+                connection.executemany(
+                    "INSERT OR IGNORE INTO messages (conversation_id, position, message) VALUES (?, ?, ?)",
+                    rows
+                )
+
+        await self._run(insert)
+
+    async def load_recent(self, conversation_id: str, limit: int) -> Optional[Dict[str, Any]]:
+        def select() -> Optional[Dict[str, Any]]:
+            # One read transaction, so the count and the messages agree
+            with self._transaction("BEGIN") as connection:
+                row = connection.execute(
+                    "SELECT email, memory, message_count FROM conversations WHERE id = ?", (conversation_id,)
+                ).fetchone()
+                if row is None:
+                    return None
+                rows = connection.execute(
+                    "SELECT position, message FROM messages WHERE conversation_id = ? ORDER BY position DESC LIMIT ?",
+                    (conversation_id, limit)
+                ).fetchall()
+            email, memory, message_count = row
+            return {
+                "email": email,
+                "memory": loads(memory) if memory is not None else None,
+                "message_count": message_count,
+                "messages": [{**loads(message), "position": position} for position, message in reversed(rows)]
+            }
+
+        return await self._run(select)
+
+    async def list_conversations(
+        self,
+        email: str,
+        limit: int,
+        after: Optional[Tuple[datetime, str]] = None
+    ) -> List[Dict[str, Any]]:
+        def select() -> List[Dict[str, Any]]:
+            sql = "SELECT id, email, created_at, message_count FROM conversations WHERE email = ?"
+            params: List[Any] = [email]
+            if after is not None:
+                sql += " AND (created_at, id) < (?, ?)"
+                params += [_timestamp(after[0]), after[1]]
+            sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+            params.append(limit)
+            return [
+                {
+                    "conversation_id": conversation_id,
+                    "email": email,
+                    "created_at": as_utc(datetime.fromisoformat(created_at)),
+                    "message_count": message_count
+                }
+                for conversation_id, email, created_at, message_count in self._connection.execute(sql, params)
+            ]
+
+        return await self._run(select)
+
+    async def load_messages(
+        self,
+        conversation_id: str,
+        limit: int,
+        before: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        def select() -> Optional[Dict[str, Any]]:
+            with self._transaction("BEGIN") as connection:
+                row = connection.execute(
+                    "SELECT message_count FROM conversations WHERE id = ?", (conversation_id,)
+                ).fetchone()
+                if row is None:
+                    return None
+                (message_count,) = row
+                end = message_count if before is None else min(before, message_count)
+                rows = connection.execute(
+                    "SELECT position, message FROM messages WHERE conversation_id = ? AND position < ? "
+                    "ORDER BY position DESC LIMIT ?",
+                    (conversation_id, end, limit)
+                ).fetchall()
+            return {
+                "message_count": message_count,
+                "messages": [{**loads(message), "position": position} for position, message in reversed(rows)]
+            }
+
+        return await self._run(select)
+
+    async def find_idle(self, cutoff: datetime, limit: int) -> List[str]:
+        def select() -> List[str]:
+            rows = self._connection.execute(
+                "SELECT id FROM conversations WHERE COALESCE(updated_at, created_at) < ? "
+                "ORDER BY COALESCE(updated_at, created_at) LIMIT ?",
+                (_timestamp(cutoff), limit)
+            )
+            return [conversation_id for (conversation_id,) in rows]
+
+        return await self._run(select)
+
+    async def export_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        def select() -> Optional[Dict[str, Any]]:
+            with self._transaction("BEGIN") as connection:
+                row = connection.execute(
+                    "SELECT email, created_at, COALESCE(updated_at, created_at), memory, message_count "
+                    "FROM conversations WHERE id = ?",
+                    (conversation_id,)
+                ).fetchone()
+                if row is None:
+                    return None
+                rows = connection.execute(
+                    "SELECT position, message FROM messages WHERE conversation_id = ? ORDER BY position",
+                    (conversation_id,)
+                ).fetchall()
+            email, created_at, updated_at, memory, message_count = row
+            return {
+                "conversation_id": conversation_id,
+                "email": email,
+                "created_at": as_utc(datetime.fromisoformat(created_at)),
+                "updated_at": as_utc(datetime.fromisoformat(updated_at)),
+                "memory": loads(memory) if memory is not None else None,
+                "message_count": message_count,
+                "messages": [{**loads(message), "position": position} for position, message in rows]
+            }
+
+        return await self._run(select)
+
+    async def archive_conversation(self, record: Dict[str, Any], expected_count: int) -> bool:
+        values = []
+        for column in _ARCHIVE_COLUMNS:
+            value = record.get("conversation_id" if column == "id" else column)
+            values.append(_timestamp(value) if isinstance(value, datetime) else value)
+
+        def move() -> bool:
+            # One transaction: the conversation is either live or archived
+            with self._transaction() as connection:
+                deleted = connection.execute(
+                    "DELETE FROM conversations WHERE id = ? AND message_count = ?",
+                    (record["conversation_id"], expected_count)
+                ).rowcount
+                if not deleted:
+                    return False
+                connection.execute("DELETE FROM messages WHERE conversation_id = ?", (record["conversation_id"],))
+                connection.execute(
+                    f"INSERT OR REPLACE INTO conversation_archive ({', '.join(_ARCHIVE_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' for _ in _ARCHIVE_COLUMNS)})",
+                    values
+                )
+            return True
+
+        return await self._run(move)
+
+    async def purge_archive(self, now: datetime) -> int:
+        def delete() -> int:
+            return self._connection.execute(
+                "DELETE FROM conversation_archive WHERE expires_at <= ?", (_timestamp(now),)
+            ).rowcount
+
+        return await self._run(delete)
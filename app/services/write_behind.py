@@ -0,0 +1,436 @@
+"""
+Write-Behind Queue - Conversation messages persisted off the response path
+
+Turns hand their messages to the queue and return without waiting for
+MongoDB. A single writer task flushes the queue every
+WRITE_BEHIND_FLUSH_INTERVAL_MS: the queued appends of each conversation are
+coalesced into one position reservation (see ConversationStore.reserve),
+and the messages of every conversation in the flush are stored as one batch
+(a single bulk write on MongoDB).
+
+- Ordering: flushes run one at a time and a conversation's appends are
+  coalesced in the order they were queued, so its messages keep their order.
+- Bounded memory: at most WRITE_BEHIND_MAX_PENDING_MESSAGES messages wait
+  in memory; further appends wait for a flush to make room.
+- Durability: close() flushes what is left when the app shuts down. If the
+  process dies, up to one flush interval of messages is lost.
+- Reads: load_recent() and load_messages() add the messages that are not
+  written yet, so a turn always sees the turns before it, and
+  list_conversations() counts them.
+
+Failed writes are retried with exponential backoff, up to
+WRITE_BEHIND_MAX_RETRIES times, before the messages are dropped and logged.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.conversation_store import ConversationStore, get_conversation_store
+from app.utils.metrics import write_behind_messages_total
+
+logger = logging.getLogger(__name__)
+
+
+class _Append:
+    """Messages of one conversation waiting to be written"""
+
+    def __init__(self, conversation_id: str, messages: List[Dict[str, Any]], memory: Optional[Dict[str, Any]] = None):
+        self.conversation_id = conversation_id
+        self.messages = messages
+        self.memory = memory
+        # Position of the first message, once reserved
+        self.start: Optional[int] = None
+        # While the reservation is in flight the store may count the messages already
+        self.reserving = False
+        self.attempts = 0
+
+
+class WriteBehindQueue:
+    """Batches message appends per conversation and writes them in the background"""
+
+    def __init__(
+        self,
+        store: ConversationStore,
+        flush_interval: float = 0.05,
+        max_pending_messages: int = 10000,
+        max_retries: int = 8,
+        max_backoff: float = 5.0,
+        shutdown_timeout: float = 10.0
+    ):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.max_pending_messages = max_pending_messages
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.shutdown_timeout = shutdown_timeout
+        # Appends not reserved yet, one per conversation
+        self._pending: Dict[str, _Append] = {}
+        # Appends whose positions are reserved but whose messages are not written
+        self._unwritten: List[_Append] = []
+        # Appends of the flush in progress
+        self._inflight: List[_Append] = []
+        self._pending_messages = 0
+        self._flush_now = False
+        # Set when the reservations of the flush in progress have returned
+        self._reserved: Optional[asyncio.Event] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._changed: Optional[asyncio.Condition] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.stats = {"queued": 0, "written": 0, "retried": 0, "dropped": 0, "flushes": 0, "waits": 0}
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._wake = asyncio.Event()
+            self._changed = asyncio.Condition()
+            self._worker = asyncio.create_task(self._run())
+
+    async def enqueue(
+        self,
+        conversation_id: str,
+        messages: List[Dict[str, Any]],
+        memory: Optional[Dict[str, Any]] = None,
+        start: Optional[int] = None
+    ) -> None:
+        """
+        Queue messages to append to a conversation (and its new memory state)
+
+        Returns once the messages are queued, which is immediately unless the
+        queue is full.
+
+        Args:
+            conversation_id: Conversation ID
+            messages: Messages in conversation order
+            memory: New memory state, or None to keep the current one
+            start: Position of the first message if the caller already
+                reserved the positions (and set the memory state); only the
+                messages are left to write
+        """
+        self._ensure_worker()
+        if not self._has_room(len(messages)):
+            self.stats["waits"] += 1
+            self._wake.set()
+            async with self._changed:
+                await self._changed.wait_for(lambda: self._has_room(len(messages)))
+
+        if start is not None:
+            entry = _Append(conversation_id, self.store.positioned(messages, start))
+            entry.start = start
+            self._unwritten.append(entry)
+            self._pending_messages += len(messages)
+            self.stats["queued"] += len(messages)
+            self._wake.set()
+            return
+
+        entry = self._pending.get(conversation_id)
+        if entry is None:
+            entry = self._pending[conversation_id] = _Append(conversation_id, [])
+        entry.messages.extend(messages)
+        if memory is not None:
+            entry.memory = memory
+        self._pending_messages += len(messages)
+        self.stats["queued"] += len(messages)
+        self._wake.set()
+
+    def _has_room(self, count: int) -> bool:
+        # A single append larger than the queue still goes through once it is empty
+        return self._pending_messages == 0 or self._pending_messages + count <= self.max_pending_messages
+
+    def _queued_for(self, conversation_id: str) -> List[_Append]:
+        entries = {}
+        for entry in self._unwritten + self._inflight + list(self._pending.values()):
+            if entry.conversation_id == conversation_id:
+                entries.setdefault(id(entry), entry)
+        return list(entries.values())
+
+    def has_pending(self, conversation_id: str) -> bool:
+        """Whether messages of a conversation are queued and not written yet"""
+        return bool(self._queued_for(conversation_id))
+
+    async def wait_reserved(self, conversation_id: str) -> None:
+        """
+        Wait until every queued append of a conversation has its positions
+
+        Afterwards the conversation's message_count in MongoDB accounts for
+        everything this process queued for it.
+        """
+        def reserved() -> bool:
+            return all(entry.start is not None for entry in self._queued_for(conversation_id))
+
+        if reserved():
+            return
+        self._flush_now = True
+        self._wake.set()
+        async with self._changed:
+            await self._changed.wait_for(reserved)
+
+    async def load_recent(self, conversation_id: str, limit: int) -> Optional[Dict[str, Any]]:
+        """
+        ConversationStore.load_recent, including the messages not written yet
+
+        Args:
+            conversation_id: Conversation ID
+            limit: Number of recent messages to return
+
+        Returns:
+            Dict with email, memory, messages and message_count, or None if
+            the conversation does not exist
+        """
+        # Appends written while the read is in flight may or may not be in
+        # its result, so look at everything queued before or after it
+        before = self._queued_for(conversation_id)
+        conversation = await self.store.load_recent(conversation_id, limit)
+        await self._settle(before + self._queued_for(conversation_id))
+        return self._merge(conversation, before + self._queued_for(conversation_id), limit)
+
+    async def load_messages(
+        self,
+        conversation_id: str,
+        limit: int,
+        before: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        ConversationStore.load_messages, including the messages not written yet
+
+        Args:
+            conversation_id: Conversation ID
+            limit: Maximum number of messages to return
+            before: Only return messages at positions below this one, or None
+                for the most recent messages
+
+        Returns:
+            Dict with message_count and messages, or None if the conversation
+            does not exist
+        """
+        queued = self._queued_for(conversation_id)
+        page = await self.store.load_messages(conversation_id, limit, before)
+        await self._settle(queued + self._queued_for(conversation_id))
+        return self._merge(page, queued + self._queued_for(conversation_id), limit, before)
+
+    async def list_conversations(
+        self,
+        email: str,
+        limit: int,
+        after: Optional[Tuple[datetime, str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        ConversationStore.list_conversations, counting the messages not written yet
+
+        Args:
+            email: User's email address
+            limit: Maximum number of conversations to return
+            after: (created_at, conversation ID) of the last conversation of
+                the previous page, or None for the first page
+
+        Returns:
+            Dicts with conversation_id, email, created_at (in UTC) and message_count
+        """
+        # As in load_recent(), count what was queued before or after the read
+        before: Dict[str, List[_Append]] = {}
+        for entry in self._unwritten + self._inflight + list(self._pending.values()):
+            before.setdefault(entry.conversation_id, []).append(entry)
+        conversations = await self.store.list_conversations(email, limit, after)
+        queued = {
+            conversation["conversation_id"]: before.get(conversation["conversation_id"], [])
+            + self._queued_for(conversation["conversation_id"])
+            for conversation in conversations
+        }
+        await self._settle([entry for entries in queued.values() for entry in entries])
+        for conversation in conversations:
+            conversation["message_count"] = self._count_with(conversation["message_count"], queued[conversation["conversation_id"]])
+        return conversations
+
+    async def _settle(self, entries: List[_Append]) -> None:
+        """
+        Wait for the reservations of entries that are in flight
+
+        A read cannot tell whether the store counted such an entry's messages
+        yet; once its start position is known, _merge() can.
+        """
+        while any(entry.reserving for entry in entries):
+            await self._reserved.wait()
+
+    @staticmethod
+    def _count_with(count: int, queued: List[_Append]) -> int:
+        """A stored message_count plus the queued messages it does not include yet"""
+        entries = {id(entry): entry for entry in queued}.values()
+        for entry in entries:
+            if entry.start is not None:
+                count = max(count, entry.start + len(entry.messages))
+        return count + sum(len(entry.messages) for entry in entries if entry.start is None)
+
+    def _merge(
+        self,
+        conversation: Optional[Dict[str, Any]],
+        queued: List[_Append],
+        limit: int,
+        before: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Add queued messages to messages read from the store"""
+        entries = {id(entry): entry for entry in queued}.values()
+        if conversation is None or not entries:
+            return conversation
+
+        reserved = sorted((entry for entry in entries if entry.start is not None), key=lambda entry: entry.start)
+        unreserved = [entry for entry in entries if entry.start is None]
+        stored = {message.get("position") for message in conversation["messages"]}
+        messages = list(conversation["messages"])
+        count = conversation["message_count"]
+        for entry in reserved:
+            messages.extend(message for message in entry.messages if message["position"] not in stored)
+            count = max(count, entry.start + len(entry.messages))
+        for entry in unreserved:
+            messages.extend(self.store.positioned(entry.messages, count))
+            count += len(entry.messages)
+        if "memory" in conversation:
+            for entry in reserved + unreserved:
+                if entry.memory is not None:
+                    conversation["memory"] = entry.memory
+
+        # Reserved messages may fill gaps below the stored ones
+        messages.sort(key=lambda message: message["position"])
+        if before is not None:
+            messages = [message for message in messages if message["position"] < before]
+        conversation["messages"] = messages[-limit:] if limit else []
+        conversation["message_count"] = count
+        return conversation
+
+    async def flush(self) -> None:
+        """Wait until the queue is empty: everything queued is written (or dropped)"""
+        if self._worker is None or self._worker.done():
+            return
+        self._flush_now = True
+        self._wake.set()
+        async with self._changed:
+            await self._changed.wait_for(self._is_empty)
+
+    def _is_empty(self) -> bool:
+        return not (self._pending or self._unwritten or self._inflight)
+
+    async def close(self) -> None:
+        """Flush the queue (for at most shutdown_timeout seconds) and stop the writer"""
+        if self._worker is None:
+            return
+        try:
+            await asyncio.wait_for(self.flush(), self.shutdown_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"❌ {self._pending_messages} conversation messages were not written before shutdown")
+        self._worker.cancel()
+        await asyncio.gather(self._worker, return_exceptions=True)
+        self._worker = None
+
+    async def _run(self) -> None:
+        while True:
+            await self._wake.wait()
+            if not self._flush_now:
+                # Let appends arriving close together share a flush
+                await asyncio.sleep(self.flush_interval)
+            self._wake.clear()
+            self._flush_now = False
+            try:
+                await self._flush_once()
+            except Exception as e:
+                logger.error(f"Error flushing conversation messages: {e}", exc_info=True)
+            async with self._changed:
+                self._changed.notify_all()
+
+            attempts = max((entry.attempts for entry in self._unwritten + list(self._pending.values())), default=0)
+            if attempts:
+                await asyncio.sleep(min(self.max_backoff, self.flush_interval * 2 ** attempts))
+                self._wake.set()
+
+    async def _flush_once(self) -> None:
+        batch = list(self._pending.values())
+        retry = self._unwritten
+        self._pending = {}
+        self._unwritten = []
+        self._inflight = retry + batch
+        self.stats["flushes"] += 1
+        self._reserved = asyncio.Event()
+        for entry in batch:
+            entry.reserving = True
+        try:
+            try:
+                starts = await asyncio.gather(
+                    *[self.store.reserve(entry.conversation_id, len(entry.messages), entry.memory) for entry in batch],
+                    return_exceptions=True
+                )
+            finally:
+                for entry in batch:
+                    entry.reserving = False
+                self._reserved.set()
+            reserved = list(retry)
+            for entry, start in zip(batch, starts):
+                if isinstance(start, Exception):
+                    self._failed(entry, start)
+                    continue
+                entry.start = start
+                entry.messages = self.store.positioned(entry.messages, start)
+                reserved.append(entry)
+
+            try:
+                await self.store.write_messages([(entry.conversation_id, entry.messages) for entry in reserved])
+            except Exception as e:
+                for entry in reserved:
+                    self._failed(entry, e)
+            else:
+                for entry in reserved:
+                    self._done(entry, "written")
+        finally:
+            self._inflight = []
+
+    def _failed(self, entry: _Append, error: Exception) -> None:
+        entry.attempts += 1
+        # A missing conversation will not appear by retrying
+        if isinstance(error, ValueError) or entry.attempts > self.max_retries:
+            logger.error(
+                f"❌ Dropping {len(entry.messages)} messages of conversation {entry.conversation_id} "
+                f"after {entry.attempts} attempts: {error}"
+            )
+            self._done(entry, "dropped")
+            return
+
+        logger.warning(f"⚠️ Writing messages of conversation {entry.conversation_id} failed (attempt {entry.attempts}): {error}")
+        self.stats["retried"] += len(entry.messages)
+        write_behind_messages_total.inc(len(entry.messages), outcome="retried")
+        if entry.start is not None:
+            # Positions are reserved; only the (idempotent) message write is retried
+            self._unwritten.append(entry)
+            return
+        # Nothing was written; merge with any newer appends so they keep their order
+        newer = self._pending.pop(entry.conversation_id, None)
+        if newer is not None:
+            entry.messages.extend(newer.messages)
+            if newer.memory is not None:
+                entry.memory = newer.memory
+        self._pending[entry.conversation_id] = entry
+
+    def _done(self, entry: _Append, outcome: str) -> None:
+        self._pending_messages -= len(entry.messages)
+        self.stats[outcome] += len(entry.messages)
+        write_behind_messages_total.inc(len(entry.messages), outcome=outcome)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Message counts by outcome, and what is waiting to be written"""
+        return {
+            **self.stats,
+            "pending_messages": self._pending_messages,
+            "pending_conversations": len({entry.conversation_id for entry in self._unwritten}.union(self._pending)),
+            "flush_interval_ms": self.flush_interval * 1000,
+            "max_pending_messages": self.max_pending_messages
+        }
+
+
+def create_write_behind_queue() -> WriteBehindQueue:
+    """Build the write-behind queue from settings"""
+    return WriteBehindQueue(
+        store=get_conversation_store(),
+        flush_interval=settings.WRITE_BEHIND_FLUSH_INTERVAL_MS / 1000,
+        max_pending_messages=settings.WRITE_BEHIND_MAX_PENDING_MESSAGES,
+        max_retries=settings.WRITE_BEHIND_MAX_RETRIES
+    )
+
+
+# Singleton instance
+write_behind = create_write_behind_queue()
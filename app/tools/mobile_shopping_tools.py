@@ -5,6 +5,7 @@ from typing import List, Dict, Any, Optional
 from llama_index.core.tools import FunctionTool
 from llama_index.core.workflow import Context
 from app.services.mobile_data_service import get_mobile_data_service
+from app.utils.tracing import span
 import logging
 
 logger = logging.getLogger(__name__)
@@ -66,20 +67,23 @@ async def search_mobile_phones(
         logger.info("=" * 60)
         
         service = get_mobile_data_service()
-        results = service.search_mobiles(
-            brand=brand,
-            max_price_inr=max_price_inr,
-            min_price_inr=min_price_inr,
-            min_ram_gb=min_ram_gb,
-            min_battery_mah=min_battery_mah,
-            max_weight_g=max_weight_g,
-            min_screen_size=min_screen_size,
-            max_screen_size=max_screen_size,
-            processor_contains=processor_contains,
-            camera_contains=camera_contains,
-            exclude_apple=exclude_apple,
-            limit=limit
-        )
+        # Catalog lookups are in-memory scans of well under a millisecond, less
+        # than a hop to a worker thread costs, so they run inline
+        with span("tool", tool="search_mobile_phones"):
+            results = service.search_mobiles(
+                brand=brand,
+                max_price_inr=max_price_inr,
+                min_price_inr=min_price_inr,
+                min_ram_gb=min_ram_gb,
+                min_battery_mah=min_battery_mah,
+                max_weight_g=max_weight_g,
+                min_screen_size=min_screen_size,
+                max_screen_size=max_screen_size,
+                processor_contains=processor_contains,
+                camera_contains=camera_contains,
+                exclude_apple=exclude_apple,
+                limit=limit
+            )
         
         logger.info(f"✅ JSON Query Result: Found {len(results)} phones from JSON database")
         
@@ -124,7 +128,8 @@ async def compare_mobile_phones(
         logger.info("=" * 60)
         
         service = get_mobile_data_service()
-        results = service.compare_mobiles(model_names)
+        with span("tool", tool="compare_mobile_phones"):
+            results = service.compare_mobiles(model_names)
         
         if len(results) == 0:
             logger.warning(f"❌ JSON Query Result: No matching phones found for comparison")
@@ -179,7 +184,8 @@ async def get_mobile_details(
         logger.info("=" * 60)
         
         service = get_mobile_data_service()
-        result = service.get_mobile_by_model(model_name)
+        with span("tool", tool="get_mobile_details"):
+            result = service.get_mobile_by_model(model_name)
         
         if result is None:
             logger.warning(f"❌ JSON Query Result: Phone '{model_name}' not found in JSON database")
@@ -225,7 +231,8 @@ async def get_brand_list(
         logger.info("=" * 60)
         
         service = get_mobile_data_service()
-        brands = service.get_brands()
+        with span("tool", tool="get_brand_list"):
+            brands = service.get_brands()
         
         logger.info(f"✅ JSON Query Result: Found {len(brands)} brands from JSON database")
         
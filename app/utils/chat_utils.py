@@ -1,4 +1,5 @@
 import logging
+import re
 from typing import Dict, Any, List
 from datetime import datetime, timezone, timedelta
 import pytz
@@ -6,17 +7,18 @@ import json
 
 logger = logging.getLogger(__name__)
 
-async def format_conversation_history(messages: List[Dict[str, Any]]) -> str:
+async def format_conversation_history(messages: List[Dict[str, Any]], summary: str = "") -> str:
     """
     Format the conversation history into a single string, suitable for LLM context.
 
     Args:
         messages: List of message objects from the database
+        summary: Summary of the turns older than messages, if any
 
     Returns:
         A formatted conversation history string
     """
-    formatted_history = ""
+    lines = []
     
     for message in messages:
         role = message.get("role", "user")
@@ -29,10 +31,29 @@ async def format_conversation_history(messages: List[Dict[str, Any]]) -> str:
         elif not isinstance(content, str):
             content = str(content)
         
-        formatted_history += f"{role}: {content}\n"
+        lines.append(f"{role}: {content}\n")
     
+    formatted_history = "".join(lines)
+    if summary:
+        formatted_history = f"Summary of earlier turns:\n{summary}\n\nRecent messages:\n{formatted_history}"
     return formatted_history
 
+def normalize_query(message: str) -> str:
+    """
+    Normalize a user query for matching and caching.
+    
+    Lowercases, drops currency markers and punctuation and collapses
+    whitespace, so "Samsung phones under ₹20,000?" and
+    "samsung phones under 20000" normalize to the same string. Decimal
+    points ("1.5 lakh") are kept.
+    """
+    text = message.lower().strip()
+    text = re.sub(r"(?<=\d),(?=\d)", "", text)
+    text = text.replace("₹", " ").replace("rs.", " ")
+    text = re.sub(r"\b(?:rs|inr|rupees)\b", " ", text)
+    text = re.sub(r"[?!,;:]|(?<!\d)\.|\.(?!\d)", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
 async def format_schema_context(table_schemas: Dict[str, Any]) -> str:
     """Helper function to format table schemas for context"""
     if not table_schemas:
@@ -69,6 +90,9 @@ def log_conversation(conversation_id: str, user_message: str, bot_response: str)
     logger.info(f"Conversation {conversation_id}: User: {user_message}")
     logger.info(f"Conversation {conversation_id}: Bot: {bot_response}")
 
-def now_pt_iso():
+def now_pt():
     pacific = pytz.timezone("America/Los_Angeles")
-    return datetime.now(pacific).isoformat()
\ No newline at end of file
+    return datetime.now(pacific)
+
+def now_pt_iso():
+    return now_pt().isoformat()
\ No newline at end of file
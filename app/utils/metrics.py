@@ -0,0 +1,223 @@
+"""
+Metrics - In-process counters, gauges and histograms in the Prometheus text format
+
+Deliberately small: metrics are registered once at import time, updated
+with inc()/set()/observe() and rendered by the /metrics endpoint.
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Latency buckets in seconds, from sub-millisecond DB calls to slow LLM runs
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing value per label set"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Current value per label set, which can go up and down"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def get(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Bucketed observations (cumulative buckets, sum and count) per label set"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label set -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[index] += 1
+                    break
+            entry[-2] += value
+            entry[-1] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(entry)) for key, entry in self._values.items())
+        lines = []
+        for key, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                le = 'le="%s"' % _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {entry[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(entry[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {entry[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric and renders them for /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Optional[Tuple[float, ...]] = None) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets or DEFAULT_BUCKETS))
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Singleton registry and the application's metrics
+registry = MetricsRegistry()
+
+http_requests_total = registry.counter(
+    "http_requests_total", "HTTP requests handled", ["method", "route", "status"]
+)
+http_request_duration_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"]
+)
+stage_duration_seconds = registry.histogram(
+    "stage_duration_seconds", "Latency of one request stage (mongo, history, agent, llm, tool, serialization)", ["stage"]
+)
+tool_calls_total = registry.counter(
+    "tool_calls_total", "Agent tool calls", ["tool", "status"]
+)
+cache_requests_total = registry.counter(
+    "cache_requests_total", "Lookups in the fast path and response cache", ["cache", "result"]
+)
+agent_runs_total = registry.counter(
+    "agent_runs_total", "Agent runs by outcome (ok, timeout, error, rejected by the open circuit, cancelled)", ["outcome"]
+)
+llm_calls_total = registry.counter(
+    "llm_calls_total", "LLM chat calls", ["model", "status"]
+)
+llm_tokens_total = registry.counter(
+    "llm_tokens_total", "LLM tokens used (reported by the provider, or estimated)", ["model", "kind"]
+)
+write_behind_messages_total = registry.counter(
+    "write_behind_messages_total", "Conversation messages leaving the write-behind queue (written, retried, dropped)", ["outcome"]
+)
+retention_conversations_total = registry.counter(
+    "retention_conversations_total", "Conversations handled by the retention job (archived, skipped, failed, purged)", ["outcome"]
+)
+retention_bytes_total = registry.counter(
+    "retention_bytes_total", "Bytes moved by the retention job (reclaimed from live storage, written to the archive)", ["kind"]
+)
+admission_requests_total = registry.counter(
+    "admission_requests_total", "Agent run admissions (admitted, rate_limited, queue_full, queue_timeout)", ["outcome"]
+)
+admission_in_flight = registry.gauge(
+    "admission_in_flight", "Admitted agent runs in progress"
+)
+admission_queue_depth = registry.gauge(
+    "admission_queue_depth", "Requests waiting for an agent run slot"
+)
+admission_wait_seconds = registry.histogram(
+    "admission_wait_seconds", "Time admitted requests waited for an agent run slot"
+)
+client_disconnects_total = registry.counter(
+    "client_disconnects_total", "Message requests whose client went away before the answer was ready", ["endpoint"]
+)
+cancelled_work_total = registry.counter(
+    "cancelled_work_total", "Work spent on agent runs cancelled before they finished (agent_seconds, tool_calls, response_tokens)", ["kind"]
+)
+idempotency_requests_total = registry.counter(
+    "idempotency_requests_total", "Requests with an Idempotency-Key (executed, replayed, joined, in_progress, mismatch)", ["outcome"]
+)
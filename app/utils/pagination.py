@@ -0,0 +1,34 @@
+"""
+Keyset pagination cursors
+
+A cursor is the sort key of the last item on a page, encoded as an opaque
+URL-safe string. The next page starts strictly after that key, so it is
+read straight from an index however deep the client pages, and items
+added meanwhile do not shift the pages.
+"""
+import base64
+import binascii
+from typing import Any, Dict
+
+from app.utils.serialization import dumps, loads
+
+
+def encode_cursor(key: Dict[str, Any]) -> str:
+    """Encode a sort key as an opaque cursor"""
+    return base64.urlsafe_b64encode(dumps(key).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """
+    Decode a cursor made by encode_cursor
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        key = loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(key, dict):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return key
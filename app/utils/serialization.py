@@ -0,0 +1,138 @@
+"""
+Serialization helpers for tool outputs and streamed payloads
+"""
+import json
+import logging
+from typing import Any, Callable, Dict
+
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # A dependency, but keep working without it on the standard library
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+_PLAIN_TYPES = (type(None), str, int, float, bool)
+
+# Exact type -> handler. Filled lazily the first time a type is seen.
+_handlers: Dict[type, Callable[[Any], Any]] = {}
+
+
+def to_serializable(data: Any) -> Any:
+    """
+    Convert data to a BSON/JSON serializable format.
+
+    Handlers are looked up by exact type, so dicts and lists that are already
+    plain JSON are returned as-is without being copied. Pydantic models are
+    dumped, objects with to_dict() are converted and anything else becomes
+    its string representation.
+    """
+    handler = _handlers.get(type(data))
+    if handler is None:
+        handler = _resolve_handler(type(data))
+    return handler(data)
+
+
+def dumps(data: Any) -> str:
+    """Encode data as a JSON string, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def dump_bytes(data: Any) -> bytes:
+    """Encode data as compact UTF-8 JSON, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, default=str, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: Any) -> Any:
+    """Decode a JSON string or bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _identity(data: Any) -> Any:
+    return data
+
+
+def _serialize_plain_dict(data: Dict[Any, Any]) -> Dict[Any, Any]:
+    """Serialize a dict, only copying it if one of its values had to change"""
+    result = None
+    for key, value in data.items():
+        if type(value) in _PLAIN_TYPES:
+            continue
+        converted = to_serializable(value)
+        if converted is not value:
+            if result is None:
+                result = dict(data)
+            result[key] = converted
+    return data if result is None else result
+
+
+def _serialize_plain_list(data: list) -> list:
+    """Serialize a list, only copying it if one of its items had to change"""
+    result = None
+    for index, item in enumerate(data):
+        if type(item) in _PLAIN_TYPES:
+            continue
+        converted = to_serializable(item)
+        if converted is not item:
+            if result is None:
+                result = list(data)
+            result[index] = converted
+    return data if result is None else result
+
+
+def _serialize_mapping(data: Dict[Any, Any]) -> Dict[Any, Any]:
+    return {key: to_serializable(value) for key, value in data.items()}
+
+
+def _serialize_sequence(data: Any) -> list:
+    return [to_serializable(item) for item in data]
+
+
+def _serialize_pydantic(data: BaseModel) -> Any:
+    return to_serializable(data.model_dump())
+
+
+def _make_object_handler(has_dict: bool, has_to_dict: bool) -> Callable[[Any], Any]:
+    """Build a handler for objects that may expose dict() or to_dict()"""
+    def handler(data: Any) -> Any:
+        if has_dict:
+            try:
+                return to_serializable(data.dict())
+            except Exception:
+                pass
+        if has_to_dict:
+            try:
+                return to_serializable(data.to_dict())
+            except Exception:
+                pass
+        # For any other type (like FunctionTool), convert to string
+        return str(data)
+    return handler
+
+
+def _resolve_handler(data_type: type) -> Callable[[Any], Any]:
+    """Pick and cache the handler for a type the first time it is seen"""
+    if issubclass(data_type, _PLAIN_TYPES):
+        handler = _identity
+    elif data_type is dict:
+        handler = _serialize_plain_dict
+    elif data_type is list:
+        handler = _serialize_plain_list
+    elif issubclass(data_type, dict):
+        handler = _serialize_mapping
+    elif issubclass(data_type, (list, tuple)):
+        handler = _serialize_sequence
+    elif issubclass(data_type, BaseModel):
+        handler = _serialize_pydantic
+    else:
+        handler = _make_object_handler(hasattr(data_type, "dict"), hasattr(data_type, "to_dict"))
+    _handlers[data_type] = handler
+    return handler
@@ -0,0 +1,72 @@
+"""
+Single Flight - Coalesces concurrent calls that share a key into one execution
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one in-flight call per key. Callers that arrive while a call
+    with the same key is running await that call and share its result.
+
+    - The call runs in its own task, so one caller being cancelled does not
+      cancel it for the others. It is only cancelled once every caller has
+      gone away.
+    - An exception raised by the call is raised in every caller.
+    - Keys are forgotten as soon as the call finishes; results are not cached.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self.stats = {"calls": 0, "coalesced": 0, "cancelled": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run fn() for key, or join the call already in flight for key
+
+        Args:
+            key: Hashable key identifying identical calls
+            fn: Zero-argument coroutine function producing the result
+
+        Returns:
+            The result of the (possibly shared) call
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.create_task(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task, key=key, call=call: self._forget(key, call))
+            self.stats["calls"] += 1
+        else:
+            self.stats["coalesced"] += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Every caller gave up, nobody is left to use the result
+                self.stats["cancelled"] += 1
+                call.task.cancel()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def is_in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # Retrieve the exception so asyncio does not warn about it when no
+        # caller was left to see it; callers still get it through shield()
+        if not call.task.cancelled():
+            call.task.exception()
@@ -0,0 +1,179 @@
+"""
+Startup Profile - Import time and per-stage timings of application startup
+
+Startup stages (opening the conversation store, loading the catalog,
+building the agent) are timed with stage(), always, and summarized in one
+log line once startup completes. The stages run concurrently, so each is
+reported with its start offset as well as its duration.
+
+With `python run.py --profile-startup`, track_imports() also times every
+module imported while the app loads and starts, and report() attributes the
+time to top-level packages (llama_index, fastapi, pymongo, ...). A package
+is credited with its own modules only, not the packages they import, so
+the times add up to the total. The import hook is only
+installed for the profile; a normal start pays nothing for it.
+"""
+import importlib.abc
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _TimedLoader:
+    """Wraps a module's loader to time exec_module (i.e. running the module body)"""
+
+    def __init__(self, loader: Any, profile: "StartupProfile"):
+        self._loader = loader
+        self._profile = profile
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._loader, name)
+
+    def create_module(self, spec: Any) -> Any:
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module: Any) -> None:
+        with self._profile._timed_import(module.__name__):
+            self._loader.exec_module(module)
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    """Meta path finder that hands every found module a timed loader"""
+
+    def __init__(self, profile: "StartupProfile"):
+        self._profile = profile
+
+    def find_spec(self, fullname: str, path: Any, target: Any = None) -> Any:
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    self._profile._wrapped.append((fullname, spec.loader))
+                    spec.loader = _TimedLoader(spec.loader, self._profile)
+                return spec
+        return None
+
+
+class StartupProfile:
+    """Timings of one application start"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # name -> (start offset from self.started, duration) in seconds
+        self.stages: Dict[str, Tuple[float, float]] = {}
+        # top-level package -> [seconds, modules]
+        self.imports: Dict[str, List[float]] = {}
+        self.import_seconds: Optional[float] = None
+        self._timer: Optional[_ImportTimer] = None
+        self._wrapped: List[Tuple[str, Any]] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time a startup stage (sync or async code inside the with block)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = (start - self.started, time.perf_counter() - start)
+
+    def track_imports(self) -> None:
+        """Time the modules imported from now on, until finish()"""
+        if self._timer is None:
+            self._timer = _ImportTimer(self)
+            sys.meta_path.insert(0, self._timer)
+
+    @contextmanager
+    def _timed_import(self, name: str) -> Iterator[None]:
+        # [package, seconds spent importing other packages] of the modules
+        # being imported on this thread (agent setup imports in a worker thread)
+        stack = self._local.__dict__.setdefault("stack", [])
+        package = name.partition(".")[0]
+        # Only the outermost import of a package is credited to it, without
+        # the other packages it imported, so no time is counted twice
+        outermost = all(frame[0] != package for frame in stack)
+        frame = [package, 0.0]
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            if stack:
+                stack[-1][1] += elapsed if outermost else frame[1]
+            with self._lock:
+                totals = self.imports.setdefault(package, [0.0, 0])
+                totals[1] += 1
+                if outermost:
+                    totals[0] += elapsed - frame[1]
+
+    def finish(self) -> None:
+        """Stop timing imports and give the imported modules back their own loaders"""
+        if self._timer is None:
+            return
+        try:
+            sys.meta_path.remove(self._timer)
+        except ValueError:
+            pass
+        self._timer = None
+        for name, loader in self._wrapped:
+            module = sys.modules.get(name)
+            if module is None:
+                continue
+            if isinstance(getattr(module, "__loader__", None), _TimedLoader):
+                module.__loader__ = loader
+            spec = getattr(module, "__spec__", None)
+            if spec is not None and isinstance(spec.loader, _TimedLoader):
+                spec.loader = loader
+        self._wrapped.clear()
+
+    def summary(self) -> str:
+        """One line with each stage's duration"""
+        stages = ", ".join(f"{name} {duration:.2f}s" for name, (_, duration) in self.stages.items())
+        return f"{stages} (startup took {self.startup_seconds():.2f}s)"
+
+    def startup_seconds(self) -> float:
+        """Wall time from the first stage's start to the last stage's end"""
+        if not self.stages:
+            return 0.0
+        start = min(offset for offset, _ in self.stages.values())
+        end = max(offset + duration for offset, duration in self.stages.values())
+        return end - start
+
+    def report(self, top: int = 15) -> str:
+        """
+        Render the full profile: import time and the startup stages
+
+        Args:
+            top: Number of top-level packages to list by import time
+
+        Returns:
+            Multi-line text report
+        """
+        lines = ["Startup profile"]
+        if self.import_seconds is not None:
+            lines.append(f"  import app.main  {self.import_seconds:8.3f}s")
+        if self.imports:
+            lines.append(f"\n  Imports by top-level package (top {top}, excluding the packages each imports)")
+            ranked = sorted(self.imports.items(), key=lambda item: item[1][0], reverse=True)
+            for package, (seconds, modules) in ranked[:top]:
+                lines.append(f"    {package:<28} {seconds:8.3f}s  {modules:>5} modules")
+        if self.stages:
+            lines.append("\n  Startup stages (start offset, duration)")
+            for name, (offset, duration) in sorted(self.stages.items(), key=lambda item: item[1][0]):
+                lines.append(f"    {name:<28} +{offset:7.3f}s  {duration:8.3f}s")
+            lines.append(f"    {'startup (wall time)':<28} {'':>9}  {self.startup_seconds():8.3f}s")
+        return "\n".join(lines)
+
+
+# Singleton instance - covers the process's application start
+startup_profile = StartupProfile()
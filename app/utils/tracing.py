@@ -0,0 +1,155 @@
+"""
+Tracing - Per-request span trees and per-stage latency samples
+
+Each HTTP request gets a root span (see TracingMiddleware). Stages inside it
+(mongo, history, agent, llm, tool, serialization, ...) are timed with span()
+or record() and attached to the current span, which follows the request
+through asyncio tasks via a context variable. Every stage duration is also
+kept in a bounded reservoir for percentiles and observed in the
+stage_duration_seconds histogram.
+"""
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Any, Iterator, List, Optional
+
+from app.utils.metrics import stage_duration_seconds
+
+logger = logging.getLogger(__name__)
+
+# Samples kept per stage; older ones are dropped
+MAX_SAMPLES = 10000
+
+# Children kept per span, so a runaway loop cannot grow a trace without bound
+MAX_CHILDREN = 200
+
+_samples: Dict[str, Deque[float]] = {}
+_counts: Dict[str, int] = {}
+
+
+class Span:
+    """One timed operation; children are the operations it contained"""
+
+    __slots__ = ("name", "attrs", "start", "duration", "children")
+
+    def __init__(self, name: str, attrs: Optional[Dict[str, Any]] = None, start: Optional[float] = None):
+        self.name = name
+        self.attrs = attrs or {}
+        self.start = time.perf_counter() if start is None else start
+        self.duration: Optional[float] = None
+        self.children: List["Span"] = []
+
+    def add_child(self, child: "Span") -> None:
+        if len(self.children) < MAX_CHILDREN:
+            self.children.append(child)
+
+    def end(self) -> float:
+        """Close the span and record its duration as a stage sample"""
+        if self.duration is None:
+            self.duration = time.perf_counter() - self.start
+            _record_sample(self.name, self.duration)
+        return self.duration
+
+    def format_tree(self) -> str:
+        """Render the span and its children as an indented tree with start offsets"""
+        lines: List[str] = []
+        self._format(lines, self.start, 0)
+        return "\n".join(lines)
+
+    def _format(self, lines: List[str], origin: float, depth: int) -> None:
+        duration = f"{self.duration * 1000:.1f}ms" if self.duration is not None else "open"
+        attrs = " ".join(f"{key}={value}" for key, value in self.attrs.items())
+        lines.append(f"{'  ' * depth}+{(self.start - origin) * 1000:.1f}ms {self.name} {duration} {attrs}".rstrip())
+        for child in sorted(self.children, key=lambda span: span.start):
+            child._format(lines, origin, depth + 1)
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def start_span(name: str, **attrs: Any) -> Span:
+    """Start a child of the current span without making it current; call end() on it"""
+    span_ = Span(name, attrs)
+    parent = _current_span.get()
+    if parent is not None:
+        parent.add_child(span_)
+    return span_
+
+
+@contextmanager
+def use_span(span_: Span) -> Iterator[Span]:
+    """Make span_ the current span for the enclosed block (and tasks created in it)"""
+    token = _current_span.set(span_)
+    try:
+        yield span_
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(stage: str, **attrs: Any) -> Iterator[Span]:
+    """
+    Time the enclosed block as one sample of stage, nested under the current span.
+    The block must not yield from an async generator, since the current span
+    is kept in a context variable.
+    """
+    span_ = start_span(stage, **attrs)
+    try:
+        with use_span(span_):
+            yield span_
+    finally:
+        span_.end()
+
+
+def record(stage: str, seconds: float, parent: Optional[Span] = None, **attrs: Any) -> None:
+    """Record a duration measured elsewhere, as a child of parent (default: the current span)"""
+    _record_sample(stage, seconds)
+    parent = parent if parent is not None else _current_span.get()
+    if parent is not None:
+        span_ = Span(stage, attrs, start=time.perf_counter() - seconds)
+        span_.duration = seconds
+        parent.add_child(span_)
+
+
+def _record_sample(stage: str, seconds: float) -> None:
+    samples = _samples.get(stage)
+    if samples is None:
+        samples = _samples[stage] = deque(maxlen=MAX_SAMPLES)
+    samples.append(seconds)
+    _counts[stage] = _counts.get(stage, 0) + 1
+    stage_duration_seconds.observe(seconds, stage=stage)
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def get_stage_stats() -> Dict[str, Dict[str, Any]]:
+    """Count and latency percentiles (in ms) for every recorded stage"""
+    stats = {}
+    for stage, samples in _samples.items():
+        values = sorted(samples)
+        stats[stage] = {
+            "count": _counts[stage],
+            "mean_ms": round(sum(values) / len(values) * 1000, 2) if values else 0.0,
+            "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+        }
+    return stats
+
+
+def reset() -> None:
+    """Drop all recorded samples"""
+    _samples.clear()
+    _counts.clear()
@@ -0,0 +1,212 @@
+"""
+Event loop lag - How much conversation persistence stalls the event loop
+
+Runs N concurrent conversations through the persistence part of a chat
+turn (load the conversation and store the user message, then store the
+assistant message) while a monitor task measures how late the event loop
+wakes it up. Every millisecond of lag is added to the latency of every
+other request the process is serving.
+
+Two modes, run one after the other on the same database:
+- blocking: synchronous pymongo calls made on the event loop (the
+  conversation service before its async path)
+- async: ConversationService's async path (AsyncMongoClient; worker
+  threads for --in-memory-db), with messages written through the
+  write-behind queue when WRITE_BEHIND_ENABLED is on; the final flush
+  counts towards the elapsed time
+
+Usage:
+    python -m benchmarks.event_loop_lag --conversations 100 --turns 5
+    python -m benchmarks.event_loop_lag --in-memory-db --db-latency-ms 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+# Settings are read at import time; keep benchmark data out of the app database
+os.environ.setdefault("MONGODB_DB_NAME", "benchmark_event_loop_lag")
+# This measures MongoDB, whatever conversation store is configured
+os.environ["CONVERSATION_STORE_BACKEND"] = "mongodb"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Event loop lag caused by conversation persistence")
+    parser.add_argument("--conversations", type=int, default=50, help="Concurrent conversations")
+    parser.add_argument("--turns", type=int, default=5, help="Turns per conversation")
+    parser.add_argument("--interval-ms", type=float, default=5, help="Lag monitor tick")
+    parser.add_argument("--mode", choices=["both", "blocking", "async"], default="both")
+    parser.add_argument("--in-memory-db", action="store_true", help="Use mongomock instead of MONGODB_URI")
+    parser.add_argument("--db-latency-ms", type=float, default=1.0,
+                        help="Round trip added to every in-memory DB call (the network a real server adds)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    return parser.parse_args()
+
+
+class _SlowCollection:
+    """Collection proxy that sleeps for the emulated round trip before each call"""
+
+    def __init__(self, collection: Any, latency: float):
+        self._collection = collection
+        self._latency = latency
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._collection, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args: Any, **kwargs: Any) -> Any:
+            time.sleep(self._latency)
+            return attr(*args, **kwargs)
+
+        return call
+
+    def bulk_write(self, requests: List[Any], **kwargs: Any) -> Any:
+        # A bulk write is one round trip, however many operations it carries
+        from app.db.mongodb import bulk_write_compat
+
+        time.sleep(self._latency)
+        return bulk_write_compat(self._collection, requests, **kwargs)
+
+
+class _SlowDatabase:
+    def __init__(self, db: Any, latency: float):
+        self._db = db
+        self._latency = latency
+
+    def __getitem__(self, name: str) -> _SlowCollection:
+        return _SlowCollection(self._db[name], self._latency)
+
+
+def use_in_memory_db(latency_ms: float) -> None:
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit("--in-memory-db needs the 'mongomock' package from the dev dependencies (uv sync)")
+    from app.db.mongodb import MongoDB
+
+    MongoDB.client = mongomock.MongoClient()
+    MongoDB.db = _SlowDatabase(MongoDB.client["event_loop_lag"], latency_ms / 1000)
+
+
+async def monitor_lag(interval: float, samples: List[float], stop: asyncio.Event) -> None:
+    """Sleep for interval over and over, recording how late each wake-up is"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - start - interval))
+
+
+async def blocking_conversation(index: int, turns: int) -> None:
+    """The persistence calls of a conversation as synchronous pymongo calls"""
+    from app.core.config import settings
+    from app.db.mongodb import mongodb
+    from app.services.conversation_memory import conversation_memory
+    from app.services.conversation_service import conversation_service
+    from app.services.message_store import message_store
+    from app.utils.chat_utils import now_pt_iso
+
+    collection = mongodb.get_collection(message_store.conversations_collection)
+    result = collection.insert_one({"email": f"lag{index}@example.com", "created_at": now_pt_iso(), "messages": []})
+    query = {"_id": result.inserted_id}
+    for turn in range(turns):
+        conversation = collection.find_one(query)
+        messages = conversation.get("messages", [])
+        conversation_memory.prepare(messages[-settings.MEMORY_WINDOW_MESSAGES:], conversation.get("memory"), total_count=len(messages))
+        timestamp = now_pt_iso()
+        user_entry = conversation_service._message_entry("user", f"question {turn}", timestamp)
+        collection.update_one(query, {"$push": {"messages": {"$each": [user_entry]}}})
+        # Yield as the agent run would between the two writes
+        await asyncio.sleep(0)
+        assistant_entry = conversation_service._message_entry("assistant", f"answer {turn}", timestamp)
+        collection.update_one(query, {"$push": {"messages": {"$each": [assistant_entry]}}})
+
+
+async def async_conversation(index: int, turns: int) -> None:
+    """The same conversation through ConversationService's async path"""
+    from app.services.conversation_service import conversation_service
+
+    conversation = await conversation_service.create_conversation(f"lag{index}@example.com")
+    conversation_id = conversation["conversation_id"]
+    for turn in range(turns):
+        started = await conversation_service._start_turn(conversation_id, f"question {turn}")
+        await asyncio.sleep(0)
+        await conversation_service._finish_turn(conversation_id, started["timestamp"], {"response": f"answer {turn}"})
+
+
+async def measure(mode: str, args: argparse.Namespace) -> Dict[str, Any]:
+    from app.services.write_behind import write_behind
+    from app.utils.tracing import percentile
+
+    run_conversation = blocking_conversation if mode == "blocking" else async_conversation
+    samples: List[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_lag(args.interval_ms / 1000, samples, stop))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[run_conversation(i, args.turns) for i in range(args.conversations)])
+    await write_behind.flush()
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await monitor
+    lag = sorted(samples)
+    return {
+        "mode": mode,
+        "turns": args.conversations * args.turns,
+        "elapsed_s": round(elapsed, 3),
+        "turns_per_s": round(args.conversations * args.turns / elapsed, 2) if elapsed else 0.0,
+        "lag_ms": {
+            "p50": round(percentile(lag, 0.50) * 1000, 2),
+            "p99": round(percentile(lag, 0.99) * 1000, 2),
+            "max": round(lag[-1] * 1000, 2) if lag else 0.0,
+        },
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from app.db.mongodb import mongodb
+
+    if args.in_memory_db:
+        use_in_memory_db(args.db_latency_ms)
+    mongodb.connect_to_mongodb()
+
+    modes = ["blocking", "async"] if args.mode == "both" else [args.mode]
+    try:
+        results = [await measure(mode, args) for mode in modes]
+    finally:
+        if not args.in_memory_db:
+            mongodb.get_collection("conversations").drop()
+        await mongodb.close_mongodb_connection()
+    return {
+        "conversations": args.conversations,
+        "turns": args.turns,
+        "database": "in-memory" if args.in_memory_db else "MONGODB_URI",
+        "db_latency_ms": args.db_latency_ms if args.in_memory_db else None,
+        "results": results,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    latency = f", {report['db_latency_ms']}ms per call" if report["db_latency_ms"] is not None else ""
+    print(f"\n{report['conversations']} conversations x {report['turns']} turns ({report['database']}{latency})")
+    for result in report["results"]:
+        lag = result["lag_ms"]
+        print(f"{result['mode']:<9} {result['turns_per_s']:>9.2f} turns/s  "
+              f"loop lag p50 {lag['p50']:>8.2f}ms  p99 {lag['p99']:>8.2f}ms  max {lag['max']:>8.2f}ms")
+
+
+def main() -> None:
+    args = parse_args()
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
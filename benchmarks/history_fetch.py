@@ -0,0 +1,185 @@
+"""
+History fetch - Cost of loading a conversation's history by conversation length
+
+For conversations of 10, 1k and 10k messages, compares:
+- full: find_one on a conversation that embeds its messages array (how
+  turns loaded history before; the tail was then cut in Python)
+- tail: ConversationService._load_recent, which reads the conversation
+  and its last message buckets (see MessageStore)
+
+Each conversation is written in the embedded layout and then migrated to
+buckets, so the one-off migration time is reported as well.
+
+Reports latency percentiles and the size of the returned document. The
+tail read should stay the same size however long the conversation is;
+--check exits non-zero when it does not, so this can guard regressions.
+
+With --in-memory-db the timings only show relative costs; mongomock
+copies whole documents in Python, so they say little about a real server.
+
+Usage:
+    python -m benchmarks.history_fetch
+    python -m benchmarks.history_fetch --in-memory-db --sizes 10 1000 10000 --check
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+# Settings are read at import time; keep benchmark data out of the app database
+os.environ.setdefault("MONGODB_DB_NAME", "benchmark_history_fetch")
+# This measures MongoDB, whatever conversation store is configured
+os.environ["CONVERSATION_STORE_BACKEND"] = "mongodb"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="History fetch cost by conversation length")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000], help="Messages per conversation")
+    parser.add_argument("--iterations", type=int, default=30, help="Reads per size and method")
+    parser.add_argument("--in-memory-db", action="store_true", help="Use mongomock instead of MONGODB_URI")
+    parser.add_argument("--check", action="store_true", help="Fail if the tail read grows with the conversation")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    return parser.parse_args()
+
+
+def use_in_memory_db() -> None:
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit("--in-memory-db needs the 'mongomock' package (pip install mongomock)")
+    from app.db.mongodb import MongoDB
+
+    MongoDB.client = mongomock.MongoClient()
+    MongoDB.db = MongoDB.client["history_fetch"]
+
+
+def build_messages(count: int) -> List[Dict[str, Any]]:
+    """Alternating user/assistant messages of a fixed, realistic size"""
+    from app.services.conversation_service import conversation_service
+
+    messages = []
+    for index in range(count):
+        role = "user" if index % 2 == 0 else "assistant"
+        content = f"message {index:06d} " + ("Samsung phones under 30k with a good camera and battery. " * 4)
+        messages.append(conversation_service._message_entry(role, content, "2024-01-01T00:00:00-08:00"))
+    return messages
+
+
+async def time_reads(read, iterations: int) -> Dict[str, Any]:
+    import bson
+    from app.utils.tracing import percentile
+
+    durations = []
+    document = None
+    for _ in range(iterations):
+        start = time.perf_counter()
+        document = await read()
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+    return {
+        "p50_ms": round(percentile(durations, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(durations, 0.95) * 1000, 3),
+        "bytes": len(bson.encode(document)),
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from app.core.config import settings
+    from app.db.mongodb import mongodb
+    from app.services.conversation_service import conversation_service
+    from app.services.message_store import message_store
+
+    if args.in_memory_db:
+        use_in_memory_db()
+    mongodb.connect_to_mongodb()
+    await message_store.ensure_indexes()
+    conversations = mongodb.get_async_collection(message_store.conversations_collection)
+    # Untouched copies in the embedded layout, for the full reads
+    legacy = mongodb.get_async_collection("legacy_conversations")
+
+    results = []
+    try:
+        for size in args.sizes:
+            document = {
+                "email": "history@example.com",
+                "created_at": "2024-01-01T00:00:00-08:00",
+                "messages": build_messages(size),
+            }
+            legacy_id = (await legacy.insert_one(dict(document))).inserted_id
+            conversation_id = (await conversations.insert_one(dict(document))).inserted_id
+
+            start = time.perf_counter()
+            await message_store.migrate_conversation(conversation_id)
+            migrate_ms = round((time.perf_counter() - start) * 1000, 3)
+
+            async def full_read():
+                return await legacy.find_one({"_id": legacy_id})
+
+            async def tail_read():
+                return await conversation_service._load_recent(str(conversation_id))
+
+            results.append({
+                "messages": size,
+                "migrate_ms": migrate_ms,
+                "full": await time_reads(full_read, args.iterations),
+                "tail": await time_reads(tail_read, args.iterations),
+            })
+    finally:
+        if not args.in_memory_db:
+            for name in (message_store.conversations_collection, message_store.buckets_collection, "legacy_conversations"):
+                mongodb.get_collection(name).drop()
+        await mongodb.close_mongodb_connection()
+
+    return {
+        "database": "in-memory" if args.in_memory_db else "MONGODB_URI",
+        "window": settings.MEMORY_WINDOW_MESSAGES,
+        "iterations": args.iterations,
+        "results": results,
+    }
+
+
+def check(report: Dict[str, Any]) -> List[str]:
+    """The tail read must be the same size for every conversation longer than the window"""
+    problems = []
+    full_windows = [result for result in report["results"] if result["messages"] >= report["window"]]
+    if full_windows:
+        expected = full_windows[0]["tail"]["bytes"]
+        for result in full_windows[1:]:
+            if result["tail"]["bytes"] > expected:
+                problems.append(
+                    f"tail read of a {result['messages']}-message conversation is {result['tail']['bytes']} bytes, "
+                    f"expected {expected}"
+                )
+    return problems
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"\nHistory fetch ({report['database']}, window {report['window']}, {report['iterations']} reads each)")
+    for result in report["results"]:
+        print(f"{result['messages']:>7} messages  migrated to buckets in {result['migrate_ms']:.3f}ms")
+        for method in ("full", "tail"):
+            stats = result[method]
+            print(f"{result['messages']:>7} messages  {method:<5} p50 {stats['p50_ms']:>9.3f}ms  "
+                  f"p95 {stats['p95_ms']:>9.3f}ms  {stats['bytes']:>10,} bytes")
+
+
+def main() -> None:
+    args = parse_args()
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    if args.check:
+        problems = check(report)
+        for problem in problems:
+            print(f"FAIL: {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
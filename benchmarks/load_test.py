@@ -0,0 +1,210 @@
+"""
+Load test - Drives the FastAPI app with N concurrent conversations
+
+Runs the app in-process (httpx ASGI transport, lifespan included) with the
+scripted FakeLLM, so the numbers measure our own code: MongoDB, history
+formatting, the agent workflow and the tools. Reports RPS, end-to-end
+latency percentiles and per-stage percentiles.
+
+Usage:
+    python -m benchmarks.load_test --conversations 50 --turns 4
+    python -m benchmarks.load_test --conversations 200 --stream --llm-latency-ms 800
+    python -m benchmarks.load_test --in-memory-db     # mongomock instead of MONGODB_URI
+    python -m benchmarks.load_test --store sqlite     # or memory: no MongoDB at all
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+DEFAULT_QUERIES = [
+    "Best camera phone for my dad",
+    "Tell me about the Galaxy S24",
+    "Compare Galaxy S24 vs Pixel 8a",
+    "Which brands do you have?",
+    "Something with a big battery please",
+]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="End-to-end load test for the chat API")
+    parser.add_argument("--conversations", type=int, default=20, help="Concurrent conversations")
+    parser.add_argument("--turns", type=int, default=3, help="Messages per conversation")
+    parser.add_argument("--stream", action="store_true", help="Use /message/stream instead of /message")
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="FakeLLM delay before each response")
+    parser.add_argument("--token-delay-ms", type=float, default=5, help="FakeLLM delay between streamed chunks")
+    parser.add_argument("--script", default="", help="JSON script for the FakeLLM")
+    parser.add_argument("--in-memory-db", action="store_true", help="Use mongomock instead of MONGODB_URI")
+    parser.add_argument("--store", choices=["mongodb", "sqlite", "memory"], default="mongodb",
+                        help="Conversation store (sqlite uses a temporary database file)")
+    parser.add_argument("--fast-path", action="store_true", help="Leave the rule-based fast path enabled")
+    parser.add_argument("--cache", action="store_true", help="Leave the response cache and single flight enabled")
+    parser.add_argument("--no-rate-limit", action="store_true", help="Disable the per-email message rate limit")
+    parser.add_argument("--log-level", default="WARNING", help="App log level during the run (INFO logs every workflow result)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    return parser.parse_args()
+
+
+def configure_environment(args: argparse.Namespace) -> None:
+    """Settings are read at import time, so this runs before the app is imported"""
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["FAKE_LLM_TOKEN_DELAY_MS"] = str(args.token_delay_ms)
+    os.environ["FAKE_LLM_SCRIPT"] = args.script
+    os.environ["CONVERSATION_STORE_BACKEND"] = args.store
+    if args.store == "sqlite":
+        os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="load_test_"), "conversations.db")
+    if not args.fast_path:
+        os.environ["FAST_PATH_ENABLED"] = "False"
+    if not args.cache:
+        # Every conversation asks the same questions; without this they would
+        # be served from the cache or coalesced instead of running the agent
+        os.environ["RESPONSE_CACHE_BACKEND"] = "none"
+        os.environ["SINGLE_FLIGHT_ENABLED"] = "False"
+    if args.no_rate_limit:
+        os.environ["ADMISSION_RATE_PER_MINUTE"] = "0"
+
+
+def use_in_memory_db() -> None:
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit("--in-memory-db needs the 'mongomock' package from the dev dependencies (uv sync)")
+    from app.db.mongodb import MongoDB
+
+    MongoDB.client = mongomock.MongoClient()
+    MongoDB.db = MongoDB.client["load_test"]
+
+
+async def run_conversation(
+    client: Any,
+    turns: int,
+    stream: bool,
+    offset: int,
+    latencies: List[float],
+    errors: List[str],
+    rejected: List[float]
+) -> None:
+    response = await client.post("/api/v1/conversation/", json={"email": f"load{offset}@example.com"})
+    if response.status_code != 201:
+        errors.append(f"create: {response.status_code}")
+        return
+    conversation_id = response.json()["conversation_id"]
+
+    for turn in range(turns):
+        body = {
+            "conversation_id": conversation_id,
+            "user_message": DEFAULT_QUERIES[(offset + turn) % len(DEFAULT_QUERIES)],
+        }
+        start = time.perf_counter()
+        try:
+            if stream:
+                async with client.stream("POST", "/api/v1/conversation/message/stream", json=body) as response:
+                    if response.status_code == 429:
+                        # Turned away by admission control: counted, not an error
+                        rejected.append(time.perf_counter() - start)
+                        continue
+                    done = False
+                    async for line in response.aiter_lines():
+                        if line == "event: done":
+                            done = True
+                        elif line == "event: error":
+                            errors.append("stream error event")
+                    if response.status_code != 200 or not done:
+                        errors.append(f"stream: {response.status_code}")
+                        continue
+            else:
+                response = await client.post("/api/v1/conversation/message", json=body)
+                if response.status_code == 429:
+                    rejected.append(time.perf_counter() - start)
+                    continue
+                if response.status_code != 200:
+                    errors.append(f"message: {response.status_code}")
+                    continue
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+    from app.main import create_application
+    from app.utils import tracing
+
+    logging.getLogger().setLevel(args.log_level.upper())
+    if args.in_memory_db:
+        use_in_memory_db()
+
+    app = create_application()
+    latencies: List[float] = []
+    errors: List[str] = []
+    rejected: List[float] = []
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=None) as client:
+            # One warm-up request so imports and first-use setup are not measured
+            await run_conversation(client, 1, args.stream, 0, [], [], [])
+            tracing.reset()
+
+            start = time.perf_counter()
+            await asyncio.gather(*[
+                run_conversation(client, args.turns, args.stream, i, latencies, errors, rejected)
+                for i in range(args.conversations)
+            ])
+            elapsed = time.perf_counter() - start
+
+    values = sorted(latencies)
+    return {
+        "conversations": args.conversations,
+        "turns": args.turns,
+        "endpoint": "/message/stream" if args.stream else "/message",
+        "store": args.store,
+        "llm_latency_ms": args.llm_latency_ms,
+        "requests": len(values),
+        "errors": len(errors),
+        "rejected": len(rejected),
+        "error_samples": errors[:5],
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(tracing.percentile(values, 0.50) * 1000, 2),
+            "p95": round(tracing.percentile(values, 0.95) * 1000, 2),
+            "p99": round(tracing.percentile(values, 0.99) * 1000, 2),
+        },
+        "stages": tracing.get_stage_stats(),
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"\n{report['conversations']} conversations x {report['turns']} turns against {report['endpoint']} "
+          f"({report['store']} store, fake LLM latency {report['llm_latency_ms']}ms)")
+    print(f"requests: {report['requests']}  errors: {report['errors']}  rejected (429): {report['rejected']}  "
+          f"elapsed: {report['elapsed_s']}s  RPS: {report['rps']}")
+    latency = report["latency_ms"]
+    print(f"end-to-end    p50 {latency['p50']:>9.2f}ms  p95 {latency['p95']:>9.2f}ms  p99 {latency['p99']:>9.2f}ms")
+    for stage, stats in sorted(report["stages"].items()):
+        print(f"{stage:<14}p50 {stats['p50_ms']:>9.2f}ms  p95 {stats['p95_ms']:>9.2f}ms  "
+              f"p99 {stats['p99_ms']:>9.2f}ms  (n={stats['count']})")
+    for sample in report["error_samples"]:
+        print(f"error: {sample}")
+
+
+def main() -> None:
+    args = parse_args()
+    configure_environment(args)
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
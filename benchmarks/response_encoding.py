@@ -0,0 +1,140 @@
+"""
+Response encoding - Serialization time and bytes on the wire of API responses
+
+Builds typical /conversation/message responses to searches returning 1, 5,
+10 and 20 phones (the product records ride along in output.results), and
+for each compares:
+- JSON encoders: how FastAPI encodes a response model with its default
+  JSONResponse (json), with FastJSONResponse (orjson, when installed) and
+  with Pydantic's dump_json (what newer FastAPI releases do by default).
+  Each includes validating the payload against MessageResponse.
+- Compression: the encoded body as is, gzip at levels 1, 6 and 9, and
+  brotli at qualities 4 and 11 (when the brotli package is installed).
+
+Reports the mean time per response and its size in bytes.
+
+Usage:
+    python -m benchmarks.response_encoding
+    python -m benchmarks.response_encoding --results 10 --iterations 5000 --json
+"""
+import argparse
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List
+
+# Only the catalog is needed; keep settings from requiring a real key
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Serialization time and bytes on the wire of API responses")
+    parser.add_argument("--results", type=int, nargs="+", default=[1, 5, 10, 20], help="Phones per search response")
+    parser.add_argument("--iterations", type=int, default=2000, help="Encodings per measurement")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    return parser.parse_args()
+
+
+def build_response(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """A MessageResponse payload for a search that returned results"""
+    response = (
+        f"Here are {len(results)} phones that match what you asked for. "
+        + "Each has a strong battery, a bright display and a capable camera for the price. " * 6
+    )
+    return {
+        "conversation_id": "6710f4a2c3b1d2e3f4a5b6c7",
+        "timestamp": "2024-01-01T00:00:00-08:00",
+        "response": response,
+        "output": {"success": True, "count": len(results), "results": results},
+        "predicted_sql_query": None,
+        "user_query": "Phones under 30k with a good camera",
+    }
+
+
+def mean_us(encode: Callable[[], Any], iterations: int) -> float:
+    encode()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        encode()
+    return round((time.perf_counter() - start) / iterations * 1e6, 2)
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from fastapi.responses import JSONResponse
+    from pydantic import TypeAdapter
+
+    from app.core.middleware import CompressionMiddleware, brotli
+    from app.core.responses import FastJSONResponse
+    from app.schemas.conversation import MessageResponse
+    from app.services.mobile_data_service import get_mobile_data_service, initialize_mobile_data_service
+    from app.utils.serialization import orjson
+
+    initialize_mobile_data_service()
+    catalog = get_mobile_data_service()
+    adapter = TypeAdapter(MessageResponse)
+    # Instances render on construction; render() alone is what is timed
+    json_response = JSONResponse(None)
+    fast_response = FastJSONResponse(None)
+
+    def as_dict(payload: Dict[str, Any]) -> Any:
+        return adapter.dump_python(adapter.validate_python(payload), mode="json")
+
+    encoders = {
+        "json": lambda payload: json_response.render(as_dict(payload)),
+        "orjson" if orjson is not None else "json (FastJSONResponse, orjson missing)":
+            lambda payload: fast_response.render(as_dict(payload)),
+        "pydantic": lambda payload: adapter.dump_json(adapter.validate_python(payload)),
+    }
+
+    compressors = {"identity": lambda body: body}
+    for level in (1, 6, 9):
+        compressors[f"gzip-{level}"] = CompressionMiddleware(None, gzip_level=level).compress
+    if brotli is not None:
+        for quality in (4, 11):
+            middleware = CompressionMiddleware(None, brotli_quality=quality)
+            compressors[f"br-{quality}"] = lambda body, middleware=middleware: middleware.compress(body, "br")
+    gzip_compressors = {name for name in compressors if name.startswith("gzip")}
+
+    results = []
+    for count in args.results:
+        payload = build_response(catalog.search_mobiles(max_price_inr=200000, limit=count))
+        encoding = {
+            name: {"us": mean_us(lambda: encode(payload), args.iterations), "bytes": len(encode(payload))}
+            for name, encode in encoders.items()
+        }
+        body = encoders["pydantic"](payload)
+        compression = {}
+        for name, compress in compressors.items():
+            if name in gzip_compressors:
+                run_compress = lambda compress=compress: compress(body, "gzip")
+            else:
+                run_compress = lambda compress=compress: compress(body)
+            compression[name] = {"us": mean_us(run_compress, max(args.iterations // 4, 1)), "bytes": len(run_compress())}
+        results.append({"results": count, "encoding": encoding, "compression": compression})
+
+    return {"iterations": args.iterations, "results": results}
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"\nResponse encoding ({report['iterations']} encodings each)")
+    for result in report["results"]:
+        print(f"\n{result['results']} phones")
+        for name, stats in result["encoding"].items():
+            print(f"  encode    {name:<10} {stats['us']:>9.2f}us  {stats['bytes']:>8,} bytes")
+        identity = result["compression"]["identity"]["bytes"]
+        for name, stats in result["compression"].items():
+            ratio = stats["bytes"] / identity
+            print(f"  compress  {name:<10} {stats['us']:>9.2f}us  {stats['bytes']:>8,} bytes  ({ratio:.0%})")
+
+
+def main() -> None:
+    args = parse_args()
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
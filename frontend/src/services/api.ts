@@ -53,14 +53,40 @@ export const createConversation = async (email: string): Promise<ConversationRes
   return response.data
 }
 
+const MAX_SEND_ATTEMPTS = 3
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms))
+
+// One key per message, reused by its retries so the server runs it only once
+const newIdempotencyKey = (): string =>
+  typeof crypto !== 'undefined' && 'randomUUID' in crypto
+    ? crypto.randomUUID()
+    : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`
+
 export const sendMessage = async (
   conversationId: string,
   message: string
 ): Promise<MessageResponse> => {
-  const response = await axios.post<MessageResponse>(`${API_BASE_URL}/conversation/message`, {
-    conversation_id: conversationId,
-    user_message: message,
-  })
-  return response.data
+  const idempotencyKey = newIdempotencyKey()
+  for (let attempt = 1; ; attempt++) {
+    try {
+      const response = await axios.post<MessageResponse>(
+        `${API_BASE_URL}/conversation/message`,
+        {
+          conversation_id: conversationId,
+          user_message: message,
+        },
+        { headers: { 'Idempotency-Key': idempotencyKey } }
+      )
+      return response.data
+    } catch (error) {
+      // Retry network errors only; the server has answered everything else
+      const networkError = axios.isAxiosError(error) && !error.response
+      if (!networkError || attempt >= MAX_SEND_ATTEMPTS) {
+        throw error
+      }
+      await sleep(500 * 2 ** (attempt - 1))
+    }
+  }
 }
 
@@ -1,10 +1,46 @@
+import argparse
+import asyncio
+import time
+
 import uvicorn
 from app.core.config import settings
 
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the Mobile Shopping Chat Agent API")
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Start the app without serving, print import and startup stage timings, and exit"
+    )
+    return parser.parse_args()
+
+
+async def profile_startup() -> None:
+    """Import the app and run its startup and shutdown, timing imports and stages"""
+    from app.utils.startup_profile import startup_profile
+
+    startup_profile.track_imports()
+    started = time.perf_counter()
+    from app.main import app
+    startup_profile.import_seconds = time.perf_counter() - started
+    try:
+        async with app.router.lifespan_context(app):
+            # Imports made during startup (the agent stack) are counted too
+            startup_profile.finish()
+            print(startup_profile.report())
+    finally:
+        startup_profile.finish()
+
+
 if __name__ == "__main__":
-    uvicorn.run(
-        "app.main:app",
-        host=settings.HOST,
-        port=settings.PORT,
-        reload=settings.DEBUG,
-    ) 
\ No newline at end of file
+    args = parse_args()
+    if args.profile_startup:
+        asyncio.run(profile_startup())
+    else:
+        uvicorn.run(
+            "app.main:app",
+            host=settings.HOST,
+            port=settings.PORT,
+            reload=settings.DEBUG,
+        )
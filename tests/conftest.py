@@ -0,0 +1,5 @@
+import os
+
+# The app's settings are read at import; tests never call OpenAI
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("LLM_PROVIDER", "fake")
@@ -0,0 +1,40 @@
+from app.services.conversation_memory import ConversationMemory
+
+
+def _turn(index):
+    return [
+        {"role": "user", "content": f"question {index}"},
+        {"role": "assistant", "content": f"answer {index}."},
+    ]
+
+
+def test_long_conversation_of_short_messages_keeps_every_message():
+    # Short messages fit the tail's token budget long after they leave the
+    # loaded window; they must be summarized before that happens
+    window = 20
+    memory = ConversationMemory(summary_token_budget=10000, max_tail_messages=window - 2)
+    messages = []
+    state = None
+    for index in range(40):
+        prepared = memory.prepare(messages[-window:], state, total_count=len(messages))
+        state = prepared["state"]
+        summarized = state["summarized_count"]
+        # Every message is either in the summary or in the prompt
+        assert summarized >= len(messages) - window
+        assert prepared["recent_messages"] == messages[summarized:]
+        messages.extend(_turn(index))
+
+    summary_lines = state["summary"].split("\n")
+    assert len(summary_lines) == state["summarized_count"]
+    assert summary_lines[:2] == ["user: question 0", "assistant: answer 0."]
+
+
+def test_tail_is_bounded_by_tokens_and_messages():
+    messages = [message for index in range(5) for message in _turn(index)]
+
+    prepared = ConversationMemory(max_tail_messages=4).prepare(messages)
+    assert prepared["recent_messages"] == messages[-4:]
+    assert prepared["state"]["summarized_count"] == 6
+
+    prepared = ConversationMemory(tail_token_budget=3).prepare(messages)
+    assert len(prepared["recent_messages"]) == 1
@@ -0,0 +1,45 @@
+import asyncio
+import importlib
+from datetime import datetime, timezone
+
+import pytest
+
+from app.core.config import settings
+from app.services.conversation_service import ConversationService
+from app.services.conversation_store import InMemoryConversationStore
+from app.services.write_behind import WriteBehindQueue
+
+# app.services re-exports the service singleton under the module's name
+conversation_service_module = importlib.import_module("app.services.conversation_service")
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = InMemoryConversationStore()
+    monkeypatch.setattr(conversation_service_module, "get_conversation_store", lambda: store)
+    return store
+
+
+def test_list_and_history_count_messages_waiting_to_be_written(store, monkeypatch):
+    # A long flush interval keeps the appends in the write-behind queue
+    queue = WriteBehindQueue(store, flush_interval=60)
+    monkeypatch.setattr(conversation_service_module, "write_behind", queue)
+    monkeypatch.setattr(settings, "WRITE_BEHIND_ENABLED", True)
+    service = ConversationService()
+
+    async def scenario():
+        conversation_id = await store.create_conversation("a@example.com", datetime.now(timezone.utc))
+        await store.append(conversation_id, [{"role": "user", "content": "stored"}])
+        start = await store.reserve(conversation_id, 1)
+        await queue.enqueue(conversation_id, [{"role": "assistant", "content": "reserved"}], start=start)
+        await queue.enqueue(conversation_id, [{"role": "user", "content": "queued"}])
+
+        listed = await service.list_conversations("a@example.com", limit=10)
+        history = await service.get_messages(conversation_id, limit=10)
+        await queue.close()
+        return listed, history
+
+    listed, history = asyncio.run(scenario())
+    assert history["message_count"] == 3
+    assert [message["content"] for message in history["messages"]] == ["stored", "reserved", "queued"]
+    assert [conversation["message_count"] for conversation in listed["conversations"]] == [3]
@@ -0,0 +1,134 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.db.mongodb import MongoDB
+from app.services.conversation_store import ConversationStore, InMemoryConversationStore
+from app.services.message_store import MessageStore
+from app.services.sqlite_store import SQLiteConversationStore
+
+START = datetime(2026, 1, 5, 10, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture(params=["memory", "sqlite", "mongodb"])
+def run(request, tmp_path, monkeypatch):
+    """Run a scenario against a fresh, open store of each backend"""
+    if request.param == "mongodb":
+        # An in-memory MongoDB, as in the benchmarks
+        mongomock = pytest.importorskip("mongomock")
+        monkeypatch.setattr(MongoDB, "client", mongomock.MongoClient())
+        monkeypatch.setattr(MongoDB, "db", MongoDB.client["test"])
+        monkeypatch.setattr(MongoDB, "async_db", None)
+
+    def build() -> ConversationStore:
+        if request.param == "sqlite":
+            return SQLiteConversationStore(str(tmp_path / "conversations.db"))
+        if request.param == "mongodb":
+            # Small buckets, so pages span several of them
+            return MessageStore(bucket_size=2)
+        return InMemoryConversationStore()
+
+    def run_scenario(scenario):
+        async def main():
+            store = build()
+            await store.open()
+            try:
+                return await scenario(store)
+            finally:
+                await store.close()
+        return asyncio.run(main())
+    return run_scenario
+
+
+def _messages(*contents):
+    return [{"role": "user", "content": content} for content in contents]
+
+
+def test_store_interface_is_abstract():
+    with pytest.raises(TypeError):
+        ConversationStore()
+
+
+def test_create_and_append(run):
+    async def scenario(store):
+        conversation_id = await store.create_conversation("a@example.com", START)
+        empty = await store.load_recent(conversation_id, 10)
+        await store.append(conversation_id, _messages("m0", "m1"))
+        await store.append(conversation_id, _messages("m2"), memory={"summary": "s", "summarized_count": 1})
+        return empty, await store.load_recent(conversation_id, 2), await store.load_recent("0" * 24, 2)
+
+    empty, recent, missing = run(scenario)
+    assert empty["email"] == "a@example.com"
+    assert empty["message_count"] == 0
+    assert empty["messages"] == []
+    assert recent["message_count"] == 3
+    assert [(message["position"], message["content"]) for message in recent["messages"]] == [(1, "m1"), (2, "m2")]
+    assert recent["memory"] == {"summary": "s", "summarized_count": 1}
+    assert missing is None
+
+
+def test_reserve_checks_the_expected_count(run):
+    async def scenario(store):
+        conversation_id = await store.create_conversation("a@example.com", START)
+        first = await store.reserve(conversation_id, 2)
+        stale = await store.reserve(conversation_id, 1, expected_count=0)
+        current = await store.reserve(conversation_id, 1, expected_count=2)
+        missing = await store.reserve("0" * 24, 1, expected_count=0)
+        with pytest.raises(ValueError):
+            await store.reserve("0" * 24, 1)
+        # A retried write stores the messages once
+        batch = [(conversation_id, store.positioned(_messages("a", "b", "c"), first))]
+        await store.write_messages(batch)
+        await store.write_messages(batch)
+        return first, stale, current, missing, await store.load_messages(conversation_id, 10)
+
+    first, stale, current, missing, page = run(scenario)
+    assert (first, stale, current, missing) == (0, None, 2, None)
+    assert page["message_count"] == 3
+    assert [message["content"] for message in page["messages"]] == ["a", "b", "c"]
+
+
+def test_list_conversations_pages_newest_first(run):
+    async def scenario(store):
+        created = []
+        for index in range(5):
+            conversation_id = await store.create_conversation("a@example.com", START + timedelta(minutes=index))
+            await store.append(conversation_id, _messages(*[str(n) for n in range(index + 1)]))
+            created.append(conversation_id)
+        await store.create_conversation("b@example.com", START)
+
+        pages = []
+        after = None
+        while True:
+            page = await store.list_conversations("a@example.com", 2, after)
+            if not page:
+                break
+            pages.append(page)
+            after = (page[-1]["created_at"], page[-1]["conversation_id"])
+        return created, pages
+
+    created, pages = run(scenario)
+    assert [len(page) for page in pages] == [2, 2, 1]
+    listed = [conversation for page in pages for conversation in page]
+    assert [conversation["conversation_id"] for conversation in listed] == created[::-1]
+    assert [conversation["message_count"] for conversation in listed] == [5, 4, 3, 2, 1]
+    assert all(conversation["email"] == "a@example.com" for conversation in listed)
+    assert listed[0]["created_at"] == START + timedelta(minutes=4)
+
+
+def test_load_messages_pages_back_by_position(run):
+    async def scenario(store):
+        conversation_id = await store.create_conversation("a@example.com", START)
+        await store.append(conversation_id, _messages(*[f"m{n}" for n in range(7)]))
+        pages = []
+        before = None
+        while before != 0:
+            page = await store.load_messages(conversation_id, 3, before)
+            pages.append([message["position"] for message in page["messages"]])
+            before = page["messages"][0]["position"]
+        return pages, await store.load_messages("0" * 24, 3)
+
+    pages, missing = run(scenario)
+    assert pages == [[4, 5, 6], [1, 2, 3], [0]]
+    assert missing is None
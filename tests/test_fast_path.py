@@ -0,0 +1,42 @@
+import pytest
+
+from app.Chat_Workflow.fast_path import FastPathRouter
+from app.utils.chat_utils import normalize_query
+
+
+@pytest.fixture
+def router():
+    return FastPathRouter()
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("Samsung phones under ₹20,000?", "samsung phones under 20000"),
+    ("Samsung under 1.5 lakh.", "samsung under 1.5 lakh"),
+    ("Phones under Rs. 12.5k!", "phones under 12.5k"),
+    ("Galaxy S24. Specs", "galaxy s24 specs"),
+])
+def test_normalize_query_keeps_decimal_points(query, expected):
+    assert normalize_query(query) == expected
+
+
+def test_search_in_lakh_with_decimal(router):
+    route = router.parse("Samsung under 1.5 lakh")
+    assert route == {
+        "intent": "search",
+        "tool_name": "search_mobile_phones",
+        "tool_kwargs": {"max_price_inr": 150000, "brand": "Samsung"},
+    }
+
+
+def test_search_in_thousands_with_decimal(router):
+    route = router.parse("Android phones under 12.5k")
+    assert route["tool_kwargs"] == {"max_price_inr": 12500, "exclude_apple": True}
+
+
+def test_price_range_with_decimals(router):
+    route = router.parse("phones between 1.2 lakh and 1.5 lakh")
+    assert route["tool_kwargs"] == {"min_price_inr": 120000, "max_price_inr": 150000}
+
+
+def test_search_follow_up_goes_to_agent(router):
+    assert router.parse("ones under 1.5 lakh", has_history=True) is None
@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services.idempotency import IdempotencyConflict, IdempotencyStore, max_request_seconds
+from app.services.response_cache import InMemoryCacheBackend
+
+
+def test_run_outlasting_wait_is_not_run_twice():
+    # Two workers sharing one store: the second one's retries must never
+    # re-run a message whose first run takes longer than wait_seconds
+    backend = InMemoryCacheBackend()
+    first = IdempotencyStore(backend, wait_seconds=0.2, pending_ttl_seconds=5, poll_interval=0.01)
+    second = IdempotencyStore(backend, wait_seconds=0.2, pending_ttl_seconds=5, poll_interval=0.01)
+    fingerprint = IdempotencyStore.fingerprint("conversation", "hello")
+    runs = []
+
+    async def slow_turn():
+        runs.append(1)
+        await asyncio.sleep(1.5)
+        return {"response": "hi"}
+
+    async def scenario():
+        running = asyncio.create_task(first.run("key", fingerprint, slow_turn))
+        # Past both wait_seconds and the old one-second pending mark
+        await asyncio.sleep(1.2)
+        with pytest.raises(IdempotencyConflict) as conflict:
+            await second.run("key", fingerprint, slow_turn)
+        assert conflict.value.reason == "in_progress"
+
+        assert await running == ({"response": "hi"}, False)
+        assert await second.run("key", fingerprint, slow_turn) == ({"response": "hi"}, True)
+
+    asyncio.run(scenario())
+    assert len(runs) == 1
+
+
+def test_default_pending_ttl_covers_the_longest_request():
+    assert max_request_seconds() > settings.ADMISSION_QUEUE_TIMEOUT_SECONDS + settings.AGENT_TIMEOUT_MAX_SECONDS
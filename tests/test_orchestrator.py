@@ -0,0 +1,42 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.Chat_Workflow import orchestrator
+from app.core.config import settings
+
+
+def test_coalesced_callers_get_their_own_result(monkeypatch):
+    runs = []
+
+    async def run_workflow(agent, payload, tool_results=None):
+        runs.append(payload["user_message"])
+        await asyncio.sleep(0.01)
+        search = {"success": True, "results": [{"model": "Galaxy S24", "price_inr": 79999}]}
+        return {
+            "response": "Here is one phone",
+            "tool_calls": [{"tool_name": "search_mobile_phones", "tool_kwargs": {"brand": "Samsung"}, "tool_output": search}],
+            "output": search,
+            "user_query": payload["user_message"],
+        }
+
+    monkeypatch.setattr(settings, "SINGLE_FLIGHT_ENABLED", True)
+    monkeypatch.setattr(orchestrator, "_run_workflow", run_workflow)
+    monkeypatch.setattr(orchestrator, "get_mobile_data_service", lambda: SimpleNamespace(version="v1"))
+
+    async def scenario():
+        return await asyncio.gather(*[
+            orchestrator.execute_mobile_shopping_workflow(None, {"user_message": message, "conversation_history": []})
+            for message in ("Samsung phones", "samsung phones?")
+        ])
+
+    first, second = asyncio.run(scenario())
+    assert runs == ["Samsung phones"]
+    assert (first["user_query"], second["user_query"]) == ("Samsung phones", "samsung phones?")
+
+    # One caller building its response must not change the other's
+    first["tool_calls"][0]["tool_output"]["results"].append({"model": "Pixel 8a"})
+    first["tool_calls"].clear()
+    assert len(second["tool_calls"]) == 1
+    assert second["output"]["results"] == [{"model": "Galaxy S24", "price_inr": 79999}]
+    # Within one copy, output still refers to the tool's output
+    assert second["output"] is second["tool_calls"][0]["tool_output"]
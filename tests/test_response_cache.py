@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+from app.services.response_cache import InMemoryCacheBackend, LocalRedis, RedisCacheBackend, ResponseCache
+from app.utils.serialization import dumps
+
+ANSWER = {"response": "Here are 3 phones", "tool_calls": [{"tool_name": "search_mobile_phones"}]}
+
+
+@pytest.fixture(params=["memory", "local_redis"])
+def cache(request):
+    if request.param == "local_redis":
+        return ResponseCache(RedisCacheBackend(LocalRedis()))
+    return ResponseCache(InMemoryCacheBackend())
+
+
+@pytest.mark.parametrize("stored", [
+    dumps(ANSWER)[:-7],
+    "\x00\x01 not json",
+    dumps(["a", "list"]),
+    dumps({"response": "no tool calls"}),
+])
+def test_unreadable_entry_is_a_miss_and_is_dropped(cache, stored):
+    async def scenario():
+        key = cache.make_key("samsung under 20k", "v1")
+        await cache.backend.set(key, stored, 60)
+        missed = await cache.get("samsung under 20k", "v1")
+        left = await cache.backend.get(key)
+        await cache.set("samsung under 20k", "v1", ANSWER)
+        return missed, left, await cache.get("samsung under 20k", "v1")
+
+    missed, left, hit = asyncio.run(scenario())
+    assert missed is None
+    assert left is None
+    assert hit == ANSWER
+    assert cache.stats["misses"] == 1
+    assert cache.stats["hits"] == 1
+    assert cache.stats["errors"] == 1
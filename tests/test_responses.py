@@ -0,0 +1,53 @@
+from datetime import datetime, timezone
+
+import fastapi
+import pytest
+from fastapi import FastAPI
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from app.core.responses import FastJSONResponse, default_response_class, fastapi_version
+
+
+def test_app_uses_the_class_its_fastapi_version_supports():
+    from app.main import app
+
+    active = app.router.default_response_class
+    if fastapi_version() >= (0, 130, 0):
+        # Left unset, so routes with a response model use Pydantic's dump_json
+        assert isinstance(active, DefaultPlaceholder)
+        assert active.value is JSONResponse
+    else:
+        assert active is FastJSONResponse
+
+
+@pytest.mark.parametrize("version, expected", [
+    ("0.117.1", FastJSONResponse),
+    ("0.129.2", FastJSONResponse),
+    ("0.130.0", JSONResponse),
+    ("1.0.0rc1", JSONResponse),
+])
+def test_auto_picks_by_fastapi_version(monkeypatch, version, expected):
+    monkeypatch.setattr(fastapi, "__version__", version)
+    chosen = default_response_class("auto")
+    assert getattr(chosen, "value", chosen) is expected
+
+
+def test_encoder_can_be_forced():
+    assert default_response_class("orjson") is FastJSONResponse
+    assert isinstance(default_response_class("PYDANTIC"), DefaultPlaceholder)
+    with pytest.raises(ValueError):
+        default_response_class("ujson")
+
+
+def test_fast_json_response_encodes_like_json_response():
+    application = FastAPI(default_response_class=FastJSONResponse)
+
+    @application.get("/phone")
+    def phone():
+        return {"model": "Galaxy S24", "price_inr": 79999.5, "seen": datetime(2024, 1, 17, tzinfo=timezone.utc), "tags": ["5G", "₹"]}
+
+    response = TestClient(application).get("/phone")
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == {"model": "Galaxy S24", "price_inr": 79999.5, "seen": "2024-01-17T00:00:00+00:00", "tags": ["5G", "₹"]}
@@ -0,0 +1,77 @@
+import asyncio
+import importlib
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.services.conversation_store import InMemoryConversationStore
+from app.services.retention import RetentionJob, decode_archive
+from app.services.write_behind import WriteBehindQueue
+
+retention_module = importlib.import_module("app.services.retention")
+
+# Far enough ahead that every conversation created now is idle
+LATER = datetime.now(timezone.utc) + timedelta(days=400)
+
+
+class ReservingStore(InMemoryConversationStore):
+    """Another worker reserves a position right before the conversation is exported"""
+
+    async def export_conversation(self, conversation_id):
+        await self.reserve(conversation_id, 1)
+        return await super().export_conversation(conversation_id)
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    queue = None
+
+    def attach(store):
+        nonlocal queue
+        # Nothing is flushed on its own for a minute
+        queue = WriteBehindQueue(store, flush_interval=60)
+        monkeypatch.setattr(retention_module, "write_behind", queue)
+        return queue
+    return attach
+
+
+def _messages(*contents):
+    return [{"role": "user", "content": content} for content in contents]
+
+
+def test_conversation_with_queued_messages_is_archived_once_they_are_written(queue):
+    async def scenario():
+        store = InMemoryConversationStore()
+        pending = queue(store)
+        job = RetentionJob(store, idle_days=180)
+        conversation_id = await store.create_conversation("a@example.com", datetime.now(timezone.utc))
+        await store.append(conversation_id, _messages("stored"))
+        await pending.enqueue(conversation_id, _messages("queued"))
+
+        first = await job.run_once(LATER)
+        still_live = await store.load_recent(conversation_id, 10)
+        await pending.close()
+        second = await job.run_once(LATER)
+        return first, still_live, second, store._archive[conversation_id]
+
+    first, still_live, second, record = asyncio.run(scenario())
+    assert (first["archived"], first["skipped"]) == (0, 1)
+    assert still_live is not None
+    assert second["archived"] == 1
+    assert [message["content"] for message in decode_archive(record)["messages"]] == ["stored", "queued"]
+
+
+def test_conversation_reserved_after_it_was_found_idle_stays_live(queue):
+    async def scenario():
+        store = ReservingStore()
+        queue(store)
+        conversation_id = await store.create_conversation("a@example.com", datetime(2025, 1, 1, tzinfo=timezone.utc))
+        await store.append(conversation_id, _messages("stored"))
+        # Last appended to long ago
+        store._conversations[conversation_id]["updated_at"] = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        run = await RetentionJob(store, idle_days=180).run_once()
+        return run, await store.load_recent(conversation_id, 10)
+
+    run, conversation = asyncio.run(scenario())
+    assert (run["archived"], run["skipped"]) == (0, 1)
+    assert conversation["message_count"] == 2
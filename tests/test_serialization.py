@@ -0,0 +1,113 @@
+import warnings
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, List, Optional
+
+import pytest
+from llama_index.core.tools import FunctionTool, ToolOutput
+from pydantic import BaseModel
+
+from app.utils.serialization import to_serializable
+
+
+def _serialize_recursively(data: Any) -> Any:
+    """The serializer to_serializable replaced (orchestrator.py before the type dispatch)"""
+    if data is None or isinstance(data, (str, int, float, bool)):
+        return data
+    if isinstance(data, dict):
+        return {key: _serialize_recursively(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [_serialize_recursively(item) for item in data]
+    if hasattr(data, 'dict'):
+        try:
+            return _serialize_recursively(data.dict())
+        except Exception:
+            pass
+    if hasattr(data, 'to_dict'):
+        try:
+            return _serialize_recursively(data.to_dict())
+        except Exception:
+            pass
+    return str(data)
+
+
+class Spec(BaseModel):
+    name: str
+    released: datetime
+    tags: List[str] = []
+
+
+class Phone(BaseModel):
+    model: str
+    price_inr: Optional[float] = None
+    spec: Spec
+    variants: List[Spec] = []
+
+
+class Record:
+    def to_dict(self):
+        return {"model": "Pixel 8a", "seen": datetime(2024, 5, 1, tzinfo=timezone.utc)}
+
+
+class BrokenDict:
+    def dict(self):
+        raise RuntimeError("not a model")
+
+    def __str__(self):
+        return "broken"
+
+
+def _lookup(model_name: str) -> str:
+    return model_name
+
+
+RELEASED = datetime(2024, 1, 17, 9, 30, tzinfo=timezone.utc)
+SPEC = Spec(name="Galaxy S24", released=RELEASED, tags=["5G"])
+PHONE = Phone(model="Galaxy S24", price_inr=79999.0, spec=SPEC, variants=[SPEC])
+SEARCH_OUTPUT = {
+    "success": True,
+    "count": 2,
+    "results": [
+        {"model": "Galaxy S24", "price_inr": 79999, "ram_gb": 8.0, "features": ["OIS", "IP68"]},
+        {"model": "Pixel 8a", "price_inr": 52999, "ram_gb": 8.0, "features": []},
+    ],
+    "data_source": "JSON",
+}
+
+
+@pytest.mark.parametrize("data", [
+    None,
+    "text",
+    42,
+    1.5,
+    False,
+    RELEASED,
+    SPEC,
+    PHONE,
+    [PHONE, {"spec": SPEC}],
+    ("tuple", RELEASED, [1, (2, 3)]),
+    {"nested": {"deeper": [{"at": RELEASED}, None, 3]}, "keep": "as is"},
+    OrderedDict(first=SPEC, second=[RELEASED]),
+    {1: "int key", None: {"set": {1}}},
+    Record(),
+    BrokenDict(),
+    FunctionTool.from_defaults(fn=_lookup, name="lookup"),
+    SEARCH_OUTPUT,
+    ToolOutput(content="2 phones", tool_name="search_mobile_phones", raw_input={"kwargs": {"brand": "Samsung"}}, raw_output=SEARCH_OUTPUT),
+    {"tool_name": "get_mobile_details", "tool_kwargs": {"model_name": "Galaxy S24"}, "tool_output": ToolOutput(
+        content="Galaxy S24", tool_name="get_mobile_details", raw_input={}, raw_output={"success": True, "result": PHONE}
+    )},
+])
+def test_matches_the_recursive_serializer(data):
+    with warnings.catch_warnings():
+        # The old serializer called the deprecated BaseModel.dict()
+        warnings.simplefilter("ignore", DeprecationWarning)
+        expected = _serialize_recursively(data)
+    assert to_serializable(data) == expected
+
+
+def test_plain_json_is_not_copied():
+    assert to_serializable(SEARCH_OUTPUT) is SEARCH_OUTPUT
+    converted = to_serializable({"plain": SEARCH_OUTPUT["results"], "at": RELEASED})
+    assert converted["plain"] is SEARCH_OUTPUT["results"]
+    assert converted["at"] == str(RELEASED)
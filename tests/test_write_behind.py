@@ -0,0 +1,132 @@
+import asyncio
+import random
+from datetime import datetime, timezone
+
+from app.services.conversation_store import InMemoryConversationStore
+from app.services.write_behind import WriteBehindQueue
+
+
+class FlakyStore(InMemoryConversationStore):
+    """Fails the next reservations and message writes it is told to"""
+
+    def __init__(self):
+        super().__init__()
+        self.failing_reserves = 0
+        self.failing_writes = 0
+
+    async def reserve(self, conversation_id, count, memory=None, expected_count=None):
+        if self.failing_reserves:
+            self.failing_reserves -= 1
+            raise ConnectionError("reserve failed")
+        return await super().reserve(conversation_id, count, memory, expected_count)
+
+    async def write_messages(self, batch):
+        if self.failing_writes:
+            self.failing_writes -= 1
+            # Part of the batch lands before the failure
+            await super().write_messages(batch[:1])
+            raise ConnectionError("write failed")
+        await super().write_messages(batch)
+
+
+async def _conversation(store):
+    return await store.create_conversation("a@example.com", datetime.now(timezone.utc))
+
+
+async def _stored(store, conversation_id):
+    conversation = await store.export_conversation(conversation_id)
+    return [(message["position"], message["content"]) for message in conversation["messages"]]
+
+
+def _message(content):
+    return [{"role": "user", "content": content}]
+
+
+def test_keeps_each_conversations_messages_in_order():
+    async def scenario():
+        store = InMemoryConversationStore()
+        queue = WriteBehindQueue(store, flush_interval=0.001, max_pending_messages=7)
+        conversation_ids = [await _conversation(store) for _ in range(5)]
+
+        async def talk(conversation_id):
+            for turn in range(12):
+                await queue.enqueue(conversation_id, _message(str(turn)))
+                # Reads include what is still queued
+                recent = await queue.load_recent(conversation_id, 4)
+                assert recent["message_count"] == turn + 1
+                assert [message["content"] for message in recent["messages"]][-1] == str(turn)
+                await asyncio.sleep(random.random() * 0.003)
+
+        await asyncio.gather(*[talk(conversation_id) for conversation_id in conversation_ids])
+        await queue.close()
+        return store, conversation_ids, queue.get_stats()
+
+    store, conversation_ids, stats = asyncio.run(scenario())
+    for conversation_id in conversation_ids:
+        assert asyncio.run(_stored(store, conversation_id)) == [(turn, str(turn)) for turn in range(12)]
+    assert stats["written"] == 60
+    assert stats["pending_messages"] == 0
+
+
+def test_retries_failed_writes_without_losing_or_reordering_messages():
+    async def scenario():
+        store = FlakyStore()
+        queue = WriteBehindQueue(store, flush_interval=0.001, max_retries=5, max_backoff=0.01)
+        conversation_id = await _conversation(store)
+        store.failing_reserves = 1
+        store.failing_writes = 2
+        for turn in range(6):
+            await queue.enqueue(conversation_id, _message(str(turn)))
+            await asyncio.sleep(0.002)
+        await queue.flush()
+        return await _stored(store, conversation_id), queue.get_stats(), store
+
+    stored, stats, store = asyncio.run(scenario())
+    assert store.failing_reserves == store.failing_writes == 0
+    assert stored == [(turn, str(turn)) for turn in range(6)]
+    assert stats["retried"] > 0
+    assert stats["dropped"] == 0
+    assert stats["written"] == 6
+
+
+def test_drops_messages_after_the_last_retry():
+    async def scenario():
+        store = FlakyStore()
+        queue = WriteBehindQueue(store, flush_interval=0.001, max_retries=2, max_backoff=0.01)
+        conversation_id = await _conversation(store)
+        other_id = await _conversation(store)
+        store.failing_reserves = 3
+        await queue.enqueue(conversation_id, _message("lost"))
+        await queue.flush()
+        # A missing conversation is dropped at once; other conversations are unaffected
+        await queue.enqueue("0" * 24, _message("orphan"))
+        await queue.enqueue(other_id, _message("kept"))
+        await queue.flush()
+        return await _stored(store, conversation_id), await _stored(store, other_id), queue.get_stats()
+
+    lost, kept, stats = asyncio.run(scenario())
+    assert lost == []
+    assert kept == [(0, "kept")]
+    assert stats["dropped"] == 2
+    assert stats["written"] == 1
+    assert stats["pending_messages"] == 0
+
+
+def test_close_writes_everything_still_queued():
+    async def scenario():
+        store = InMemoryConversationStore()
+        # Nothing would be flushed for a minute without close()
+        queue = WriteBehindQueue(store, flush_interval=60)
+        conversation_id = await _conversation(store)
+        start = await store.reserve(conversation_id, 1)
+        await queue.enqueue(conversation_id, _message("reserved"), start=start)
+        await queue.enqueue(conversation_id, _message("queued"), memory={"summary": "s", "summarized_count": 0})
+        assert await _stored(store, conversation_id) == []
+        await queue.close()
+        conversation = await store.export_conversation(conversation_id)
+        return await _stored(store, conversation_id), conversation["memory"], queue.get_stats()
+
+    stored, memory, stats = asyncio.run(scenario())
+    assert stored == [(0, "reserved"), (1, "queued")]
+    assert memory == {"summary": "s", "summarized_count": 0}
+    assert stats["pending_messages"] == 0